@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import CompanyProfile, Customer, Invoice, InvoiceItem
+from .exports import CUSTOMERS
 
 @admin.register(CompanyProfile)
 class CompanyProfileAdmin(admin.ModelAdmin):
@@ -11,6 +12,7 @@ class CustomerAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'phone', 'gst_number', 'created_at']
     list_filter = ['created_at']
     search_fields = ['name', 'email', 'phone']
+    actions = [CUSTOMERS.admin_action('csv'), CUSTOMERS.admin_action('xlsx')]
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
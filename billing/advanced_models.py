@@ -7,6 +7,8 @@ from datetime import timedelta
 import uuid
 import json
 
+from .numbering import MAX_PREFIX_LENGTH
+
 class AdvancedCompanyProfile(models.Model):
     """Advanced company profile with multiple locations"""
     name = models.CharField(max_length=200, default="King Dupatta House")
@@ -26,7 +28,10 @@ class AdvancedCompanyProfile(models.Model):
     # Additional settings
     currency = models.CharField(max_length=3, default="INR")
     timezone = models.CharField(max_length=50, default="Asia/Kolkata")
-    invoice_prefix = models.CharField(max_length=10, default="INV")
+    # Each company numbers its own series, but invoice numbers are unique across companies
+    invoice_prefix = models.CharField(max_length=MAX_PREFIX_LENGTH, default="INV", unique=True, error_messages={
+        'unique': 'Another company already uses this invoice prefix.',
+    })
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -37,10 +42,34 @@ class AdvancedCompanyProfile(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .numbering import prefix_error
+
+        error = prefix_error(self.invoice_prefix)
+        if error:
+            raise ValidationError({'invoice_prefix': error})
+
     @property
     def full_address(self):
         return f"{self.address}\nPhone: {self.phone}\nEmail: {self.email}"
 
+class InvoiceNumberCounter(models.Model):
+    """Next invoice number per company, prefix and financial year (see billing/numbering.py)"""
+    company = models.ForeignKey(AdvancedCompanyProfile, on_delete=models.CASCADE, related_name='invoice_counters')
+    prefix = models.CharField(max_length=10)
+    financial_year = models.PositiveIntegerField(help_text="Starting year, e.g. 2025 for FY 2025-26")
+    next_value = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Invoice Number Counter"
+        verbose_name_plural = "Invoice Number Counters"
+        unique_together = ['company', 'prefix', 'financial_year']
+
+    def __str__(self):
+        return f"{self.company} {self.prefix} FY {self.financial_year}-{(self.financial_year + 1) % 100:02d}: next {self.next_value}"
+
 class AdvancedCustomer(models.Model):
     """Advanced customer with detailed information"""
     CUSTOMER_TYPE_CHOICES = [
@@ -159,49 +188,32 @@ class AdvancedInvoice(models.Model):
         return f"Invoice #{self.invoice_number} - {self.customer.name}"
 
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            self.invoice_number = self.generate_invoice_number()
-        
-        # Calculate amounts
-        self.calculate_amounts()
-        super().save(*args, **kwargs)
+        from django.db import transaction
+
+        # The number is taken in the same transaction as the insert, so a failed save leaves no gap
+        with transaction.atomic():
+            if not self.invoice_number:
+                self.invoice_number = self.generate_invoice_number()
+            
+            # Calculate amounts
+            self.calculate_amounts()
+            super().save(*args, **kwargs)
 
     def generate_invoice_number(self):
-        """Generate unique invoice number"""
-        company = self.company
-        prefix = company.invoice_prefix
-        last_invoice = AdvancedInvoice.objects.filter(
-            invoice_number__startswith=prefix
-        ).order_by('-id').first()
-        
-        if last_invoice:
-            try:
-                last_num = int(last_invoice.invoice_number.split(prefix)[-1])
-                return f"{prefix}{last_num + 1:04d}"
-            except:
-                return f"{prefix}0001"
-        return f"{prefix}0001"
+        """Next number from the company's counter for this prefix and financial year"""
+        from .numbering import next_invoice_number
+        return next_invoice_number(self.company, self.date)
 
     def calculate_amounts(self):
         """Calculate all financial amounts"""
-        from decimal import Decimal
-        
-        # Only calculate if invoice has a primary key
+        from .invoices import header_amounts
+
+        # Only calculate if invoice has a primary key; new invoices get their totals from InvoiceBuilder
         if self.pk:
-            # Calculate subtotal from items
-            self.subtotal = sum(item.total_price for item in self.items.all())
-            
-            # Calculate discount
-            self.discount_amount = (self.subtotal * self.discount_percentage) / Decimal('100')
-            
-            # Calculate taxable amount
-            taxable_amount = self.subtotal - self.discount_amount
-            
-            # Calculate tax
-            self.tax_amount = (taxable_amount * self.tax_rate) / Decimal('100')
-            
-            # Calculate total
-            self.total_amount = taxable_amount + self.tax_amount
+            # Line totals are summed in the database, one query however many items there are
+            subtotal = self.items.aggregate(total=models.Sum('total_price'))['total'] or Decimal('0')
+            for name, value in header_amounts(subtotal, self.discount_percentage, self.tax_rate).items():
+                setattr(self, name, value)
 
     @property
     def is_overdue(self):
@@ -284,22 +296,40 @@ class AdvancedInvoiceItem(models.Model):
 
     def calculate_amounts(self):
         """Calculate all amounts for this item"""
-        from decimal import Decimal
-        
-        # Calculate subtotal
-        self.subtotal = self.quantity * self.unit_price
-        
-        # Calculate discount
-        self.discount_amount = (self.subtotal * self.discount_percentage) / Decimal('100')
-        
-        # Calculate taxable amount
-        taxable_amount = self.subtotal - self.discount_amount
-        
-        # Calculate tax
-        self.tax_amount = (taxable_amount * self.tax_rate) / Decimal('100')
-        
-        # Calculate total
-        self.total_price = taxable_amount + self.tax_amount
+        from .invoices import line_amounts
+
+        amounts = line_amounts(self.quantity, self.unit_price, self.discount_percentage, self.tax_rate)
+        for name, value in amounts.items():
+            setattr(self, name, value)
+
+class RevenueRollup(models.Model):
+    """Paid revenue, invoice counts and outstanding amounts per customer and day/month (see billing/rollups.py)"""
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    customer = models.ForeignKey(AdvancedCustomer, on_delete=models.CASCADE, related_name='revenue_rollups')
+
+    # Invoices dated in the period
+    invoice_count = models.IntegerField(default=0)
+    outstanding_count = models.IntegerField(default=0)
+    outstanding_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    # Invoices paid in the period
+    paid_count = models.IntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Revenue Rollup"
+        verbose_name_plural = "Revenue Rollups"
+        unique_together = ['period', 'period_start', 'customer']
+        indexes = [models.Index(fields=['period', 'period_start'])]
+
+    def __str__(self):
+        return f"{self.get_period_display()} {self.period_start} - {self.customer}: ₹{self.paid_revenue}"
 
 class PaymentRecord(models.Model):
     """Track payments for invoices"""
@@ -19,8 +19,11 @@ urlpatterns = [
     # Invoice Management
     path('invoices/', advanced_views.advanced_invoice_list, name='advanced_invoice_list'),
     path('invoices/create/', advanced_views.advanced_invoice_create, name='advanced_invoice_create'),
+    path('invoices/export.<str:file_format>', advanced_views.advanced_invoice_export, name='advanced_invoice_export'),
+    path('invoices/pdfs.zip', advanced_views.advanced_invoice_pdf_zip, name='advanced_invoice_pdf_zip'),
     path('invoices/<uuid:invoice_id>/', advanced_views.advanced_invoice_detail, name='advanced_invoice_detail'),
     path('invoices/<uuid:invoice_id>/print/', advanced_views.advanced_invoice_print, name='advanced_invoice_print'),
+    path('invoices/<uuid:invoice_id>/pdf/', advanced_views.advanced_invoice_pdf, name='advanced_invoice_pdf'),
     # path('invoices/<uuid:invoice_id>/mark-paid/', advanced_views.mark_invoice_paid, name='mark_invoice_paid'),
     
     # Analytics
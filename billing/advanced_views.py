@@ -1,11 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse, HttpResponse, Http404
 from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Sum, Count, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import datetime, timedelta
 import json
 import uuid
@@ -16,6 +18,11 @@ from .advanced_models import (
     AdvancedInvoiceItem, PaymentRecord, InvoiceTemplate
 )
 from .decorators import superuser_required_with_login
+from shop.exports import FORMATS
+from .exports import INVOICES
+from .invoices import InvoiceBuilder
+from .numbering import InvoiceNumberError
+from . import analytics, pdf, rollups
 
 @superuser_required_with_login
 def advanced_dashboard(request):
@@ -23,45 +30,27 @@ def advanced_dashboard(request):
     # Get company profile
     company = AdvancedCompanyProfile.objects.get_or_create(id=1)[0]
     
-    # Analytics data
-    total_invoices = AdvancedInvoice.objects.count()
-    paid_invoices = AdvancedInvoice.objects.filter(status='paid').count()
+    # Counts and amounts come from the precomputed revenue rollups (billing/rollups.py)
+    totals = rollups.totals()
+    total_invoices = totals['invoice_count']
+    paid_invoices = totals['paid_count']
+    total_revenue = totals['paid_revenue']
+    pending_amount = totals['outstanding_amount']
+    
+    # Overdue depends on today's date, so it is counted live
     overdue_invoices = AdvancedInvoice.objects.filter(
         status__in=['sent', 'viewed'], 
         due_date__lt=timezone.now().date()
     ).count()
     
-    # Financial analytics
-    total_revenue = AdvancedInvoice.objects.filter(status='paid').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    pending_amount = AdvancedInvoice.objects.filter(
-        status__in=['sent', 'viewed']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
     # Recent activity
     recent_invoices = AdvancedInvoice.objects.select_related('customer').order_by('-created_at')[:10]
     
-    # Monthly revenue (last 6 months)
-    six_months_ago = timezone.now().date() - timedelta(days=180)
-    monthly_data = []
-    for i in range(6):
-        month_start = six_months_ago + timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        revenue = AdvancedInvoice.objects.filter(
-            status='paid',
-            paid_date__date__range=[month_start, month_end]
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'revenue': float(revenue)
-        })
+    # Monthly revenue (last 6 calendar months)
+    monthly_data = rollups.monthly_revenue(months=6)
     
     # Top customers
-    top_customers = AdvancedCustomer.objects.annotate(
-        total_spent=Sum('invoices__total_amount', filter=Q(invoices__status='paid'))
-    ).order_by('-total_spent')[:5]
+    top_customers = rollups.top_customers(limit=5)
     
     context = {
         'company': company,
@@ -149,44 +138,40 @@ def advanced_invoice_create(request):
                 }
             )
             
-            # Create invoice first
-            invoice = AdvancedInvoice(
-                customer=customer,
-                company=company,
-                date=datetime.strptime(invoice_date, '%Y-%m-%d').date(),
-                due_date=datetime.strptime(invoice_date, '%Y-%m-%d').date(),  # Same as invoice date
+            # Amounts are computed in memory; the invoice and all its items are written in one go
+            invoice_date = datetime.strptime(invoice_date, '%Y-%m-%d').date()
+            builder = InvoiceBuilder(
+                company,
+                customer,
+                date=invoice_date,
+                due_date=invoice_date,  # Same as invoice date
                 notes=notes,
                 terms_conditions=terms,
                 discount_percentage=discount_percentage,
                 status='draft'
             )
-            invoice.save()  # Save to get primary key
-            
-            # Add invoice items after invoice is saved
-            items_data = request.POST.getlist('items')
-            for item_data in items_data:
+            for item_data in request.POST.getlist('items'):
                 if item_data:
                     item_json = json.loads(item_data)
-                    AdvancedInvoiceItem.objects.create(
-                        invoice=invoice,
+                    builder.add_item(
+                        item_json['description'],
+                        quantity=item_json['quantity'],
+                        unit_price=item_json['unit_price'],
                         item_code=item_json.get('item_code', ''),
-                        description=item_json['description'],
                         category=item_json.get('category', ''),
-                        quantity=Decimal(str(item_json['quantity'])),
                         unit=item_json.get('unit', 'pcs'),
-                        unit_price=Decimal(str(item_json['unit_price'])),
                         discount_percentage=Decimal(str(item_json.get('discount_percentage', 0))),
                         tax_rate=Decimal(str(item_json.get('tax_rate', 18))),
                         notes=item_json.get('notes', '')
                     )
-            
-            # Recalculate totals after all items are added
-            invoice.calculate_amounts()
-            invoice.save()
+            invoice = builder.build()
             
             messages.success(request, f'Invoice {invoice.invoice_number} created successfully!')
             return redirect('billing:advanced_invoice_detail', invoice_id=invoice.invoice_id)
             
+        except InvoiceNumberError as e:
+            # The company's prefix is invalid or its series for the year is full
+            messages.error(request, f'Could not number the invoice: {e} Change the invoice prefix in the company profile.')
         except Exception as e:
             messages.error(request, f'Error creating invoice: {str(e)}')
     
@@ -224,36 +209,78 @@ def advanced_invoice_print(request, invoice_id):
     return render(request, 'billing/advanced_invoice_print.html', context)
 
 @superuser_required_with_login
-def advanced_invoice_list(request):
-    """Advanced invoice listing with filters"""
-    invoices = AdvancedInvoice.objects.select_related('customer').order_by('-created_at')
-    
-    # Filters
-    status = request.GET.get('status')
+def advanced_invoice_pdf(request, invoice_id):
+    """Invoice as a PDF, drawn with the active invoice template"""
+    invoice = get_object_or_404(
+        AdvancedInvoice.objects.select_related('customer', 'company'), invoice_id=invoice_id
+    )
+    try:
+        return pdf.response(invoice)
+    except ImproperlyConfigured as error:
+        messages.error(request, str(error))
+        return redirect('billing:advanced_invoice_detail', invoice_id=invoice_id)
+
+def _filter_invoices(invoices, params):
+    """Apply the invoice list filters (status, customer, date range) from request parameters"""
+    status = params.get('status')
     if status:
         invoices = invoices.filter(status=status)
     
-    customer = request.GET.get('customer')
+    customer = params.get('customer')
     if customer:
         invoices = invoices.filter(customer__name__icontains=customer)
     
-    date_from = request.GET.get('date_from')
+    date_from = params.get('date_from')
     if date_from:
         invoices = invoices.filter(date__gte=date_from)
     
-    date_to = request.GET.get('date_to')
+    date_to = params.get('date_to')
     if date_to:
         invoices = invoices.filter(date__lte=date_to)
+    return invoices
+
+@superuser_required_with_login
+def advanced_invoice_list(request):
+    """Advanced invoice listing with filters"""
+    invoices = AdvancedInvoice.objects.select_related('customer').order_by('-created_at')
+    
+    # Filters
+    invoices = _filter_invoices(invoices, request.GET)
     
     context = {
         'invoices': invoices,
-        'status': status,
-        'customer': customer,
-        'date_from': date_from,
-        'date_to': date_to,
+        'status': request.GET.get('status'),
+        'customer': request.GET.get('customer'),
+        'date_from': request.GET.get('date_from'),
+        'date_to': request.GET.get('date_to'),
+        'export_query': request.GET.urlencode(),
     }
     return render(request, 'billing/advanced_invoice_list.html', context)
 
+@superuser_required_with_login
+def advanced_invoice_export(request, file_format):
+    """Stream the filtered invoice list as CSV or XLSX"""
+    if file_format not in FORMATS:
+        raise Http404("Unknown export format")
+    invoices = _filter_invoices(AdvancedInvoice.objects.order_by('-created_at'), request.GET)
+    return INVOICES.response(invoices, file_format)
+
+@superuser_required_with_login
+def advanced_invoice_pdf_zip(request):
+    """PDFs of the filtered invoices of a date range, rendered in parallel and streamed as one ZIP"""
+    date_from = parse_date(request.GET.get('date_from') or '')
+    date_to = parse_date(request.GET.get('date_to') or '')
+    if not date_from or not date_to:
+        messages.error(request, 'Choose a date range (from and to) to download invoice PDFs.')
+        return redirect('billing:advanced_invoice_list')
+    
+    invoices = _filter_invoices(AdvancedInvoice.objects.order_by('date', 'invoice_number'), request.GET)
+    try:
+        return pdf.zip_response(invoices, f'invoices-{date_from.isoformat()}-to-{date_to.isoformat()}')
+    except ImproperlyConfigured as error:
+        messages.error(request, str(error))
+        return redirect('billing:advanced_invoice_list')
+
 @superuser_required_with_login
 def mark_invoice_paid(request, invoice_id):
     """Mark invoice as paid with payment details"""
@@ -284,37 +311,30 @@ def mark_invoice_paid(request, invoice_id):
 
 @superuser_required_with_login
 def advanced_analytics(request):
-    """Advanced analytics and reports - Simplified version"""
+    """Revenue, status, GST, HSN and cohort reports for a date range (see billing/analytics.py)"""
+    date_from, date_to = analytics.default_range(timezone.localdate())
     try:
-        # Provide sample data for demonstration
-        monthly_revenue = [
-            {'month': 'Jan', 'revenue': 0},
-            {'month': 'Feb', 'revenue': 0},
-            {'month': 'Mar', 'revenue': 0},
-            {'month': 'Apr', 'revenue': 0},
-            {'month': 'May', 'revenue': 0},
-            {'month': 'Jun', 'revenue': 0},
-            {'month': 'Jul', 'revenue': 0},
-            {'month': 'Aug', 'revenue': 0},
-            {'month': 'Sep', 'revenue': 0},
-            {'month': 'Oct', 'revenue': 0},
-            {'month': 'Nov', 'revenue': 0},
-            {'month': 'Dec', 'revenue': 0}
-        ]
-        
-        customer_stats = []
-        status_stats = []
-        
-        context = {
-            'monthly_revenue': monthly_revenue,
-            'customer_stats': customer_stats,
-            'status_stats': status_stats,
-        }
-        return render(request, 'billing/advanced_dashboard.html', context)
-    except Exception as e:
-        # If there's any error, return a simple error page
-        from django.http import HttpResponse
-        return HttpResponse(f"Analytics page error: {str(e)}")
+        date_from = parse_date(request.GET.get('date_from') or '') or date_from
+        date_to = parse_date(request.GET.get('date_to') or '') or date_to
+    except ValueError:
+        messages.error(request, 'Invalid date range, showing the last twelve months.')
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    
+    report = analytics.report(date_from, date_to, refresh=bool(request.GET.get('refresh')))
+    
+    context = {
+        'report': report,
+        'totals': report['totals'],
+        'monthly_revenue': report['monthly_revenue'],
+        'status_stats': report['status_stats'],
+        'gst_by_rate': report['gst_by_rate'],
+        'top_hsn': report['top_hsn'],
+        'customer_cohorts': report['customer_cohorts'],
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+    }
+    return render(request, 'billing/advanced_analytics.html', context)
 
 @superuser_required_with_login
 @csrf_exempt
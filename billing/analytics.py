@@ -0,0 +1,395 @@
+"""
+Billing analytics.
+
+The analytics page reports on invoices, invoice lines, payments and shop
+orders: monthly revenue, invoices by status, GST by rate, top HSN codes and
+customer cohorts, for any date range. Instead of running ORM aggregates on
+every page load, the fields those reports need are loaded once into a
+columnar extract: one typed array per field, with amounts in paise, dates
+as ordinals and months as year * 12 + month - 1, and strings (status,
+customer, HSN code) replaced by small integer codes. A report is then a few
+array operations over the rows whose date falls in the range.
+
+NumPy is used when it is installed. Without it the columns are stdlib
+array.array objects and the same operations run as plain loops: slower, but
+the figures are identical, since all amounts are whole paise. Finished
+reports are memoised per date range on the extract, so repeated page loads
+only cost a dictionary lookup.
+
+The extract lives per process and is reloaded after
+BILLING_ANALYTICS_REFRESH_SECONDS (default 300). While a newer extract loads
+in a background thread the current one keeps being served, so only the first
+page load of a process waits for the database.
+"""
+import itertools
+import logging
+import threading
+import time
+from array import array
+from datetime import date
+
+from django.conf import settings
+from django.db.models.functions import TruncDate
+
+try:
+    import numpy
+except ImportError:  # optional; the array fallback gives the same results
+    numpy = None
+
+
+logger = logging.getLogger(__name__)
+
+BACKEND = 'numpy' if numpy is not None else 'array'
+
+# Invoices that are not (yet) a sale
+EXCLUDED_INVOICE_STATUSES = ('draft', 'cancelled')
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'returned')
+
+TOP_HSN_CODES = 10
+COHORT_MONTHS = 12
+MEMOISED_REPORTS = 32
+CHUNK_SIZE = 5000
+
+# (customer code, month) pairs are packed into one integer with the month in the low bits, for cohorts
+_MONTH_BITS = 16
+
+
+def refresh_seconds():
+    return getattr(settings, 'BILLING_ANALYTICS_REFRESH_SECONDS', 300)
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def month_start(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def default_range(today=None, months=12):
+    """The last `months` calendar months up to today"""
+    today = today or date.today()
+    return month_start(month_index(today) - months + 1), today
+
+
+def _paise(amount):
+    return int(amount * 100) if amount is not None else 0
+
+
+class Codes(dict):
+    """Value -> small integer code, assigned on first sight"""
+
+    def code(self, value):
+        code = self.get(value)
+        if code is None:
+            code = self[value] = len(self)
+        return code
+
+    def values_by_code(self):
+        return [value for value, code in sorted(self.items(), key=lambda item: item[1])]
+
+
+# Column operations, one implementation per backend
+
+def _column(values):
+    if numpy is not None:
+        return numpy.array(values, dtype=numpy.int64)
+    return array('q', values)
+
+
+def _rows(days, start, end, codes=None, excluded=()):
+    """Row indices whose day is within [start, end] and whose code is not excluded"""
+    start, end = start.toordinal(), end.toordinal()
+    if numpy is not None:
+        mask = (days >= start) & (days <= end)
+        if excluded and len(codes):
+            table = numpy.zeros(max(int(codes.max()), *excluded) + 1, dtype=bool)
+            table[list(excluded)] = True
+            mask &= ~table[codes]
+        return numpy.flatnonzero(mask)
+    if excluded:
+        return [row for row, (day, code) in enumerate(zip(days, codes)) if start <= day <= end and code not in excluded]
+    return [row for row, day in enumerate(days) if start <= day <= end]
+
+
+def _take(column, rows):
+    if numpy is not None:
+        return column[rows]
+    return [column[row] for row in rows]
+
+
+def _cohort_counts(customers, months, cohort_of):
+    """{(cohort month, months since): distinct customers} for (customer, month) rows"""
+    mask = (1 << _MONTH_BITS) - 1
+    if numpy is not None:
+        active = numpy.unique((customers << _MONTH_BITS) | months)
+        cohorts = cohort_of[active >> _MONTH_BITS]
+        offsets = (active & mask) - cohorts
+        keep = offsets < COHORT_MONTHS
+        counts = _sum_by(cohorts[keep] * COHORT_MONTHS + offsets[keep])
+        return {divmod(key, COHORT_MONTHS): count for key, count in counts.items()}
+    counts = {}
+    for customer, month in set(zip(customers, months)):
+        cohort = cohort_of[customer]
+        if month - cohort < COHORT_MONTHS:
+            key = (cohort, month - cohort)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _sum_by(keys, weights=None):
+    """{key: sum of weights} (or {key: row count} without weights)"""
+    if numpy is not None:
+        if not len(keys):
+            return {}
+        # Keys are small codes, months or rates, so counting sort beats numpy.unique
+        low = int(keys.min())
+        shifted = keys - low
+        counts = numpy.bincount(shifted)
+        # float64 sums are exact for any realistic amount in paise (below 2**53)
+        sums = counts if weights is None else numpy.bincount(shifted, weights=weights)
+        return {key + low: int(round(sums[key])) for key in numpy.flatnonzero(counts).tolist()}
+    totals = {}
+    if weights is None:
+        for key in keys:
+            totals[key] = totals.get(key, 0) + 1
+    else:
+        for key, weight in zip(keys, weights):
+            totals[key] = totals.get(key, 0) + weight
+    return totals
+
+
+class Extract:
+    """Columns of every invoice, invoice line, payment and order, loaded in one pass per table"""
+
+    _generations = itertools.count(1)
+
+    def __init__(self):
+        from checkout.models import Order
+        from .advanced_models import AdvancedInvoice, AdvancedInvoiceItem, PaymentRecord
+
+        started = time.perf_counter()
+        self.statuses = Codes((status, code) for code, (status, label) in enumerate(AdvancedInvoice.STATUS_CHOICES))
+        self.order_statuses = Codes((status, code) for code, (status, label) in enumerate(Order.STATUS_CHOICES))
+        self.customers = Codes()
+        self.hsn_codes = Codes()
+
+        # Invoices
+        columns = {name: [] for name in ('day', 'month', 'status', 'customer', 'total', 'paid_day', 'paid_month')}
+        first_month = {}
+        rows = AdvancedInvoice.objects.annotate(paid_on=TruncDate('paid_date')).values_list(
+            'customer_id', 'date', 'status', 'total_amount', 'paid_on'
+        ).order_by()
+        for customer_id, day, status, total, paid_on in rows.iterator(chunk_size=CHUNK_SIZE):
+            customer = self.customers.code(customer_id)
+            month = month_index(day)
+            columns['day'].append(day.toordinal())
+            columns['month'].append(month)
+            columns['status'].append(self.statuses.code(status))
+            columns['customer'].append(customer)
+            columns['total'].append(_paise(total))
+            paid_on = paid_on if status == 'paid' else None
+            columns['paid_day'].append(paid_on.toordinal() if paid_on else 0)
+            columns['paid_month'].append(month_index(paid_on) if paid_on else 0)
+            if status not in EXCLUDED_INVOICE_STATUSES and month < first_month.get(customer, month + 1):
+                first_month[customer] = month
+        self.invoices = {name: _column(values) for name, values in columns.items()}
+        # Cohort of each customer code: the month of their first sale (0 for customers without one)
+        self.cohort = _column([first_month.get(code, 0) for code in range(len(self.customers))])
+
+        # Invoice lines, with the date and status of their invoice
+        columns = {name: [] for name in ('day', 'status', 'rate', 'taxable', 'tax', 'quantity', 'hsn')}
+        rows = AdvancedInvoiceItem.objects.values_list(
+            'invoice__date', 'invoice__status', 'tax_rate', 'subtotal', 'discount_amount', 'tax_amount',
+            'quantity', 'item_code',
+        ).order_by()
+        for day, status, rate, subtotal, discount, tax, quantity, item_code in rows.iterator(chunk_size=CHUNK_SIZE):
+            columns['day'].append(day.toordinal())
+            columns['status'].append(self.statuses.code(status))
+            columns['rate'].append(_paise(rate))  # basis points
+            columns['taxable'].append(_paise(subtotal) - _paise(discount))
+            columns['tax'].append(_paise(tax))
+            columns['quantity'].append(int(quantity * 1000) if quantity is not None else 0)
+            columns['hsn'].append(self.hsn_codes.code((item_code or '').strip().upper()))
+        self.lines = {name: _column(values) for name, values in columns.items()}
+
+        # Payments received
+        columns = {'day': [], 'month': [], 'amount': []}
+        rows = PaymentRecord.objects.annotate(day=TruncDate('payment_date')).values_list('day', 'amount').order_by()
+        for day, amount in rows.iterator(chunk_size=CHUNK_SIZE):
+            columns['day'].append(day.toordinal())
+            columns['month'].append(month_index(day))
+            columns['amount'].append(_paise(amount))
+        self.payments = {name: _column(values) for name, values in columns.items()}
+
+        # Shop orders
+        columns = {'day': [], 'month': [], 'status': [], 'total': []}
+        rows = Order.objects.annotate(day=TruncDate('created_at')).values_list('day', 'status', 'total_amount').order_by()
+        for day, status, total in rows.iterator(chunk_size=CHUNK_SIZE):
+            columns['day'].append(day.toordinal())
+            columns['month'].append(month_index(day))
+            columns['status'].append(self.order_statuses.code(status))
+            columns['total'].append(_paise(total))
+        self.orders = {name: _column(values) for name, values in columns.items()}
+
+        self.generation = next(self._generations)
+        self.loaded_at = time.monotonic()
+        self.load_seconds = time.perf_counter() - started
+        self.reports = {}
+        self._reports_lock = threading.Lock()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.loaded_at
+
+    def line_count(self):
+        return len(self.lines['day'])
+
+    def report(self, start, end):
+        """All reports for invoices, payments and orders dated start..end (inclusive)"""
+        key = (start, end)
+        report = self.reports.get(key)
+        if report is None:
+            report = build_report(self, start, end)
+            with self._reports_lock:
+                if len(self.reports) >= MEMOISED_REPORTS:
+                    self.reports.pop(next(iter(self.reports)))
+                self.reports[key] = report
+        return report
+
+
+# Reports
+
+def _excluded(codes, statuses):
+    return {codes[status] for status in statuses if status in codes}
+
+
+def build_report(extract, start, end):
+    months = list(range(month_index(start), month_index(end) + 1))
+    invoices, lines = extract.invoices, extract.lines
+    statuses = extract.statuses.values_by_code()
+    not_sales = _excluded(extract.statuses, EXCLUDED_INVOICE_STATUSES)
+
+    # Monthly revenue
+    sales = _rows(invoices['day'], start, end, invoices['status'], not_sales)
+    invoiced = _sum_by(_take(invoices['month'], sales), _take(invoices['total'], sales))
+    paid_rows = _rows(invoices['paid_day'], start, end)
+    paid = _sum_by(_take(invoices['paid_month'], paid_rows), _take(invoices['total'], paid_rows))
+    payment_rows = _rows(extract.payments['day'], start, end)
+    received = _sum_by(_take(extract.payments['month'], payment_rows), _take(extract.payments['amount'], payment_rows))
+    order_rows = _rows(extract.orders['day'], start, end, extract.orders['status'],
+                       _excluded(extract.order_statuses, EXCLUDED_ORDER_STATUSES))
+    shop = _sum_by(_take(extract.orders['month'], order_rows), _take(extract.orders['total'], order_rows))
+    monthly_revenue = [{
+        'month': month_start(month).strftime('%b %Y'),
+        'invoiced': invoiced.get(month, 0) / 100,
+        'paid': paid.get(month, 0) / 100,
+        'payments': received.get(month, 0) / 100,
+        'orders': shop.get(month, 0) / 100,
+    } for month in months]
+
+    # Invoices by status
+    in_range = _rows(invoices['day'], start, end)
+    counts = _sum_by(_take(invoices['status'], in_range))
+    amounts = _sum_by(_take(invoices['status'], in_range), _take(invoices['total'], in_range))
+    status_stats = [
+        {'status': statuses[code], 'count': counts[code], 'amount': amounts.get(code, 0) / 100}
+        for code in sorted(counts, key=lambda code: -counts[code])
+    ]
+
+    # GST by rate, over the lines of invoices that are sales
+    line_rows = _rows(lines['day'], start, end, lines['status'], not_sales)
+    rates = _take(lines['rate'], line_rows)
+    taxable = _sum_by(rates, _take(lines['taxable'], line_rows))
+    tax = _sum_by(rates, _take(lines['tax'], line_rows))
+    gst_by_rate = [{
+        'rate': rate / 100,
+        'taxable_value': taxable[rate] / 100,
+        'tax': tax.get(rate, 0) / 100,
+        'cgst': tax.get(rate, 0) / 200,
+        'sgst': tax.get(rate, 0) / 200,
+    } for rate in sorted(taxable)]
+
+    # Top HSN codes by taxable value
+    hsn_names = extract.hsn_codes.values_by_code()
+    hsn = _take(lines['hsn'], line_rows)
+    hsn_value = _sum_by(hsn, _take(lines['taxable'], line_rows))
+    hsn_quantity = _sum_by(hsn, _take(lines['quantity'], line_rows))
+    hsn_lines = _sum_by(hsn)
+    top_hsn = [{
+        'code': hsn_names[code],
+        'taxable_value': hsn_value[code] / 100,
+        'quantity': hsn_quantity.get(code, 0) / 1000,
+        'lines': hsn_lines[code],
+    } for code in sorted(hsn_value, key=lambda code: -hsn_value[code]) if hsn_names[code]][:TOP_HSN_CODES]
+
+    # Customer cohorts: customers by month of first invoice, and how many buy again in later months
+    cohorts = {}
+    counts = _cohort_counts(_take(invoices['customer'], sales), _take(invoices['month'], sales), extract.cohort)
+    for (cohort, offset), count in counts.items():
+        if cohort >= months[0]:
+            cohorts.setdefault(cohort, [0] * COHORT_MONTHS)[offset] = count
+    customer_cohorts = [{
+        'month': month_start(cohort).strftime('%b %Y'),
+        'customers': row[0],
+        'retention': [round(100 * count / row[0]) if row[0] else 0
+                      for count in row[1:min(COHORT_MONTHS, months[-1] - cohort + 1)]],
+    } for cohort, row in sorted(cohorts.items())]
+
+    return {
+        'start': start,
+        'end': end,
+        'totals': {
+            'invoices': len(in_range),
+            'invoiced': sum(invoiced.values()) / 100,
+            'paid': sum(paid.values()) / 100,
+            'orders': len(order_rows),
+            'order_revenue': sum(shop.values()) / 100,
+            'gst': sum(tax.values()) / 100,
+        },
+        'monthly_revenue': monthly_revenue,
+        'status_stats': status_stats,
+        'gst_by_rate': gst_by_rate,
+        'top_hsn': top_hsn,
+        'customer_cohorts': customer_cohorts,
+        'cohort_offsets': list(range(1, COHORT_MONTHS)),
+    }
+
+
+# The per-process extract
+
+_current = {'extract': None}
+_load_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def _refresh_in_background():
+    from django.db import connection
+
+    try:
+        _current['extract'] = Extract()
+    except Exception:
+        logger.exception('Could not refresh the billing analytics extract')
+    finally:
+        _refresh_lock.release()
+        # The thread has its own database connection
+        connection.close()
+
+
+def get_extract(refresh=False):
+    """The process's extract: loaded on first use, reloaded in the background once stale"""
+    extract = _current['extract']
+    if extract is None or refresh:
+        with _load_lock:
+            if _current['extract'] is None or refresh:
+                _current['extract'] = Extract()
+            return _current['extract']
+    if extract.age > refresh_seconds() and _refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, daemon=True).start()
+    return extract
+
+
+def report(start=None, end=None, refresh=False):
+    """Analytics for invoices dated start..end, by default the last twelve months"""
+    default_start, default_end = default_range()
+    return get_extract(refresh).report(start or default_start, end or default_end)
@@ -0,0 +1,79 @@
+"""
+Synthetic billing data for the benchmark management commands.
+
+Invoices, their lines and payments are written with bulk inserts and
+amounts precomputed with billing.invoices, so the figures are exactly what
+the invoice forms would have stored. Signals are not fired: rebuild the
+revenue rollups (billing.rollups.rebuild) before reading the dashboard.
+"""
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .invoices import header_amounts, line_amounts
+
+
+STATUSES = ['draft', 'sent', 'viewed', 'paid', 'paid', 'paid', 'overdue', 'cancelled']
+TAX_RATES = [Decimal('5.00'), Decimal('12.00'), Decimal('18.00')]
+HSN_CODES = ['6117', '6204', '6214', '6104', '6211', '5208', '5407', '6302', '6305', '6217', '6307', '5212']
+
+
+def build_synthetic_billing(lines, lines_per_invoice=10, customers=2000, months=24, seed=42, batch_size=2000):
+    """Bulk create invoices with `lines` lines in total, spread over the last `months` months"""
+    from .advanced_models import AdvancedCompanyProfile, AdvancedCustomer, AdvancedInvoice, AdvancedInvoiceItem, PaymentRecord
+
+    rng = random.Random(seed)
+    company = AdvancedCompanyProfile.objects.create(invoice_prefix='BEN')
+    customers = AdvancedCustomer.objects.bulk_create([
+        AdvancedCustomer(name=f'Customer {number}', customer_type='business')
+        for number in range(customers)
+    ])
+    first_day = date.today() - timedelta(days=31 * months)
+    span = (date.today() - first_day).days
+    invoice_count = -(-lines // lines_per_invoice)
+    lines_left = lines
+
+    for offset in range(0, invoice_count, batch_size):
+        invoices, items = [], []
+        for number in range(offset, min(offset + batch_size, invoice_count)):
+            invoice_date = first_day + timedelta(days=rng.randrange(span))
+            status = rng.choice(STATUSES)
+            invoice_lines = []
+            for _ in range(min(lines_per_invoice, lines_left)):
+                item = AdvancedInvoiceItem(
+                    item_code=rng.choice(HSN_CODES), description='Wholesale lot',
+                    quantity=Decimal(rng.randint(1, 200)), unit_price=Decimal(rng.randint(9900, 299900)) / 100,
+                    discount_percentage=Decimal(rng.choice([0, 0, 5, 10])), tax_rate=rng.choice(TAX_RATES),
+                )
+                for name, value in line_amounts(item.quantity, item.unit_price,
+                                                item.discount_percentage, item.tax_rate).items():
+                    setattr(item, name, value)
+                invoice_lines.append(item)
+            lines_left -= len(invoice_lines)
+            invoice = AdvancedInvoice(
+                invoice_number=f'BEN/{number + 1:08d}', customer=rng.choice(customers), company=company,
+                date=invoice_date, due_date=invoice_date + timedelta(days=30), status=status,
+            )
+            if status == 'paid':
+                paid_on = min(invoice_date + timedelta(days=rng.randint(0, 45)), date.today())
+                invoice.paid_date = timezone.make_aware(datetime(paid_on.year, paid_on.month, paid_on.day, 12))
+            for name, value in header_amounts(sum(line.total_price for line in invoice_lines),
+                                              invoice.discount_percentage, invoice.tax_rate).items():
+                setattr(invoice, name, value)
+            invoices.append(invoice)
+            items.append(invoice_lines)
+
+        AdvancedInvoice.objects.bulk_create(invoices)
+        for invoice, invoice_lines in zip(invoices, items):
+            for line in invoice_lines:
+                line.invoice = invoice
+        AdvancedInvoiceItem.objects.bulk_create([line for invoice_lines in items for line in invoice_lines],
+                                                batch_size=5000)
+        PaymentRecord.objects.bulk_create([
+            PaymentRecord(invoice=invoice, amount=invoice.total_amount, payment_method='bank_transfer',
+                          payment_date=invoice.paid_date)
+            for invoice in invoices if invoice.status == 'paid'
+        ])
+    return company
@@ -0,0 +1,28 @@
+"""Exports of billing data (see shop/exports.py)"""
+from shop.exports import Export
+
+
+INVOICES = Export('invoices', [
+    ('Invoice Number', 'invoice_number'),
+    ('Date', 'date'),
+    ('Due Date', 'due_date'),
+    ('Customer', 'customer__name'),
+    ('Customer GSTIN', 'customer__gst_number'),
+    ('Status', 'status'),
+    ('Subtotal', 'subtotal'),
+    ('Discount', 'discount_amount'),
+    ('Tax', 'tax_amount'),
+    ('Total', 'total_amount'),
+    ('Paid On', 'paid_date'),
+    ('Payment Method', 'payment_method'),
+    ('Payment Reference', 'payment_reference'),
+])
+
+CUSTOMERS = Export('customers', [
+    ('Name', 'name'),
+    ('Email', 'email'),
+    ('Phone', 'phone'),
+    ('Address', 'address'),
+    ('GSTIN', 'gst_number'),
+    ('Created', 'created_at'),
+])
@@ -0,0 +1,97 @@
+"""
+Invoice amounts and bulk invoice creation.
+
+Line and header amounts are computed here, in Decimal and rounded to paise
+the way they are stored, so an invoice built in memory has exactly the
+totals a recompute from its stored items gives.
+
+InvoiceBuilder creates an invoice with all its lines in one pass: amounts
+are computed in memory, the header is inserted once with its final totals
+and the items are written with one bulk insert, all in one transaction.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+
+PAISE = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+
+def money(value):
+    return Decimal(value).quantize(PAISE, rounding=ROUND_HALF_UP)
+
+
+def line_amounts(quantity, unit_price, discount_percentage=0, tax_rate=Decimal('5.00')):
+    """subtotal, discount_amount, tax_amount and total_price of one invoice line"""
+    subtotal = money(Decimal(quantity) * Decimal(unit_price))
+    discount_amount = money(subtotal * Decimal(discount_percentage) / HUNDRED)
+    taxable_amount = subtotal - discount_amount
+    tax_amount = money(taxable_amount * Decimal(tax_rate) / HUNDRED)
+    return {
+        'subtotal': subtotal,
+        'discount_amount': discount_amount,
+        'tax_amount': tax_amount,
+        'total_price': taxable_amount + tax_amount,
+    }
+
+
+def header_amounts(subtotal, discount_percentage=0, tax_rate=Decimal('5.00')):
+    """Invoice discount, tax and total on the sum of its line totals"""
+    subtotal = money(subtotal)
+    discount_amount = money(subtotal * Decimal(discount_percentage) / HUNDRED)
+    taxable_amount = subtotal - discount_amount
+    tax_amount = money(taxable_amount * Decimal(tax_rate) / HUNDRED)
+    return {
+        'subtotal': subtotal,
+        'discount_amount': discount_amount,
+        'tax_amount': tax_amount,
+        'total_amount': taxable_amount + tax_amount,
+    }
+
+
+class InvoiceBuilder:
+    """Collects lines for a new AdvancedInvoice and creates it in one go.
+
+        builder = InvoiceBuilder(company, customer, date=today, discount_percentage=5)
+        builder.add_item('Cotton dupatta', quantity=20, unit_price='349.00', tax_rate=5)
+        invoice = builder.build()
+    """
+
+    def __init__(self, company, customer, date, due_date=None, **fields):
+        self.invoice_fields = dict(fields, company=company, customer=customer, date=date, due_date=due_date or date)
+        self.items = []
+
+    def add_item(self, description, quantity, unit_price, **fields):
+        from .advanced_models import AdvancedInvoiceItem
+
+        item = AdvancedInvoiceItem(
+            description=description,
+            quantity=Decimal(str(quantity)),
+            unit_price=Decimal(str(unit_price)),
+            **fields,
+        )
+        for name, value in line_amounts(item.quantity, item.unit_price,
+                                        item.discount_percentage, item.tax_rate).items():
+            setattr(item, name, value)
+        self.items.append(item)
+        return item
+
+    def build(self):
+        """Insert the invoice and its items; returns the saved invoice"""
+        from .advanced_models import AdvancedInvoice, AdvancedInvoiceItem
+
+        invoice = AdvancedInvoice(**self.invoice_fields)
+        amounts = header_amounts(
+            sum((item.total_price for item in self.items), Decimal('0')),
+            invoice.discount_percentage, invoice.tax_rate,
+        )
+        for name, value in amounts.items():
+            setattr(invoice, name, value)
+
+        with transaction.atomic():
+            invoice.save()  # A new invoice takes its number here; totals are already final
+            for item in self.items:
+                item.invoice = invoice
+            AdvancedInvoiceItem.objects.bulk_create(self.items)
+        return invoice
@@ -0,0 +1,82 @@
+import json
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from billing import analytics
+from billing.benchmarks import build_synthetic_billing
+from shop.benchmarks import isolated_database
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the billing analytics page over a synthetic history (1M invoice lines by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1_000_000, help='Invoice lines to generate')
+        parser.add_argument('--lines-per-invoice', type=int, default=10)
+        parser.add_argument('--customers', type=int, default=2000)
+        parser.add_argument('--months', type=int, default=24, help='Months of history to spread invoices over')
+        parser.add_argument('--repeat', type=int, default=20, help='Page loads per range (median is reported)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            started = time.perf_counter()
+            build_synthetic_billing(options['lines'], options['lines_per_invoice'], options['customers'],
+                                    options['months'], options['seed'])
+            self.stdout.write(f'Generated {options["lines"]:,} lines in {time.perf_counter() - started:.1f}s '
+                              f'(backend: {analytics.BACKEND})')
+
+            started = time.perf_counter()
+            extract = analytics.get_extract(refresh=True)
+            load_seconds = time.perf_counter() - started
+            self.stdout.write(f'Extract loaded in {load_seconds:.2f}s ({extract.line_count():,} lines)\n')
+
+            user = get_user_model().objects.create_superuser(
+                username='benchmark', email='benchmark@example.com', password='benchmark',
+            )
+            client = Client()
+            client.force_login(user)
+            today = date.today()
+            ranges = {
+                'last 12 months': analytics.default_range(today),
+                'this month': analytics.default_range(today, months=1),
+                'all history': (today - timedelta(days=31 * options['months']), today),
+            }
+
+            results = {'backend': analytics.BACKEND, 'lines': extract.line_count(),
+                       'extract_load_s': round(load_seconds, 2), 'ranges': []}
+            self.stdout.write(f'{"range":<16} {"report ms":>10} {"first page ms":>14} {"page median ms":>15}')
+            self.stdout.write('-' * 58)
+            for name, (start, end) in ranges.items():
+                compute_started = time.perf_counter()
+                analytics.build_report(extract, start, end)
+                compute_ms = (time.perf_counter() - compute_started) * 1000
+
+                url = f'{reverse("billing:advanced_analytics")}?date_from={start.isoformat()}&date_to={end.isoformat()}'
+                timings = []
+                for _ in range(options['repeat'] + 1):
+                    page_started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - page_started) * 1000)
+                    assert response.status_code == 200
+                first, median = timings[0], statistics.median(timings[1:])
+                results['ranges'].append({
+                    'range': name, 'report_ms': round(compute_ms, 2),
+                    'first_page_ms': round(first, 2), 'page_median_ms': round(median, 2),
+                })
+                self.stdout.write(f'{name:<16} {compute_ms:>10.2f} {first:>14.2f} {median:>15.2f}')
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+
+# Usage examples:
+# python manage.py benchmark_analytics
+# python manage.py benchmark_analytics --lines 100000 --repeat 50 --json analytics.json
@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from billing import pdf
+from billing.advanced_models import AdvancedCompanyProfile, AdvancedCustomer, AdvancedInvoice
+from billing.invoices import InvoiceBuilder
+from shop.benchmarks import isolated_database
+
+
+TAX_RATES = [Decimal('5.00'), Decimal('12.00'), Decimal('18.00')]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark bulk PDF invoice rendering into a ZIP stream, in invoices per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=300, help='Invoices to generate over one month')
+        parser.add_argument('--lines', type=int, default=12, help='Lines per invoice')
+        parser.add_argument('--workers', type=int, nargs='+',
+                            default=sorted({1, 2, os.cpu_count() or 1}), help='Pool sizes to measure')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        try:
+            pdf._reportlab()
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error))
+
+        with isolated_database():
+            started = time.perf_counter()
+            start, end = self.generate(options)
+            self.stdout.write(f'Generated {options["invoices"]} invoices of {options["lines"]} lines '
+                              f'in {time.perf_counter() - started:.1f}s\n')
+            invoices = AdvancedInvoice.objects.filter(date__range=(start, end)).order_by('date', 'invoice_number')
+            style = pdf.active_style()
+
+            results = {'invoices': options['invoices'], 'lines': options['lines'], 'runs': []}
+            self.stdout.write(f'{"path":<22} {"seconds":>8} {"invoices/s":>11} {"ZIP MB":>8}')
+            self.stdout.write('-' * 52)
+            results['runs'].append(self.run('1 process, no caches', lambda: self.uncached(invoices, style)))
+            for workers in options['workers']:
+                pdf.clear_caches()
+                name = f'{workers} process{"es" if workers > 1 else ""}'
+                results['runs'].append(self.run(
+                    name, lambda: pdf.render_many(invoices, style, workers=workers), workers=workers,
+                ))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+
+    def run(self, name, rendered, workers=1):
+        count, size = 0, 0
+
+        def counted():
+            nonlocal count
+            for pair in rendered():
+                count += 1
+                yield pair
+
+        started = time.perf_counter()
+        for chunk in pdf.zip_stream(counted()):
+            size += len(chunk)
+        seconds = time.perf_counter() - started
+        self.stdout.write(f'{name:<22} {seconds:>8.2f} {count / seconds:>11.1f} {size / 1024 / 1024:>8.1f}')
+        return {'path': name, 'workers': workers, 'seconds': round(seconds, 3),
+                'invoices_per_second': round(count / seconds, 1), 'zip_bytes': size}
+
+    def uncached(self, invoices, style):
+        """Styles, fonts and logo rebuilt for every invoice, as a renderer without caches would"""
+        for data in pdf.extract(invoices):
+            pdf.clear_caches()
+            yield data, pdf.render(data, style)
+
+    def generate(self, options):
+        rng = random.Random(options['seed'])
+        company = AdvancedCompanyProfile.objects.create(invoice_prefix='PDF')
+        customers = [
+            AdvancedCustomer.objects.create(
+                name=f'Boutique {number}', customer_type='business', city='Lucknow', state='Uttar Pradesh',
+                address=f'{number} Hazratganj', pincode='226001', gst_number=f'09AAACB{number:04d}C1Z5',
+            )
+            for number in range(20)
+        ]
+        start = date.today().replace(day=1)
+        end = start + timedelta(days=27)
+        for number in range(options['invoices']):
+            invoice_date = start + timedelta(days=rng.randrange(28))
+            builder = InvoiceBuilder(company, rng.choice(customers), invoice_date, status='sent',
+                                     notes='Thank you for your business.')
+            for line in range(options['lines']):
+                builder.add_item(
+                    f'Chikankari dupatta, design {rng.randint(100, 999)}', Decimal(rng.randint(1, 60)),
+                    Decimal(rng.randint(29900, 249900)) / 100, item_code=f'62{rng.randint(10, 17)}',
+                    discount_percentage=Decimal(rng.choice([0, 0, 5, 10])), tax_rate=rng.choice(TAX_RATES),
+                )
+            builder.build()
+        return start, end
+
+
+# Usage examples:
+# python manage.py benchmark_invoice_pdfs
+# python manage.py benchmark_invoice_pdfs --invoices 1000 --lines 20 --workers 1 4 8 --json pdfs.json
@@ -0,0 +1,117 @@
+import json
+import random
+import statistics
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from billing.advanced_models import AdvancedCompanyProfile, AdvancedCustomer, AdvancedInvoice, AdvancedInvoiceItem
+from billing.invoices import InvoiceBuilder
+from shop.benchmarks import isolated_database
+
+
+TAX_RATES = [Decimal('5.00'), Decimal('12.00'), Decimal('18.00')]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark creating and recomputing wholesale invoices (200 lines by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[200], help='Invoice sizes to create')
+        parser.add_argument('--repeat', type=int, default=10, help='Runs per size (median is reported)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with isolated_database():
+            company = AdvancedCompanyProfile.objects.create(invoice_prefix='INV')
+            customer = AdvancedCustomer.objects.create(name='Wholesale Customer', customer_type='business')
+
+            results = {'scenarios': []}
+            self.stdout.write(f'{"lines":>6} {"path":<16} {"median ms":>10} {"min ms":>9} {"queries":>8}')
+            self.stdout.write('-' * 53)
+            for lines in options['lines']:
+                items = [self.wholesale_line(rng, number) for number in range(lines)]
+                row = {'lines': lines}
+                created = {}
+                for path, func in (('per-item', self.per_item_invoice), ('builder', self.builder_invoice)):
+                    row[path], created[path] = self.run(
+                        lines, path, options['repeat'], lambda: func(company, customer, items)
+                    )
+
+                per_item, built = created['per-item'], created['builder']
+                if (per_item.subtotal, per_item.tax_amount, per_item.total_amount) != \
+                        (built.subtotal, built.tax_amount, built.total_amount):
+                    raise CommandError(f'Totals differ: per-item {per_item.total_amount}, builder {built.total_amount}')
+
+                for path, func in (('recompute-loop', self.loop_subtotal), ('recompute-sum', self.aggregate_subtotal)):
+                    row[path], subtotal = self.run(lines, path, options['repeat'], lambda: func(built))
+                    if subtotal != built.subtotal:
+                        raise CommandError(f'{path} gives {subtotal}, stored subtotal is {built.subtotal}')
+                results['scenarios'].append(row)
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Both paths produce identical invoice totals'))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["json_path"]}'))
+
+    def run(self, lines, path, repeat, func):
+        timings, queries = [], set()
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                result = func()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.add(len(captured.captured_queries))
+        median, best = statistics.median(timings), min(timings)
+        query_counts = '/'.join(str(count) for count in sorted(queries))
+        self.stdout.write(f'{lines:>6} {path:<16} {median:>10.2f} {best:>9.2f} {query_counts:>8}')
+        return {'median_ms': round(median, 2), 'min_ms': round(best, 2), 'queries': sorted(queries)}, result
+
+    def wholesale_line(self, rng, number):
+        return {
+            'item_code': f'HSN{6200 + number % 50}',
+            'description': f'Wholesale lot {number + 1}',
+            'quantity': Decimal(rng.randint(10, 500)),
+            'unit_price': Decimal(rng.randint(4900, 249900)) / 100,
+            'discount_percentage': Decimal(rng.choice([0, 0, 2.5, 5, 10])),
+            'tax_rate': rng.choice(TAX_RATES),
+        }
+
+    def per_item_invoice(self, company, customer, items):
+        """What invoice creation did before the builder: save, one create per line, then save again"""
+        today = date.today()
+        invoice = AdvancedInvoice(customer=customer, company=company, date=today, due_date=today,
+                                  discount_percentage=Decimal('2.00'))
+        invoice.save()
+        for item in items:
+            AdvancedInvoiceItem.objects.create(invoice=invoice, **item)
+        invoice.calculate_amounts()
+        invoice.save()
+        return invoice
+
+    def builder_invoice(self, company, customer, items):
+        today = date.today()
+        builder = InvoiceBuilder(company, customer, date=today, discount_percentage=Decimal('2.00'))
+        for item in items:
+            item = dict(item)
+            builder.add_item(item.pop('description'), item.pop('quantity'), item.pop('unit_price'), **item)
+        return builder.build()
+
+    def loop_subtotal(self, invoice):
+        """The old recompute: every item loaded and summed in Python"""
+        return sum(item.total_price for item in invoice.items.all())
+
+    def aggregate_subtotal(self, invoice):
+        invoice.calculate_amounts()
+        return invoice.subtotal
+
+
+# Usage examples:
+# python manage.py benchmark_invoices
+# python manage.py benchmark_invoices --lines 50 200 1000 --repeat 20 --json invoices.json
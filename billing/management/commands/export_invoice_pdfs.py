@@ -0,0 +1,45 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from billing import pdf
+from billing.advanced_models import AdvancedInvoice
+
+
+class Command(BaseCommand):
+    help = 'Render the PDFs of the advanced invoices of a date range into a ZIP file (e.g. for GST filing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date_from', help='First invoice date, YYYY-MM-DD')
+        parser.add_argument('date_to', help='Last invoice date, YYYY-MM-DD')
+        parser.add_argument('--output', '-o', help='ZIP file to write (default: invoices-<from>-to-<to>.zip)')
+        parser.add_argument('--status', action='append', help='Only invoices with this status (repeatable)')
+        parser.add_argument('--workers', type=int, help='Rendering processes (default: BILLING_PDF_WORKERS or one per CPU)')
+
+    def handle(self, *args, **options):
+        date_from, date_to = parse_date(options['date_from']), parse_date(options['date_to'])
+        if not date_from or not date_to:
+            raise CommandError('Dates must be given as YYYY-MM-DD')
+
+        invoices = AdvancedInvoice.objects.filter(date__range=(date_from, date_to)).order_by('date', 'invoice_number')
+        if options['status']:
+            invoices = invoices.filter(status__in=options['status'])
+        output = options['output'] or f'invoices-{date_from.isoformat()}-to-{date_to.isoformat()}.zip'
+
+        rendered = []
+        def counted():
+            for data, content in pdf.render_many(invoices, workers=options['workers']):
+                rendered.append(data['number'])
+                yield data, content
+
+        try:
+            with open(output, 'wb') as handle:
+                for chunk in pdf.zip_stream(counted()):
+                    handle.write(chunk)
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(rendered)} invoice PDFs written to {output}'))
+
+
+# Usage examples:
+# python manage.py export_invoice_pdfs 2025-09-01 2025-09-30
+# python manage.py export_invoice_pdfs 2025-09-01 2025-09-30 --status sent --status paid --workers 4 -o september.zip
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from billing import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the billing dashboard revenue rollups from the invoices'
+
+    def handle(self, *args, **options):
+        rows = rollups.rebuild()
+        totals = rollups.totals()
+
+        self.stdout.write(self.style.SUCCESS(f'📊 Revenue rollups rebuilt: {rows} rows'))
+        self.stdout.write(f'Invoices: {totals["invoice_count"]}')
+        self.stdout.write(f'Paid: {totals["paid_count"]} (₹{totals["paid_revenue"]})')
+        self.stdout.write(f'Outstanding: {totals["outstanding_count"]} (₹{totals["outstanding_amount"]})')
+
+
+# Usage example:
+# python manage.py rebuild_revenue_rollups
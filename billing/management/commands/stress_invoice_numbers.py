@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from billing.advanced_models import AdvancedCompanyProfile, AdvancedCustomer, AdvancedInvoice, InvoiceNumberCounter
+from billing.numbering import financial_year, format_invoice_number, reserve_invoice_numbers
+from shop.benchmarks import isolated_database
+
+
+class SimulatedFailure(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Create invoices from many threads at once and check numbers are unique and gapless'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--invoices', type=int, default=50, help='Invoices per thread')
+        parser.add_argument('--fail-every', type=int, default=0,
+                            help='Roll back every Nth save after its number was taken (0: never)')
+        parser.add_argument('--batch', type=int, default=0,
+                            help='Pre-allocate ranges of this size and bulk create instead of saving one by one')
+
+    def handle(self, *args, **options):
+        invoice_date = date.today()
+        with isolated_database(concurrent=True):
+            company = AdvancedCompanyProfile.objects.create(invoice_prefix='INV')
+            customer = AdvancedCustomer.objects.create(name='Stress Customer')
+            barrier = threading.Barrier(options['threads'])
+            errors = []
+            rolled_back = [0]
+            lock = threading.Lock()
+
+            def create_one(number):
+                with transaction.atomic():
+                    AdvancedInvoice(customer=customer, company=company, date=invoice_date,
+                                    due_date=invoice_date).save()
+                    if options['fail_every'] and number % options['fail_every'] == 0:
+                        raise SimulatedFailure
+
+            def create_batch(size):
+                numbers = reserve_invoice_numbers(company, size, invoice_date)
+                AdvancedInvoice.objects.bulk_create([
+                    AdvancedInvoice(invoice_number=number, customer=customer, company=company,
+                                    date=invoice_date, due_date=invoice_date)
+                    for number in numbers
+                ])
+
+            def worker():
+                try:
+                    barrier.wait()
+                    if options['batch']:
+                        remaining = options['invoices']
+                        while remaining:
+                            size = min(options['batch'], remaining)
+                            create_batch(size)
+                            remaining -= size
+                    else:
+                        for number in range(1, options['invoices'] + 1):
+                            try:
+                                create_one(number)
+                            except SimulatedFailure:
+                                with lock:
+                                    rolled_back[0] += 1
+                except Exception as exc:
+                    with lock:
+                        errors.append(f'{type(exc).__name__}: {exc}')
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            numbers = list(AdvancedInvoice.objects.values_list('invoice_number', flat=True))
+            next_value = InvoiceNumberCounter.objects.get(company=company).next_value
+
+        year = financial_year(invoice_date)
+        expected = [format_invoice_number('INV', year, value) for value in range(1, len(numbers) + 1)]
+        self.stdout.write(f'Threads: {options["threads"]}  created: {len(numbers)}  rolled back: {rolled_back[0]}  '
+                          f'errors: {len(errors)}  elapsed: {elapsed:.2f}s ({len(numbers) / elapsed:,.0f}/s)')
+        self.stdout.write(f'Range {min(numbers)} .. {max(numbers)}, counter next value {next_value}')
+        for error in errors[:5]:
+            self.stdout.write(self.style.ERROR(f'  {error}'))
+
+        problems = []
+        if len(set(numbers)) != len(numbers):
+            problems.append(f'{len(numbers) - len(set(numbers))} duplicate numbers')
+        if set(numbers) != set(expected):
+            problems.append('numbers are not the gapless series 1..N')
+        if next_value != len(numbers) + 1:
+            problems.append(f'counter is at {next_value} for {len(numbers)} invoices')
+        if errors:
+            problems.append(f'{len(errors)} threads failed')
+        if problems:
+            raise CommandError('❌ ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('✅ Unique, gapless invoice numbers'))
+
+
+# Usage examples:
+# python manage.py stress_invoice_numbers
+# python manage.py stress_invoice_numbers --threads 32 --invoices 100 --fail-every 7
+# python manage.py stress_invoice_numbers --batch 25
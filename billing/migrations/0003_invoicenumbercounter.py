@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_advancedcompanyprofile_advancedcustomer_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10)),
+                ('financial_year', models.PositiveIntegerField(help_text='Starting year, e.g. 2025 for FY 2025-26')),
+                ('next_value', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_counters', to='billing.advancedcompanyprofile')),
+            ],
+            options={
+                'verbose_name': 'Invoice Number Counter',
+                'verbose_name_plural': 'Invoice Number Counters',
+                'unique_together': {('company', 'prefix', 'financial_year')},
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:34
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+
+def build_rollups(apps, schema_editor):
+    """Fill the rollups from the existing invoices, as billing.rollups.rebuild() does"""
+    AdvancedInvoice = apps.get_model('billing', 'AdvancedInvoice')
+    RevenueRollup = apps.get_model('billing', 'RevenueRollup')
+
+    rows = defaultdict(dict)
+    outstanding = Q(status__in=('sent', 'viewed', 'overdue'))
+    for period, trunc in (('day', TruncDay), ('month', TruncMonth)):
+        issued = AdvancedInvoice.objects.annotate(start=trunc('date')).values('customer_id', 'start').annotate(
+            invoice_count=Count('id'),
+            outstanding_count=Count('id', filter=outstanding),
+            outstanding_amount=Sum('total_amount', filter=outstanding),
+        ).order_by()
+        paid = AdvancedInvoice.objects.filter(status='paid', paid_date__isnull=False).annotate(
+            start=trunc('paid_date', output_field=DateField())
+        ).values('customer_id', 'start').annotate(
+            paid_count=Count('id'),
+            paid_revenue=Sum('total_amount'),
+        ).order_by()
+        for group in list(issued) + list(paid):
+            key = (period, group.pop('start'), group.pop('customer_id'))
+            rows[key].update({name: value for name, value in group.items() if value is not None})
+
+    RevenueRollup.objects.bulk_create([
+        RevenueRollup(period=period, period_start=start, customer_id=customer_id, **counters)
+        for (period, start, customer_id), counters in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_invoicenumbercounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('outstanding_count', models.IntegerField(default=0)),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_count', models.IntegerField(default=0)),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='billing.advancedcustomer')),
+            ],
+            options={
+                'verbose_name': 'Revenue Rollup',
+                'verbose_name_plural': 'Revenue Rollups',
+                'indexes': [models.Index(fields=['period', 'period_start'], name='billing_rev_period_fbb0f8_idx')],
+                'unique_together': {('period', 'period_start', 'customer')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
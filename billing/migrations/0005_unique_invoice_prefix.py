@@ -0,0 +1,53 @@
+import re
+from itertools import count
+
+from django.db import migrations, models
+
+
+# Five characters at most, so that numbers like INV2/25-26/0001 stay within 16
+MAX_PREFIX_LENGTH = 5
+
+
+def fit_prefixes(apps, schema_editor):
+    """Shorten prefixes that cannot number GST invoices and renumber shared ones (INV2, INV3...)
+
+    Invalid characters are dropped and over-long prefixes cut to five
+    characters; the oldest company keeps a prefix, later ones sharing it get a
+    number appended.
+    """
+    AdvancedCompanyProfile = apps.get_model('billing', 'AdvancedCompanyProfile')
+    companies = list(AdvancedCompanyProfile.objects.order_by('pk'))
+    fitted = {
+        company.pk: re.sub(r'[^A-Za-z0-9/-]', '', company.invoice_prefix)[:MAX_PREFIX_LENGTH] or 'INV'
+        for company in companies
+    }
+    taken = {prefix for pk, prefix in fitted.items()}
+    seen = set()
+    for company in companies:
+        prefix = fitted[company.pk]
+        if prefix in seen:
+            for number in count(2):
+                prefix = f'{fitted[company.pk][:MAX_PREFIX_LENGTH - len(str(number))]}{number}'
+                if prefix not in taken:
+                    break
+            taken.add(prefix)
+        seen.add(prefix)
+        if prefix != company.invoice_prefix:
+            company.invoice_prefix = prefix
+            company.save(update_fields=['invoice_prefix'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_revenuerollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(fit_prefixes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='advancedcompanyprofile',
+            name='invoice_prefix',
+            field=models.CharField(default='INV', error_messages={'unique': 'Another company already uses this invoice prefix.'}, max_length=5, unique=True),
+        ),
+    ]
@@ -0,0 +1,96 @@
+"""
+Invoice numbers.
+
+Invoices are numbered per company, prefix and Indian financial year (April
+to March), e.g. INV/25-26/0001: at most 16 characters of letters, digits,
+'/' and '-', as GST invoices require. Prefixes are limited to
+MAX_PREFIX_LENGTH characters, which leaves room for four digits; a number
+that would still outgrow 16 characters (a five character prefix past 9999
+invoices in a year) raises InvoiceNumberError instead of being issued. Each series
+is one InvoiceNumberCounter row, advanced with an UPDATE ... SET next_value =
+next_value + n and read back in the same transaction. That makes taking a
+number O(1) and safe under concurrency, and because it happens inside the
+invoice's own transaction a failed save gives its number back: the series
+has no gaps.
+
+For batch creation `reserve_invoice_numbers` pre-allocates a range in one
+round trip; numbers of the range that end up unused are the only source of
+gaps, so reserve exactly what the batch needs.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+MAX_LENGTH = 16
+
+# '/25-26/0001' follows the prefix
+MAX_PREFIX_LENGTH = MAX_LENGTH - len('/25-26/0001')
+
+PREFIX_RE = re.compile(r'^[A-Za-z0-9/-]+$')
+
+
+class InvoiceNumberError(ValueError):
+    """A company's prefix cannot number an invoice; a message for the user, not a server error"""
+
+
+def prefix_error(prefix):
+    """Why a prefix cannot number GST invoices, or None if it can"""
+    if not prefix or not PREFIX_RE.match(prefix):
+        return "Use letters, digits, '/' and '-' only."
+    if len(prefix) > MAX_PREFIX_LENGTH:
+        return (f'At most {MAX_PREFIX_LENGTH} characters, so that invoice numbers such as '
+                f'{prefix[:MAX_PREFIX_LENGTH]}/25-26/0001 stay within {MAX_LENGTH}.')
+    return None
+
+
+def financial_year(date=None):
+    """Starting year of the financial year a date falls in"""
+    date = date or timezone.localdate()
+    return date.year if date.month >= 4 else date.year - 1
+
+
+def format_invoice_number(prefix, year, value):
+    error = prefix_error(prefix)
+    if error:
+        raise InvoiceNumberError(f'Invalid invoice prefix {prefix!r}: {error}')
+    number = f"{prefix}/{year % 100:02d}-{(year + 1) % 100:02d}/{value:04d}"
+    if len(number) > MAX_LENGTH:
+        raise InvoiceNumberError(f'Invoice number {number} is longer than {MAX_LENGTH} characters; '
+                         f'the {prefix} series for FY {year} is full, use a shorter prefix.')
+    return number
+
+
+def allocate(company, prefix, year, count=1):
+    """Advance a series by `count`; returns the first value allocated"""
+    from .advanced_models import InvoiceNumberCounter
+
+    counters = InvoiceNumberCounter.objects.filter(company=company, prefix=prefix, financial_year=year)
+    for attempt in range(2):
+        with transaction.atomic():
+            if counters.update(next_value=F('next_value') + count, updated_at=timezone.now()):
+                # The UPDATE holds the row until commit, so this reads our own increment
+                return counters.values_list('next_value', flat=True).get() - count
+        try:
+            with transaction.atomic():
+                InvoiceNumberCounter.objects.create(company=company, prefix=prefix, financial_year=year)
+        except IntegrityError:
+            pass  # Another invoice started the series first
+    raise RuntimeError(f'Could not allocate invoice numbers for {prefix} FY {year}')
+
+
+def next_invoice_number(company, date=None):
+    year = financial_year(date)
+    # A number that cannot be formatted is given back
+    with transaction.atomic():
+        return format_invoice_number(company.invoice_prefix, year, allocate(company, company.invoice_prefix, year))
+
+
+def reserve_invoice_numbers(company, count, date=None):
+    """Pre-allocate `count` consecutive numbers, e.g. for a batch of invoices"""
+    year = financial_year(date)
+    with transaction.atomic():
+        first = allocate(company, company.invoice_prefix, year, count)
+        return [format_invoice_number(company.invoice_prefix, year, value) for value in range(first, first + count)]
@@ -0,0 +1,633 @@
+"""
+PDF invoices.
+
+Advanced invoices are drawn with reportlab, which is pure Python and needs
+neither a browser nor network access, using the colours, sections and texts
+of the active InvoiceTemplate.
+
+Rendering is split in two. invoice_data() reads an invoice, its customer,
+company and items into a plain dictionary, and template_style() does the
+same for the template, so render() needs no database and can run in another
+process. render_many() extracts the invoices of a queryset chunk by chunk
+and renders them on a process pool, keeping a bounded number of invoices in
+flight, and zip_stream() writes the PDFs into a zip archive as they come
+back, so a month of invoices downloads as one streamed file.
+
+Each process keeps what is expensive to build and the same for every
+invoice: the compiled paragraph and table styles of a template, the
+registered fonts and the decoded, downscaled company logos. A pool worker
+builds them for its first invoice and reuses them for the rest.
+
+reportlab is an optional dependency, imported when the first PDF is drawn;
+without it rendering raises ImproperlyConfigured. Fonts come from
+BILLING_PDF_FONTS ({'sans': (regular, bold), 'serif': ..., 'mono': ...}
+TrueType paths), defaulting to DejaVu when it is installed so the rupee sign
+can be printed, and to the built-in PDF fonts otherwise.
+BILLING_PDF_WORKERS sets the pool size (default: one per CPU).
+"""
+import io
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .invoices import money
+
+
+STYLE_FIELDS = (
+    'template_type', 'show_logo', 'show_company_details', 'show_customer_details',
+    'show_payment_terms', 'show_notes', 'primary_color', 'secondary_color', 'font_family',
+    'header_text', 'footer_text', 'terms_conditions',
+)
+
+# Below this many invoices a pool costs more than it saves
+PARALLEL_THRESHOLD = 16
+
+# Invoices queued per pool worker
+IN_FLIGHT = 4
+
+CHUNK_SIZE = 200
+
+LOGO_PIXELS = 480
+
+_FONT_DIRS = ['/usr/share/fonts/truetype/dejavu', '/usr/share/fonts/dejavu', '/Library/Fonts']
+_DEJAVU = {
+    'sans': ('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf'),
+    'serif': ('DejaVuSerif.ttf', 'DejaVuSerif-Bold.ttf'),
+    'mono': ('DejaVuSansMono.ttf', 'DejaVuSansMono-Bold.ttf'),
+}
+_BUILTIN = {
+    'sans': ('Helvetica', 'Helvetica-Bold'),
+    'serif': ('Times-Roman', 'Times-Bold'),
+    'mono': ('Courier', 'Courier-Bold'),
+}
+
+# Per-process caches, filled on first use by each worker
+_fonts = {}
+_styles = {}
+_logos = {}
+
+
+def _reportlab():
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured('PDF invoices need reportlab: pip install reportlab')
+
+
+def clear_caches():
+    _fonts.clear()
+    _styles.clear()
+    _logos.clear()
+
+
+# Reading invoices
+
+def _family(font_family):
+    """The font family of a CSS font-family value"""
+    value = (font_family or '').lower()
+    if 'mono' in value or 'courier' in value:
+        return 'mono'
+    if 'serif' in value and 'sans' not in value or 'times' in value or 'georgia' in value:
+        return 'serif'
+    return 'sans'
+
+
+def _font_files(family):
+    configured = getattr(settings, 'BILLING_PDF_FONTS', {}).get(family)
+    if configured:
+        return tuple(configured)
+    for directory in _FONT_DIRS:
+        paths = tuple(os.path.join(directory, name) for name in _DEJAVU[family])
+        if all(os.path.exists(path) for path in paths):
+            return paths
+    return None
+
+
+def template_style(template=None):
+    """The rendering settings of an InvoiceTemplate (model defaults when None) as a hashable tuple"""
+    if template is None:
+        from .advanced_models import InvoiceTemplate
+        template = InvoiceTemplate()
+    style = {field: getattr(template, field) for field in STYLE_FIELDS}
+    family = _family(style['font_family'])
+    style['font'] = (family, _font_files(family))
+    return tuple(sorted(style.items()))
+
+
+def active_style():
+    from .advanced_models import InvoiceTemplate
+    return template_style(InvoiceTemplate.objects.filter(is_active=True).first())
+
+
+def _logo_path(company):
+    if company.logo:
+        try:
+            if os.path.exists(company.logo.path):
+                return company.logo.path
+        except (NotImplementedError, ValueError):
+            pass
+    from django.contrib.staticfiles import finders
+    return finders.find('images/logo.png')
+
+
+def _company_data(company):
+    logo = _logo_path(company)
+    return {
+        'name': company.name,
+        'address': company.address,
+        'phone': company.phone,
+        'email': company.email,
+        'website': company.website,
+        'gst_number': company.gst_number,
+        'pan_number': company.pan_number,
+        'bank_name': company.bank_name,
+        'account_number': company.account_number,
+        'ifsc_code': company.ifsc_code,
+        'logo': (logo, os.path.getmtime(logo)) if logo else None,
+    }
+
+
+def invoice_data(invoice, companies=None):
+    """Everything render() prints, read from an invoice with its customer, company and items"""
+    if companies is None:
+        companies = {}
+    if invoice.company_id not in companies:
+        companies[invoice.company_id] = _company_data(invoice.company)
+    customer = invoice.customer
+    return {
+        'number': invoice.invoice_number,
+        'date': invoice.date,
+        'due_date': invoice.due_date,
+        'status': invoice.get_status_display(),
+        'company': companies[invoice.company_id],
+        'customer': {
+            'name': customer.name,
+            'address': ', '.join(part for part in (
+                customer.address, customer.city, customer.state, customer.pincode,
+            ) if part),
+            'phone': customer.phone,
+            'email': customer.email,
+            'gst_number': customer.gst_number,
+            'payment_terms': customer.payment_terms,
+        },
+        'items': [
+            (item.item_code, item.description, item.quantity, item.unit, item.unit_price,
+             item.discount_amount, item.tax_rate, item.tax_amount, item.total_price)
+            for item in invoice.items.all()
+        ],
+        'subtotal': invoice.subtotal,
+        'discount_percentage': invoice.discount_percentage,
+        'discount_amount': invoice.discount_amount,
+        'tax_rate': invoice.tax_rate,
+        'tax_amount': invoice.tax_amount,
+        'total_amount': invoice.total_amount,
+        'notes': invoice.notes,
+        'terms_conditions': invoice.terms_conditions,
+    }
+
+
+def extract(invoices, chunk_size=CHUNK_SIZE):
+    """invoice_data() of each invoice of a queryset, read chunk by chunk"""
+    companies = {}
+    invoices = invoices.select_related('customer', 'company').prefetch_related('items')
+    for invoice in invoices.iterator(chunk_size=chunk_size):
+        yield invoice_data(invoice, companies)
+
+
+def filename(data):
+    return f"{data['number'].replace('/', '-')}.pdf"
+
+
+# Amounts
+
+_ONES = [
+    '', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten', 'Eleven',
+    'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen',
+]
+_TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+
+
+def _below_thousand(number):
+    words = []
+    if number >= 100:
+        words += [_ONES[number // 100], 'Hundred']
+        number %= 100
+    if number >= 20:
+        words.append(_TENS[number // 10])
+        number %= 10
+    if number:
+        words.append(_ONES[number])
+    return words
+
+
+def _number_words(number):
+    words = []
+    crores, number = divmod(number, 10 ** 7)
+    if crores:
+        words += _number_words(crores) + ['Crore']
+    for name, size in (('Lakh', 10 ** 5), ('Thousand', 1000)):
+        count, number = divmod(number, size)
+        if count:
+            words += _below_thousand(count) + [name]
+    return words + _below_thousand(number)
+
+
+def amount_in_words(amount):
+    """Rupees and paise in words, in the Indian system (lakh, crore)"""
+    amount = money(amount)
+    rupees, paise = int(amount), int(amount % 1 * 100)
+    text = ' '.join(_number_words(rupees) or ['Zero']) + ' Rupees'
+    if paise:
+        text += ' and ' + ' '.join(_below_thousand(paise)) + ' Paise'
+    return text + ' Only'
+
+
+def _amount(value, currency):
+    return f'{currency}{value:,.2f}'
+
+
+def _quantity(value):
+    return f'{value.normalize():f}' if isinstance(value, Decimal) else str(value)
+
+
+# Per-process caches
+
+def _font(family, files):
+    """Regular and bold font names and the currency prefix they can print"""
+    key = (family, files)
+    if key not in _fonts:
+        if files:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            names = (f'Invoice-{family}', f'Invoice-{family}-Bold')
+            for name, path in zip(names, files):
+                pdfmetrics.registerFont(TTFont(name, path))
+            _fonts[key] = (*names, '₹')
+        else:
+            _fonts[key] = (*_BUILTIN[family], 'Rs. ')
+    return _fonts[key]
+
+
+class _Compiled:
+    """Paragraph styles, colours and fonts of one template"""
+
+    def __init__(self, style):
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_RIGHT
+        from reportlab.lib.styles import ParagraphStyle
+
+        self.settings = dict(style)
+        self.regular, self.bold, self.currency = _font(*self.settings['font'])
+        self.primary = self._colour(self.settings['primary_color'], '#c2185b')
+        self.secondary = self._colour(self.settings['secondary_color'], '#512da8')
+        self.grey = colors.HexColor('#6b7280')
+        self.line = colors.HexColor('#e5e7eb')
+        self.body = ParagraphStyle('body', fontName=self.regular, fontSize=8.5, leading=11)
+        self.small = ParagraphStyle('small', parent=self.body, fontSize=7.5, leading=9.5, textColor=self.grey)
+        self.heading = ParagraphStyle('heading', parent=self.body, fontName=self.bold, fontSize=9.5,
+                                      leading=13, textColor=self.secondary, spaceBefore=6, spaceAfter=2)
+        self.company = ParagraphStyle('company', parent=self.body, fontName=self.bold, fontSize=15,
+                                      leading=18, textColor=self.primary)
+        self.title = ParagraphStyle('title', parent=self.body, fontName=self.bold, fontSize=16,
+                                    leading=20, textColor=self.primary, alignment=TA_RIGHT)
+        self.right = ParagraphStyle('right', parent=self.body, alignment=TA_RIGHT)
+        self.cell = ParagraphStyle('cell', parent=self.body, fontSize=8, leading=10)
+
+    @staticmethod
+    def _colour(value, default):
+        from reportlab.lib import colors
+        try:
+            return colors.HexColor(value or default)
+        except ValueError:
+            return colors.HexColor(default)
+
+    def columns(self):
+        """Item table columns: (header, width in mm, right aligned)"""
+        template_type = self.settings['template_type']
+        columns = [('#', 8, False), ('Description', 0, False)]
+        if template_type != 'minimal':
+            columns.append(('HSN', 16, False))
+        columns += [('Qty', 18, True), ('Rate', 22, True)]
+        if template_type == 'detailed':
+            columns.append(('Disc.', 20, True))
+        columns += [('GST', 30, True), ('Amount', 26, True)]
+        return columns
+
+
+def _compiled(style):
+    if style not in _styles:
+        _styles[style] = _Compiled(style)
+    return _styles[style]
+
+
+def _logo(logo):
+    """The company logo, downscaled and flattened to a JPEG once: (path, width / height)
+
+    A JPEG is embedded in the PDF as it is, where any other image would be
+    decoded, compressed and encoded again for every invoice. The JPEG is kept
+    in the temporary directory, named after the source file and its mtime, so
+    all workers share it.
+    """
+    if logo not in _logos:
+        import hashlib
+        import tempfile
+        from PIL import Image
+
+        source, mtime = logo
+        directory = os.path.join(tempfile.gettempdir(), 'billing-pdf-logos')
+        path = os.path.join(directory, hashlib.sha1(f'{source}:{mtime}'.encode()).hexdigest() + '.jpg')
+        try:
+            with Image.open(source) as image:
+                image.thumbnail((LOGO_PIXELS, LOGO_PIXELS))
+                ratio = image.width / image.height
+                if not os.path.exists(path):
+                    flat = Image.new('RGB', image.size, 'white')
+                    rgba = image.convert('RGBA')
+                    flat.paste(rgba, mask=rgba)
+                    os.makedirs(directory, exist_ok=True)
+                    partial = f'{path}.{os.getpid()}'
+                    flat.save(partial, 'JPEG', quality=90)
+                    os.replace(partial, path)
+            _logos[logo] = (path, ratio)
+        except OSError:
+            _logos[logo] = None
+    return _logos[logo]
+
+
+# Drawing
+
+def _escape(value):
+    from xml.sax.saxutils import escape
+    return escape(str(value)).replace('\n', '<br/>')
+
+
+def _lines(*values):
+    return '<br/>'.join(_escape(value) for value in values if value)
+
+
+def _header(data, compiled, width):
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Image, Paragraph, Table, TableStyle
+
+    template = compiled.settings
+    company = data['company']
+    left = []
+    logo = _logo(company['logo']) if template['show_logo'] and company['logo'] else None
+    if logo:
+        path, ratio = logo
+        height = min(18 * mm, 60 * mm / ratio)
+        left.append(Image(path, width=height * ratio, height=height))
+    left.append(Paragraph(_escape(company['name']), compiled.company))
+    if template['show_company_details']:
+        left.append(Paragraph(_lines(
+            company['address'],
+            ' | '.join(part for part in (company['phone'], company['email'], company['website']) if part),
+            f"GSTIN: {company['gst_number']}  PAN: {company['pan_number']}",
+        ), compiled.small))
+
+    right = [
+        Paragraph('TAX INVOICE', compiled.title),
+        Paragraph(_lines(
+            f"Invoice No: {data['number']}",
+            f"Date: {data['date']:%d/%m/%Y}",
+            f"Due Date: {data['due_date']:%d/%m/%Y}",
+            f"Status: {data['status']}",
+        ), compiled.right),
+    ]
+    table = Table([[left, right]], colWidths=[width * 0.6, width * 0.4])
+    table.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LINEBELOW', (0, 0), (-1, 0), 1.5, compiled.primary),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('LEFTPADDING', (0, 0), (0, -1), 0),
+        ('RIGHTPADDING', (-1, 0), (-1, -1), 0),
+    ]))
+    return table
+
+
+def _bill_to(data, compiled):
+    from reportlab.platypus import Paragraph
+
+    customer = data['customer']
+    story = [Paragraph('Bill To', compiled.heading)]
+    details = [f"<font name='{compiled.bold}'>{_escape(customer['name'])}</font>"]
+    if compiled.settings['show_customer_details']:
+        details.append(_lines(
+            customer['address'],
+            ' | '.join(part for part in (customer['phone'], customer['email']) if part),
+            f"GSTIN: {customer['gst_number']}" if customer['gst_number'] else None,
+        ))
+    story.append(Paragraph('<br/>'.join(part for part in details if part), compiled.body))
+    return story
+
+
+def _items(data, compiled, width):
+    from reportlab.lib import colors
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, Table, TableStyle
+
+    columns = compiled.columns()
+    fixed = sum(column_width for header, column_width, right in columns) * mm
+    widths = [column_width * mm or width - fixed for header, column_width, right in columns]
+    currency = compiled.currency
+    rows = [[header for header, column_width, right in columns]]
+    for number, item in enumerate(data['items'], 1):
+        code, description, quantity, unit, unit_price, discount, tax_rate, tax, total = item
+        values = {
+            '#': str(number),
+            'Description': Paragraph(_escape(description), compiled.cell),
+            'HSN': code or '-',
+            'Qty': f'{_quantity(quantity)} {unit}',
+            'Rate': _amount(unit_price, currency),
+            'Disc.': _amount(discount, currency),
+            'GST': f'{_amount(tax, currency)} ({_quantity(tax_rate)}%)',
+            'Amount': _amount(total, currency),
+        }
+        rows.append([values[header] for header, column_width, right in columns])
+
+    commands = [
+        ('FONT', (0, 0), (-1, -1), compiled.regular, 8),
+        ('FONT', (0, 0), (-1, 0), compiled.bold, 8),
+        ('BACKGROUND', (0, 0), (-1, 0), compiled.primary),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('LINEBELOW', (0, 1), (-1, -1), 0.5, compiled.line),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]
+    for index, (header, column_width, right) in enumerate(columns):
+        if right:
+            commands.append(('ALIGN', (index, 0), (index, -1), 'RIGHT'))
+    table = Table(rows, colWidths=widths, repeatRows=1)
+    table.setStyle(TableStyle(commands))
+    return table
+
+
+def _totals(data, compiled, width):
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Table, TableStyle
+
+    currency = compiled.currency
+    half_rate = _quantity(data['tax_rate'] / 2)
+    cgst = money(data['tax_amount'] / 2)
+    rows = [['Subtotal', _amount(data['subtotal'], currency)]]
+    if data['discount_amount']:
+        rows.append([f"Discount ({_quantity(data['discount_percentage'])}%)",
+                     f"-{_amount(data['discount_amount'], currency)}"])
+    rows += [
+        [f'CGST @ {half_rate}%', _amount(cgst, currency)],
+        [f'SGST @ {half_rate}%', _amount(data['tax_amount'] - cgst, currency)],
+        ['Total', _amount(data['total_amount'], currency)],
+    ]
+    table = Table(rows, colWidths=[45 * mm, 35 * mm], hAlign='RIGHT')
+    table.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), compiled.regular, 8.5),
+        ('FONT', (0, -1), (-1, -1), compiled.bold, 10),
+        ('TEXTCOLOR', (0, -1), (-1, -1), compiled.primary),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, compiled.primary),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ]))
+    return table
+
+
+def _closing(data, compiled):
+    from reportlab.platypus import Paragraph
+
+    template = compiled.settings
+    company = data['company']
+    story = [
+        Paragraph('Amount in Words', compiled.heading),
+        Paragraph(_escape(amount_in_words(data['total_amount'])), compiled.body),
+    ]
+    if template['show_company_details']:
+        story += [
+            Paragraph('Bank Details', compiled.heading),
+            Paragraph(_lines(
+                f"Bank: {company['bank_name']}",
+                f"Account No: {company['account_number']}",
+                f"IFSC: {company['ifsc_code']}",
+            ), compiled.body),
+        ]
+    if template['show_payment_terms']:
+        story += [
+            Paragraph('Payment Terms', compiled.heading),
+            Paragraph(_escape(f"Payment due within {data['customer']['payment_terms']} days, "
+                              f"by {data['due_date']:%d/%m/%Y}."), compiled.body),
+        ]
+    if template['show_notes'] and data['notes']:
+        story += [Paragraph('Notes', compiled.heading), Paragraph(_escape(data['notes']), compiled.body)]
+    terms = data['terms_conditions'] or template['terms_conditions']
+    if terms:
+        story += [Paragraph('Terms & Conditions', compiled.heading), Paragraph(_escape(terms), compiled.small)]
+    return story
+
+
+def render(data, style):
+    """The PDF of one invoice_data() dictionary, drawn with a template_style()"""
+    _reportlab()
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    compiled = _compiled(style)
+    footer = compiled.settings['footer_text']
+
+    def decorate(canvas, document):
+        canvas.saveState()
+        canvas.setFont(compiled.regular, 7)
+        canvas.setFillColor(compiled.grey)
+        if footer:
+            canvas.drawCentredString(A4[0] / 2, 10 * mm, footer.replace('\n', ' ')[:160])
+        canvas.drawRightString(A4[0] - 15 * mm, 10 * mm, f"{data['number']} · Page {document.page}")
+        canvas.restoreState()
+
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=18 * mm,
+        title=f"Invoice {data['number']}", author=data['company']['name'],
+    )
+    story = []
+    if compiled.settings['header_text']:
+        story += [Paragraph(_escape(compiled.settings['header_text']), compiled.small), Spacer(0, 3 * mm)]
+    story += [_header(data, compiled, document.width), Spacer(0, 3 * mm)]
+    story += _bill_to(data, compiled)
+    story += [Spacer(0, 4 * mm), _items(data, compiled, document.width), Spacer(0, 3 * mm),
+              _totals(data, compiled, document.width)]
+    story += _closing(data, compiled)
+    document.build(story, onFirstPage=decorate, onLaterPages=decorate)
+    return buffer.getvalue()
+
+
+# Bulk rendering
+
+def _workers(workers):
+    if workers is None:
+        workers = getattr(settings, 'BILLING_PDF_WORKERS', None) or os.cpu_count() or 1
+    return max(1, workers)
+
+
+def render_many(invoices, style=None, workers=None, chunk_size=CHUNK_SIZE):
+    """Yields (data, pdf bytes) for each invoice of a queryset, in queryset order"""
+    _reportlab()
+    if style is None:
+        style = active_style()
+    workers = _workers(workers)
+    if workers > 1 and invoices.count() < PARALLEL_THRESHOLD:
+        workers = 1
+    if workers == 1:
+        for data in extract(invoices, chunk_size):
+            yield data, render(data, style)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for data in extract(invoices, chunk_size):
+            pending.append((data, executor.submit(render, data, style)))
+            if len(pending) >= workers * IN_FLIGHT:
+                data, future = pending.popleft()
+                yield data, future.result()
+        while pending:
+            data, future = pending.popleft()
+            yield data, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def zip_stream(rendered):
+    """Yields the bytes of a zip archive of (data, pdf bytes) pairs, one invoice at a time"""
+    from shop.exports import _Chunks
+
+    sink = _Chunks()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for data, content in rendered:
+            # PDF page streams are already compressed, so the files are stored as they are
+            info = zipfile.ZipInfo(filename(data), date_time=data['date'].timetuple()[:6])
+            archive.writestr(info, content)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def response(invoice):
+    """HttpResponse with the PDF of one invoice"""
+    from django.http import HttpResponse
+
+    data = invoice_data(invoice)
+    pdf = render(data, active_style())
+    http_response = HttpResponse(pdf, content_type='application/pdf')
+    http_response['Content-Disposition'] = f'inline; filename="{filename(data)}"'
+    return http_response
+
+
+def zip_response(invoices, name, workers=None):
+    """StreamingHttpResponse downloading the PDFs of a queryset of invoices as one zip"""
+    from django.http import StreamingHttpResponse
+
+    _reportlab()
+    http_response = StreamingHttpResponse(zip_stream(render_many(invoices, workers=workers)),
+                                          content_type='application/zip')
+    http_response['Content-Disposition'] = f'attachment; filename="{name}.zip"'
+    return http_response
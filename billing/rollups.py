@@ -0,0 +1,172 @@
+"""
+Revenue rollups for the billing dashboard.
+
+RevenueRollup holds, per customer and per day and calendar month, how many
+invoices were dated in the period, how much of that is still outstanding,
+and how many invoices were paid in it and for how much. The dashboard sums a
+handful of these rows instead of aggregating the invoice table, so its cost
+does not grow with billing history.
+
+Every invoice contributes to a few rollup rows, decided only by its
+customer, date, paid_date, status and total. When an invoice is saved or
+deleted (billing/signals.py) its old contribution is subtracted and the new
+one added with UPDATE ... SET x = x + delta, so concurrent saves never
+overwrite each other's counts. Changes that skip signals (QuerySet.update,
+bulk_create) are not seen: run `rebuild_revenue_rollups` after them.
+"""
+from collections import defaultdict
+from datetime import date as date_cls
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+from django.utils import timezone
+
+
+PERIODS = {'day': TruncDay, 'month': TruncMonth}
+
+# Sent but not paid or cancelled
+OUTSTANDING_STATUSES = ('sent', 'viewed', 'overdue')
+
+# The invoice fields a contribution depends on
+INVOICE_FIELDS = ['customer_id', 'date', 'paid_date', 'status', 'total_amount']
+
+COUNTERS = ['invoice_count', 'outstanding_count', 'outstanding_amount', 'paid_count', 'paid_revenue']
+
+
+def period_start(period, day):
+    return day.replace(day=1) if period == 'month' else day
+
+
+def _local_date(value):
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def invoice_values(invoice):
+    return {field: getattr(invoice, field) for field in INVOICE_FIELDS}
+
+
+def contribution(values):
+    """{(period, period_start, customer_id): {counter: amount}} for one invoice's stored values"""
+    rows = defaultdict(lambda: defaultdict(int))
+    total = Decimal(values['total_amount'] or 0)
+    for period in PERIODS:
+        issued = rows[period, period_start(period, values['date']), values['customer_id']]
+        issued['invoice_count'] += 1
+        if values['status'] in OUTSTANDING_STATUSES:
+            issued['outstanding_count'] += 1
+            issued['outstanding_amount'] += total
+        if values['status'] == 'paid' and values['paid_date']:
+            paid = rows[period, period_start(period, _local_date(values['paid_date'])), values['customer_id']]
+            paid['paid_count'] += 1
+            paid['paid_revenue'] += total
+    return rows
+
+
+def record_change(previous, current):
+    """Move an invoice's contribution from its previous values to its current ones (either may be None)"""
+    old = contribution(previous) if previous else {}
+    new = contribution(current) if current else {}
+    changes = defaultdict(lambda: defaultdict(int))
+    for key, counters in new.items():
+        for name, amount in counters.items():
+            changes[key][name] += amount
+    for key, counters in old.items():
+        for name, amount in counters.items():
+            changes[key][name] -= amount
+
+    for key, counters in changes.items():
+        counters = {name: amount for name, amount in counters.items() if amount}
+        if counters:
+            # Rows are only created for what an invoice adds; a missing row has nothing to subtract from
+            _apply(key, counters, create=key in new)
+
+
+def _apply(key, counters, create):
+    from .advanced_models import RevenueRollup
+
+    period, start, customer_id = key
+    rows = RevenueRollup.objects.filter(period=period, period_start=start, customer_id=customer_id)
+    changes = {name: F(name) + amount for name, amount in counters.items()}
+    if rows.update(**changes) or not create:
+        return
+    try:
+        with transaction.atomic():
+            RevenueRollup.objects.create(period=period, period_start=start, customer_id=customer_id, **counters)
+    except IntegrityError:
+        # Created by a concurrent save in the meantime
+        rows.update(**changes)
+
+
+def rebuild():
+    """Recompute every rollup row from the invoices; returns the number of rows"""
+    from .advanced_models import AdvancedInvoice, RevenueRollup
+
+    # Migration billing 0004 fills the rollups the same way; keep the two in step
+    rows = defaultdict(dict)
+    outstanding = Q(status__in=OUTSTANDING_STATUSES)
+    for period, trunc in PERIODS.items():
+        issued = AdvancedInvoice.objects.annotate(start=trunc('date')).values('customer_id', 'start').annotate(
+            invoice_count=Count('id'),
+            outstanding_count=Count('id', filter=outstanding),
+            outstanding_amount=Sum('total_amount', filter=outstanding),
+        ).order_by()
+        paid = AdvancedInvoice.objects.filter(status='paid', paid_date__isnull=False).annotate(
+            start=trunc('paid_date', output_field=DateField())
+        ).values('customer_id', 'start').annotate(
+            paid_count=Count('id'),
+            paid_revenue=Sum('total_amount'),
+        ).order_by()
+        for group in list(issued) + list(paid):
+            key = (period, group.pop('start'), group.pop('customer_id'))
+            rows[key].update({name: value for name, value in group.items() if value is not None})
+
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        RevenueRollup.objects.bulk_create([
+            RevenueRollup(period=period, period_start=start, customer_id=customer_id, **counters)
+            for (period, start, customer_id), counters in rows.items()
+        ], batch_size=1000)
+    return len(rows)
+
+
+# Dashboard reads
+
+def totals():
+    """Invoice count, paid count, paid revenue and outstanding amount over all time"""
+    from .advanced_models import RevenueRollup
+
+    result = RevenueRollup.objects.filter(period='month').aggregate(
+        **{name: Sum(name) for name in COUNTERS}
+    )
+    return {name: value or 0 for name, value in result.items()}
+
+
+def monthly_revenue(months=6, today=None):
+    """Paid revenue for the last `months` calendar months, oldest first, including the current one"""
+    from .advanced_models import RevenueRollup
+
+    today = today or timezone.localdate()
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        starts.append(date_cls(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    starts.reverse()
+
+    revenue = dict(
+        RevenueRollup.objects.filter(period='month', period_start__gte=starts[0])
+        .values('period_start').annotate(total=Sum('paid_revenue')).values_list('period_start', 'total')
+    )
+    return [{'month': start.strftime('%b %Y'), 'revenue': float(revenue.get(start) or 0)} for start in starts]
+
+
+def top_customers(limit=5):
+    """Customers by paid revenue, annotated with total_spent and invoice_count"""
+    from .advanced_models import AdvancedCustomer
+
+    return AdvancedCustomer.objects.filter(revenue_rollups__period='month').annotate(
+        total_spent=Sum('revenue_rollups__paid_revenue'),
+        invoice_count=Sum('revenue_rollups__invoice_count'),
+    ).order_by('-total_spent')[:limit]
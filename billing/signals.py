@@ -0,0 +1,36 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import rollups
+from .advanced_models import AdvancedInvoice
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+ROLLUP_FIELDS = ['customer', 'date', 'paid_date', 'status', 'total_amount']
+
+
+@receiver(pre_save, sender=AdvancedInvoice)
+def remember_invoice_state(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is not None and _touches(update_fields, ROLLUP_FIELDS):
+        # Locked until the save's transaction ends, so concurrent saves apply their deltas in turn
+        instance._rollup_previous = sender.objects.select_for_update().filter(
+            pk=instance.pk
+        ).values(*rollups.INVOICE_FIELDS).first()
+
+
+@receiver(post_save, sender=AdvancedInvoice)
+def update_rollups_on_invoice_save(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the dashboard revenue rollups in step with invoice saves, including mark_as_paid"""
+    if not _touches(update_fields, ROLLUP_FIELDS):
+        return
+    previous = None if created else getattr(instance, '_rollup_previous', None)
+    rollups.record_change(previous, rollups.invoice_values(instance))
+    instance._rollup_previous = None
+
+
+@receiver(post_delete, sender=AdvancedInvoice)
+def update_rollups_on_invoice_delete(sender, instance, **kwargs):
+    rollups.record_change(rollups.invoice_values(instance), None)
@@ -1,3 +1,259 @@
-from django.test import TestCase
+import csv
+import io
+import threading
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import rollups
+from .advanced_models import (
+    AdvancedCompanyProfile, AdvancedCustomer, AdvancedInvoice, AdvancedInvoiceItem, InvoiceNumberCounter,
+    RevenueRollup,
+)
+from .exports import CUSTOMERS
+from .numbering import InvoiceNumberError, financial_year, format_invoice_number, reserve_invoice_numbers
+
+
+class RolledBack(Exception):
+    pass
+
+
+class InvoiceNumberFormatTests(SimpleTestCase):
+
+    def test_financial_year_starts_in_april(self):
+        self.assertEqual(financial_year(date(2026, 3, 31)), 2025)
+        self.assertEqual(financial_year(date(2026, 4, 1)), 2026)
+        self.assertEqual(financial_year(date(2026, 12, 31)), 2026)
+        self.assertEqual(financial_year(date(2027, 1, 1)), 2026)
+
+    def test_format(self):
+        self.assertEqual(format_invoice_number('INV', 2025, 1), 'INV/25-26/0001')
+        self.assertEqual(format_invoice_number('INV', 2099, 12345), 'INV/99-00/12345')
+        self.assertEqual(len(format_invoice_number('ABCDE', 2025, 9999)), 16)
+
+    def test_numbers_longer_than_16_characters_are_refused(self):
+        with self.assertRaises(InvoiceNumberError):
+            format_invoice_number('ABCDEF', 2025, 1)
+        with self.assertRaises(InvoiceNumberError):
+            format_invoice_number('ABCDE', 2025, 10000)
+        with self.assertRaises(InvoiceNumberError):
+            format_invoice_number('IN V', 2025, 1)
+
+
+class CompanyPrefixTests(TestCase):
+
+    def test_prefix_must_fit_the_number(self):
+        company = AdvancedCompanyProfile(invoice_prefix='KINGDH')
+        with self.assertRaises(ValidationError) as raised:
+            company.full_clean()
+        self.assertIn('invoice_prefix', raised.exception.message_dict)
+
+        company.invoice_prefix = 'KDH/R'
+        company.full_clean()
+
+    def test_prefix_is_unique(self):
+        AdvancedCompanyProfile.objects.create(invoice_prefix='KDH')
+        with self.assertRaises(ValidationError):
+            AdvancedCompanyProfile(invoice_prefix='KDH').full_clean()
+        with self.assertRaises(IntegrityError):
+            AdvancedCompanyProfile.objects.create(invoice_prefix='KDH')
+
+
+class InvoiceCreateViewTests(TestCase):
+
+    def setUp(self):
+        # Saved before prefixes were limited to five characters
+        self.company = AdvancedCompanyProfile.objects.create(id=1, invoice_prefix='KINGDH')
+        User = get_user_model()
+        self.client.force_login(User.objects.create_superuser(username='staff', email='staff@example.com',
+                                                              password='x'))
+
+    def test_unusable_prefix_is_reported_not_raised(self):
+        response = self.client.post(reverse('billing:advanced_invoice_create'), {'date': '2026-05-15'}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AdvancedInvoice.objects.exists())
+        self.assertIn('Change the invoice prefix', ' '.join(str(message) for message in response.context['messages']))
+
+
+class InvoiceNumberingTests(TransactionTestCase):
+    """Gapless per-series invoice numbers (see numbering.py)"""
+
+    invoice_date = date(2026, 5, 15)
+
+    def setUp(self):
+        self.company = AdvancedCompanyProfile.objects.create(invoice_prefix='INV')
+        self.customer = AdvancedCustomer.objects.create(name='Test Customer')
+
+    def create_invoice(self, invoice_date=None, fail=False):
+        invoice_date = invoice_date or self.invoice_date
+        with transaction.atomic():
+            invoice = AdvancedInvoice(customer=self.customer, company=self.company, date=invoice_date,
+                                      due_date=invoice_date)
+            invoice.save()
+            if fail:
+                raise RolledBack
+        return invoice.invoice_number
+
+    def issued(self):
+        return sorted(AdvancedInvoice.objects.values_list('invoice_number', flat=True))
+
+    def test_rolled_back_save_gives_its_number_back(self):
+        self.assertEqual(self.create_invoice(), 'INV/26-27/0001')
+        with self.assertRaises(RolledBack):
+            self.create_invoice(fail=True)
+        self.assertEqual(self.create_invoice(), 'INV/26-27/0002')
+        self.assertEqual(self.issued(), ['INV/26-27/0001', 'INV/26-27/0002'])
+
+    def test_april_starts_a_new_series(self):
+        self.assertEqual(self.create_invoice(date(2026, 3, 30)), 'INV/25-26/0001')
+        self.assertEqual(self.create_invoice(date(2026, 3, 31)), 'INV/25-26/0002')
+        self.assertEqual(self.create_invoice(date(2026, 4, 1)), 'INV/26-27/0001')
+        # An invoice dated back into the old year continues its series
+        self.assertEqual(self.create_invoice(date(2026, 3, 31)), 'INV/25-26/0003')
+        self.assertEqual(InvoiceNumberCounter.objects.filter(company=self.company).count(), 2)
+
+    def test_companies_number_separately(self):
+        other = AdvancedCompanyProfile.objects.create(invoice_prefix='KDH')
+        self.create_invoice()
+        invoice = AdvancedInvoice(customer=self.customer, company=other, date=self.invoice_date,
+                                  due_date=self.invoice_date)
+        invoice.save()
+        self.assertEqual(invoice.invoice_number, 'KDH/26-27/0001')
+
+    def test_reserved_range_is_consecutive(self):
+        self.create_invoice()
+        self.assertEqual(reserve_invoice_numbers(self.company, 3, self.invoice_date),
+                         ['INV/26-27/0002', 'INV/26-27/0003', 'INV/26-27/0004'])
+        self.assertEqual(self.create_invoice(), 'INV/26-27/0005')
+
+    def test_full_series_is_not_advanced(self):
+        self.company.invoice_prefix = 'ABCDE'
+        self.company.save()
+        InvoiceNumberCounter.objects.create(company=self.company, prefix='ABCDE', financial_year=2026,
+                                            next_value=10000)
+        with self.assertRaises(InvoiceNumberError):
+            self.create_invoice()
+        self.assertEqual(InvoiceNumberCounter.objects.get(company=self.company).next_value, 10000)
+
+    def test_concurrent_saves_have_no_gaps_or_duplicates(self):
+        threads, invoices = 8, 10
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        def create(number):
+            try:
+                barrier.wait()
+                for index in range(invoices):
+                    try:
+                        # Every third save fails after its number was taken
+                        self.create_invoice(fail=(number + index) % 3 == 0)
+                    except RolledBack:
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=create, args=(number,)) for number in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        issued = self.issued()
+        self.assertEqual(len(issued), len(set(issued)))
+        self.assertEqual(issued, [format_invoice_number('INV', 2026, value) for value in range(1, len(issued) + 1)])
+        saved = sum((number + index) % 3 != 0 for number in range(threads) for index in range(invoices))
+        self.assertEqual(len(issued), saved)
+
+
+class CustomerExportTests(TestCase):
+
+    def setUp(self):
+        AdvancedCustomer.objects.create(
+            name='=HYPERLINK("http://example.com","Open")', phone='+91-9876543210', email='@buyer',
+            address='-1 Aminabad', gst_number='\tcmd',
+        )
+        AdvancedCustomer.objects.create(name='Safe Customer', phone='9876543210', address='1 Aminabad')
+
+    def test_csv_cells_are_never_formulas(self):
+        content = ''.join(CUSTOMERS.stream(AdvancedCustomer.objects.order_by('pk'), 'csv'))
+        header, risky, safe = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(risky[:5], [
+            '\'=HYPERLINK("http://example.com","Open")', "'@buyer", "'+91-9876543210", "'-1 Aminabad", "'\tcmd",
+        ])
+        self.assertEqual(safe[:3], ['Safe Customer', '', '9876543210'])
+
+    def test_xlsx_cells_are_inline_strings(self):
+        content = b''.join(CUSTOMERS.stream(AdvancedCustomer.objects.order_by('pk'), 'xlsx'))
+        sheet = zipfile.ZipFile(io.BytesIO(content)).read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<c t="inlineStr"><is><t xml:space="preserve">+91-9876543210</t></is></c>', sheet)
+        self.assertNotIn('<f>', sheet)
+
+
+class RevenueRollupTests(TestCase):
+    """Invoice saves and deletes keep the revenue rollups equal to a fresh aggregate of the invoices"""
+
+    def setUp(self):
+        self.company = AdvancedCompanyProfile.objects.create(invoice_prefix='INV')
+        self.customers = [AdvancedCustomer.objects.create(name=f'Customer {number}') for number in range(2)]
+
+    def invoice(self, day, amount, customer=None):
+        invoice = AdvancedInvoice(customer=customer or self.customers[0], company=self.company, date=day,
+                                  due_date=day)
+        invoice.save()
+        AdvancedInvoiceItem.objects.create(invoice=invoice, description='Dupatta', unit_price=Decimal(amount))
+        invoice.save()
+        return invoice
+
+    def stored(self):
+        counters = RevenueRollup.objects.values_list('period', 'period_start', 'customer_id', *rollups.COUNTERS)
+        # Rows that dropped to zero are kept by the incremental path and not created by a rebuild
+        return {row[:3]: row[3:] for row in counters if any(row[3:])}
+
+    def assertRollupsFresh(self):
+        incremental = self.stored()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.stored())
+
+    def test_invoice_changes(self):
+        march = self.invoice(date(2026, 3, 30), '1000')
+        self.assertRollupsFresh()
+        april = self.invoice(date(2026, 4, 2), '250', customer=self.customers[1])
+        self.assertRollupsFresh()
+
+        march.status = 'sent'
+        march.save()
+        self.assertRollupsFresh()
+        AdvancedInvoiceItem.objects.create(invoice=march, description='Stole', unit_price=Decimal('300'))
+        march.save()
+        self.assertRollupsFresh()
+        march.mark_as_paid('upi')
+        self.assertRollupsFresh()
+        # Paid in a later month than it was dated
+        march.paid_date = timezone.make_aware(datetime(2026, 5, 1, 0, 30))
+        march.save(update_fields=['paid_date'])
+        self.assertRollupsFresh()
+
+        april.customer = self.customers[0]
+        april.date = date(2026, 3, 31)
+        april.status = 'overdue'
+        april.save()
+        self.assertRollupsFresh()
+        april.status = 'cancelled'
+        april.save(update_fields=['status'])
+        self.assertRollupsFresh()
+
+        march.delete()
+        self.assertRollupsFresh()
+        april.delete()
+        self.assertRollupsFresh()
+        self.assertEqual(self.stored(), {})
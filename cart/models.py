@@ -1,10 +1,37 @@
+from collections import namedtuple
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from shop.models import Product, ProductVariant
 
 User = get_user_model()
 
 
+CartSummary = namedtuple('CartSummary', ['total_items', 'total_amount'])
+
+EMPTY_CART_SUMMARY = CartSummary(0, Decimal('0.00'))
+
+
+class CartItemQuerySet(models.QuerySet):
+    def summary(self):
+        """Item count and cart total (including variant surcharges) in one aggregate query"""
+        money = DecimalField(max_digits=12, decimal_places=2)
+        unit_price = F('product__selling_price') + Coalesce(
+            F('variant__additional_price'), Value(Decimal('0')), output_field=money
+        )
+        totals = self.aggregate(
+            total_items=Sum('quantity'),
+            total_amount=Sum(F('quantity') * unit_price, output_field=money),
+        )
+        return CartSummary(
+            totals['total_items'] or 0,
+            (totals['total_amount'] or Decimal('0')).quantize(Decimal('0.01')),
+        )
+
+
 class Cart(models.Model):
     """Shopping cart model"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
@@ -14,13 +41,16 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.get_full_name()}"
 
+    def get_summary(self):
+        return self.items.summary()
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.get_summary().total_items
 
     @property
     def total_amount(self):
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.get_summary().total_amount
 
     @property
     def is_eligible_for_free_shipping(self):
@@ -36,6 +66,8 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ['cart', 'product', 'variant']
 
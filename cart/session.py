@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+from shop.models import Product, ProductVariant
+from .models import CartSummary
+
+
+class SessionCartItem:
+    """Session cart line exposing the same interface as CartItem to templates"""
+
+    def __init__(self, id, product, quantity, variant=None):
+        self.id = id
+        self.product = product
+        self.variant = variant
+        self.quantity = quantity
+
+    def __str__(self):
+        variant_info = f" - {self.variant}" if self.variant else ""
+        return f"{self.product.name}{variant_info} x {self.quantity}"
+
+    def get_total_price(self):
+        price = self.product.selling_price
+        if self.variant and self.variant.additional_price:
+            price += self.variant.additional_price
+        return price * self.quantity
+
+    @property
+    def is_in_stock(self):
+        if self.variant:
+            return self.variant.stock_quantity >= self.quantity
+        return self.product.stock_quantity >= self.quantity
+
+
+def load_session_cart(session_cart):
+    """Build cart rows for an anonymous session cart in a constant number of queries.
+
+    Returns (items, summary) where items mirror the CartItem rows of the
+    authenticated cart so both branches render through the same template.
+    """
+    product_ids = set()
+    variant_ids = set()
+    for key, item_data in session_cart.items():
+        product_ids.add(int(item_data.get('product_id', key)))
+        if item_data.get('variant_id'):
+            variant_ids.add(int(item_data['variant_id']))
+
+    products = Product.objects.filter(
+        id__in=product_ids, is_active=True
+    ).in_bulk() if product_ids else {}
+    variants = ProductVariant.objects.filter(
+        id__in=variant_ids, is_active=True
+    ).in_bulk() if variant_ids else {}
+
+    items = []
+    total_items = 0
+    total_amount = Decimal('0.00')
+    for key, item_data in session_cart.items():
+        product = products.get(int(item_data.get('product_id', key)))
+        if product is None:
+            continue
+        variant = variants.get(int(item_data['variant_id'])) if item_data.get('variant_id') else None
+        item = SessionCartItem(key, product, item_data['quantity'], variant)
+        items.append(item)
+        total_items += item.quantity
+        total_amount += item.get_total_price()
+
+    return items, CartSummary(total_items, total_amount)
+
+
+def session_cart_summary(session_cart):
+    """Totals of a session cart at current prices, as cart_detail shows them"""
+    return load_session_cart(session_cart)[1]
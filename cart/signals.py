@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from shop.bulk import unless_muted
+from shop.models import Product, ProductVariant
+from shop.signals import after_commit
+from shop.versioning import bump_version
+from .models import Cart, CartItem
+from .summary import CART_PRICES_VERSION, invalidate_cart_summary
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_summary_on_item_change(sender, instance, **kwargs):
+    """Drop the cached cart summary whenever a cart line changes"""
+    invalidate_cart_summary(instance.cart.user_id)
+
+
+@receiver(post_delete, sender=Cart)
+def invalidate_summary_on_cart_delete(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@unless_muted
+def invalidate_summaries_on_price_change(sender, instance, update_fields=None, **kwargs):
+    """Re-price every cached cart summary after a product or variant price edit"""
+    price_fields = {'selling_price', 'additional_price'}
+    if update_fields is None or price_fields & set(update_fields):
+        # After commit, or another process could cache the old price under the new version
+        after_commit(bump_version, CART_PRICES_VERSION)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from shop.versioning import get_version, register
+from .models import CartItem, CartSummary, EMPTY_CART_SUMMARY
+
+
+# Bumped when product or variant prices change so cached totals are re-priced
+CART_PRICES_VERSION = register('cart_prices')
+
+
+def _summary_key(user_id):
+    return f'cart:summary:{user_id}'
+
+
+def get_cart_summary(user):
+    """Cart count and total for a user, cached until the cart or prices change.
+
+    Set CART_SUMMARY_CACHE_TIMEOUT to 0 to always hit the database.
+    """
+    if not user.is_authenticated:
+        return EMPTY_CART_SUMMARY
+
+    timeout = getattr(settings, 'CART_SUMMARY_CACHE_TIMEOUT', 300)
+    if not timeout:
+        return CartItem.objects.filter(cart__user=user).summary()
+
+    key = _summary_key(user.pk)
+    version = get_version(CART_PRICES_VERSION)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return CartSummary(*cached[1])
+
+    summary = CartItem.objects.filter(cart__user=user).summary()
+    cache.set(key, (version, tuple(summary)), timeout)
+    return summary
+
+
+def invalidate_cart_summary(user_id):
+    cache.delete(_summary_key(user_id))
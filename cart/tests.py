@@ -1,3 +1,61 @@
+import json
+from decimal import Decimal
+
 from django.test import TestCase
+from django.urls import reverse
+
+from shop.benchmarks import build_synthetic_catalog
+from shop.models import Product
+from shop.versioning import get_version
+from .summary import CART_PRICES_VERSION
+
+
+class SessionCartPricingTests(TestCase):
+    """The cart page and the AJAX cart endpoints price a session cart the same way, at current prices"""
+
+    def setUp(self):
+        build_synthetic_catalog(2)
+        self.first, self.second = Product.objects.order_by('pk')
+        for product, quantity in ((self.first, 2), (self.second, 1)):
+            self.client.post(reverse('cart:ajax_add_to_cart'), json.dumps({'product_id': product.pk, 'quantity': quantity}),
+                             content_type='application/json')
+        # The price changes after the items were added
+        Product.objects.filter(pk=self.first.pk).update(selling_price=Decimal('999.00'))
+
+    def page_total(self):
+        return float(self.client.get(reverse('cart:cart_detail')).context['cart_total'])
+
+    def post(self, view_name, **data):
+        response = self.client.post(reverse(view_name), json.dumps(data), content_type='application/json')
+        return response.json()
+
+    def test_ajax_totals_match_the_cart_page(self):
+        expected = float(Decimal('999.00') * 2 + self.second.selling_price)
+        self.assertEqual(self.page_total(), expected)
+        self.assertEqual(self.client.get(reverse('cart:ajax_get_cart_count')).json()['cart_total'], expected)
+
+        updated = self.post('cart:ajax_update_cart', product_id=self.first.pk, quantity=3)
+        self.assertEqual(updated['cart_total'], self.page_total())
+        self.assertEqual(updated['cart_items_count'], 4)
+
+        removed = self.post('cart:ajax_remove_from_cart', product_id=self.second.pk)
+        self.assertEqual(removed['cart_total'], self.page_total())
+        self.assertEqual(removed['cart_total'], 2997.0)
+
+
+class CartPricesVersionTests(TestCase):
+    """A price edit re-prices cached cart summaries only once it is committed"""
+
+    def setUp(self):
+        build_synthetic_catalog(1)
+        self.product = Product.objects.get()
 
-# Create your tests here.
+    def test_version_is_bumped_after_commit(self):
+        before = get_version(CART_PRICES_VERSION)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.selling_price += 10
+            self.product.save(update_fields=['selling_price'])
+            self.assertEqual(get_version(CART_PRICES_VERSION), before)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_version(CART_PRICES_VERSION), before)
@@ -7,17 +7,15 @@ from django.conf import settings
 import json
 
 from .models import Cart, CartItem
+from .session import load_session_cart, session_cart_summary
+from .summary import get_cart_summary
 from shop.models import Product, ProductVariant, PromoCode, DeliveryOption
 
 
 def get_cart_count(request):
     """Get cart count for both authenticated and anonymous users"""
     if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            return cart.total_items
-        except Cart.DoesNotExist:
-            return 0
+        return get_cart_summary(request.user).total_items
     else:
         # For anonymous users, count session cart items
         cart = request.session.get('cart', {})
@@ -34,33 +32,14 @@ def cart_detail(request):
         # For logged-in users, use database cart
         try:
             cart = Cart.objects.get(user=request.user)
-            cart_items = cart.items.all().select_related('product', 'variant').prefetch_related('product__images')
-            cart_total = cart.total_amount
-            cart_items_count = cart.total_items
+            cart_items = cart.items.all().select_related('product', 'variant')
+            cart_items_count, cart_total = get_cart_summary(request.user)
         except Cart.DoesNotExist:
             cart = None
     else:
         # For anonymous users, use session cart
         session_cart = request.session.get('cart', {})
-        cart_items = []
-        cart_total = 0
-        
-        for product_id, item_data in session_cart.items():
-            try:
-                product = Product.objects.get(id=product_id, is_active=True)
-                quantity = item_data['quantity']
-                price = item_data['price']
-                
-                cart_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'price': price,
-                    'total': quantity * price
-                })
-                cart_total += quantity * price
-                cart_items_count += quantity
-            except Product.DoesNotExist:
-                continue
+        cart_items, (cart_items_count, cart_total) = load_session_cart(session_cart)
     
     # Get active promo codes and delivery options
     promo_codes = PromoCode.objects.filter(is_active=True)
@@ -294,13 +273,13 @@ def ajax_update_cart(request):
             else:
                 cart_item.delete()
             
-            cart = cart_item.cart
-            cart_items_count = cart.total_items
-            cart_total = float(cart.total_amount)
+            summary = get_cart_summary(request.user)
+            cart_items_count = summary.total_items
+            cart_total = float(summary.total_amount)
         else:
-            # For anonymous users
+            # For anonymous users (session rows use the product id as item id)
             cart = request.session.get('cart', {})
-            product_key = str(product_id)
+            product_key = str(product_id or item_id)
             
             if quantity > 0:
                 if product_key in cart:
@@ -312,9 +291,10 @@ def ajax_update_cart(request):
             request.session['cart'] = cart
             request.session.modified = True
             
-            # Calculate totals for anonymous users
-            cart_items_count = sum(item['quantity'] for item in cart.values())
-            cart_total = sum(item['quantity'] * item['price'] for item in cart.values())
+            # Priced from the products, not the price stored when the item was added
+            summary = session_cart_summary(cart)
+            cart_items_count = summary.total_items
+            cart_total = float(summary.total_amount)
         
         return JsonResponse({
             'success': True,
@@ -345,24 +325,25 @@ def ajax_remove_from_cart(request):
                 id=item_id,
                 cart__user=request.user
             )
-            cart = cart_item.cart
             cart_item.delete()
             
-            cart_items_count = cart.total_items
-            cart_total = float(cart.total_amount)
+            summary = get_cart_summary(request.user)
+            cart_items_count = summary.total_items
+            cart_total = float(summary.total_amount)
         else:
-            # For anonymous users
+            # For anonymous users (session rows use the product id as item id)
             cart = request.session.get('cart', {})
-            product_key = str(product_id)
+            product_key = str(product_id or item_id)
             
             if product_key in cart:
                 del cart[product_key]
                 request.session['cart'] = cart
                 request.session.modified = True
             
-            # Calculate totals for anonymous users
-            cart_items_count = sum(item['quantity'] for item in cart.values())
-            cart_total = sum(item['quantity'] * item['price'] for item in cart.values())
+            # Priced from the products, not the price stored when the item was added
+            summary = session_cart_summary(cart)
+            cart_items_count = summary.total_items
+            cart_total = float(summary.total_amount)
         
         return JsonResponse({
             'success': True,
@@ -381,18 +362,13 @@ def ajax_remove_from_cart(request):
 def ajax_get_cart_count(request):
     """Get cart items count via AJAX - works for both authenticated and anonymous users"""
     try:
-        cart_count = get_cart_count(request)
-        
         if request.user.is_authenticated:
-            try:
-                cart = Cart.objects.get(user=request.user)
-                cart_total = float(cart.total_amount)
-            except Cart.DoesNotExist:
-                cart_total = 0
+            summary = get_cart_summary(request.user)
         else:
-            # For anonymous users, calculate total from session
-            cart = request.session.get('cart', {})
-            cart_total = sum(item['quantity'] * item['price'] for item in cart.values())
+            # Priced from the products, not the price stored when the item was added
+            summary = session_cart_summary(request.session.get('cart', {}))
+        cart_count = summary.total_items
+        cart_total = float(summary.total_amount)
         
         return JsonResponse({
             'success': True,
@@ -435,15 +411,10 @@ def validate_promo_code(request):
         
         # Get cart total for validation
         if request.user.is_authenticated:
-            try:
-                cart = Cart.objects.get(user=request.user)
-                cart_total = float(cart.total_amount)
-            except Cart.DoesNotExist:
-                cart_total = 0
+            cart_total = float(get_cart_summary(request.user).total_amount)
         else:
-            # For anonymous users, calculate from session
-            cart = request.session.get('cart', {})
-            cart_total = sum(item['quantity'] * item['price'] for item in cart.values())
+            # Priced from the products, not the price stored when the item was added
+            cart_total = float(session_cart_summary(request.session.get('cart', {})).total_amount)
         
         if cart_total < float(promo.min_order_amount):
             return JsonResponse({
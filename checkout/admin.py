@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Order, OrderItem, Coupon
+from .exports import ORDERS
+from .models import Order, OrderItem, Coupon, StockReservation
 
 
 class OrderItemInline(admin.TabularInline):
@@ -18,6 +19,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('order_number', 'user__email', 'user__first_name', 'user__last_name')
     readonly_fields = ('order_number', 'created_at', 'updated_at')
     inlines = [OrderItemInline]
+    actions = [ORDERS.admin_action('csv'), ORDERS.admin_action('xlsx')]
     
     fieldsets = (
         ('Order Information', {
@@ -59,3 +61,21 @@ class CouponAdmin(admin.ModelAdmin):
     list_filter = ('discount_type', 'is_active', 'valid_from', 'valid_to')
     search_fields = ('code', 'description')
     readonly_fields = ('used_count',)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Read-only: stock is returned by release_expired_reservations, not by deleting rows here"""
+    list_display = ('user', 'product', 'variant', 'quantity', 'expires_at', 'created_at')
+    list_filter = ('expires_at',)
+    search_fields = ('user__email', 'product__name')
+    list_select_related = ('user', 'product', 'variant')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,22 @@
+"""Exports of orders (see shop/exports.py)"""
+from shop.exports import Export
+
+
+ORDERS = Export('orders', [
+    ('Order Number', 'order_number'),
+    ('Placed', 'created_at'),
+    ('Customer Email', 'user__email'),
+    ('Name', 'shipping_full_name'),
+    ('Phone', 'shipping_phone'),
+    ('City', 'shipping_city'),
+    ('State', 'shipping_state'),
+    ('PIN Code', 'shipping_pin_code'),
+    ('Status', 'status'),
+    ('Payment Status', 'payment_status'),
+    ('Payment Method', 'payment_method'),
+    ('Subtotal', 'subtotal'),
+    ('Shipping', 'shipping_cost'),
+    ('Discount', 'discount_amount'),
+    ('Total', 'total_amount'),
+    ('Tracking Number', 'tracking_number'),
+])
@@ -0,0 +1,180 @@
+"""
+Stock decrements and checkout reservations.
+
+Stock is only ever changed with conditional UPDATEs,
+
+    UPDATE ... SET stock_quantity = stock_quantity - n WHERE id = ... AND stock_quantity >= n
+
+one statement per table for all lines at once (the amounts come from a CASE
+on the id), so concurrent buyers cannot take more than there is and the
+query count does not depend on the number of lines. If fewer rows are
+updated than requested some line is short: InsufficientStock is raised and
+the surrounding transaction rolls the other decrements back.
+
+Lines with a variant draw on ProductVariant.stock_quantity, others on
+Product.stock_quantity.
+
+A reservation takes the stock immediately and records it in a
+StockReservation row that expires after STOCK_RESERVATION_MINUTES. Placing
+the order keeps the reserved stock; `release_expired_reservations` (run it
+from cron) gives expired holds back. Reservation rows are claimed with an
+UPDATE before they are acted on, so an order and the sweeper can never both
+handle the same row.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from shop.models import Product, ProductVariant
+from .models import StockReservation
+
+
+class InsufficientStock(Exception):
+    """Some lines cannot be supplied; `shortages` maps (product_id, variant_id) to the quantity available"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(f'Insufficient stock for {len(shortages)} item(s)')
+
+
+def reservation_minutes():
+    return getattr(settings, 'STOCK_RESERVATION_MINUTES', 15)
+
+
+def quantities(lines):
+    """Sum (product_id, variant_id, quantity) lines per stock item"""
+    totals = defaultdict(int)
+    for product_id, variant_id, quantity in lines:
+        totals[(product_id, variant_id)] += quantity
+    return dict(totals)
+
+
+def _stock_item(key):
+    """The model and primary key whose stock_quantity a (product_id, variant_id) line draws on"""
+    product_id, variant_id = key
+    return (Product, product_id) if variant_id is None else (ProductVariant, variant_id)
+
+
+def _by_model(totals):
+    """Split positive quantities into {Product: {id: n}, ProductVariant: {id: n}}"""
+    split = {Product: {}, ProductVariant: {}}
+    for key, quantity in totals.items():
+        if quantity > 0:
+            model, pk = _stock_item(key)
+            split[model][pk] = quantity
+    return split
+
+
+def _amounts(amounts):
+    return Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in amounts.items()],
+                output_field=models.IntegerField())
+
+
+def _take(totals):
+    short_items = {}
+    for model, amounts in _by_model(totals).items():
+        if not amounts:
+            continue
+        amount = _amounts(amounts)
+        updated = model.objects.filter(pk__in=amounts, stock_quantity__gte=amount).update(
+            stock_quantity=F('stock_quantity') - amount
+        )
+        if updated != len(amounts):
+            # Only on failure: find out which lines were short
+            available = dict(model.objects.filter(pk__in=amounts).values_list('pk', 'stock_quantity'))
+            for pk, quantity in amounts.items():
+                if available.get(pk, 0) < quantity:
+                    short_items[model, pk] = available.get(pk, 0)
+    if short_items:
+        raise InsufficientStock({
+            key: short_items[_stock_item(key)] for key in totals if _stock_item(key) in short_items
+        })
+
+
+def _give_back(totals):
+    for model, amounts in _by_model(totals).items():
+        if amounts:
+            amount = _amounts(amounts)
+            model.objects.filter(pk__in=amounts).update(stock_quantity=F('stock_quantity') + amount)
+
+
+def decrement(lines):
+    """Take stock for (product_id, variant_id, quantity) lines, all or nothing"""
+    with transaction.atomic():
+        _take(quantities(lines))
+
+
+def _claim(reservations):
+    """Take ownership of reservation rows and delete them; returns the stock they held"""
+    token = uuid.uuid4()
+    if not reservations.filter(claim__isnull=True).update(claim=token):
+        return {}
+    claimed = StockReservation.objects.filter(claim=token)
+    held = quantities(claimed.values_list('product_id', 'variant_id', 'quantity'))
+    claimed.delete()
+    return held
+
+
+def reserve(user, lines, minutes=None):
+    """Hold stock for a user's checkout, replacing any earlier hold; returns the expiry time.
+
+    Raises InsufficientStock (and keeps the earlier hold) when some line cannot be held.
+    """
+    expires_at = timezone.now() + timedelta(minutes=reservation_minutes() if minutes is None else minutes)
+    wanted = quantities(lines)
+    with transaction.atomic():
+        held = _claim(StockReservation.objects.filter(user=user))
+        # Only the difference to the previous hold touches the stock rows
+        _give_back({key: held[key] - wanted.get(key, 0) for key in held})
+        _take({key: quantity - held.get(key, 0) for key, quantity in wanted.items()})
+        StockReservation.objects.bulk_create([
+            StockReservation(user=user, product_id=product_id, variant_id=variant_id,
+                             quantity=quantity, expires_at=expires_at)
+            for (product_id, variant_id), quantity in wanted.items() if quantity > 0
+        ])
+    return expires_at
+
+
+def release(user):
+    """Give back everything held for a user"""
+    with transaction.atomic():
+        _give_back(_claim(StockReservation.objects.filter(user=user)))
+
+
+def commit(user, lines):
+    """Take stock for an order, drawing on the user's hold first.
+
+    Lines the hold covers are already taken; the rest is decremented now and
+    any surplus hold is given back. Call inside the order's transaction.
+    """
+    wanted = quantities(lines)
+    with transaction.atomic():
+        # Expired holds that have not been swept yet still hold their stock
+        held = _claim(StockReservation.objects.filter(user=user))
+        _give_back({key: held[key] - wanted.get(key, 0) for key in held})
+        _take({key: quantity - held.get(key, 0) for key, quantity in wanted.items()})
+
+
+def release_expired(batch_size=500, now=None):
+    """Give back the stock of expired reservations; returns how many were released"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        batch = list(StockReservation.objects.filter(
+            expires_at__lte=now, claim__isnull=True
+        ).values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return released
+        with transaction.atomic():
+            token = uuid.uuid4()
+            StockReservation.objects.filter(pk__in=batch, claim__isnull=True).update(claim=token)
+            claimed = StockReservation.objects.filter(claim=token)
+            rows = list(claimed.values_list('product_id', 'variant_id', 'quantity'))
+            _give_back(quantities(rows))
+            claimed.delete()
+        released += len(rows)
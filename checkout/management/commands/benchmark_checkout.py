@@ -0,0 +1,99 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from cart.models import Cart, CartItem
+from checkout.models import Order, OrderItem
+from checkout.orders import place_order
+from shop.benchmarks import isolated_database, build_synthetic_catalog
+from shop.models import ProductVariant
+
+
+SHIPPING = {
+    'full_name': 'Benchmark Customer', 'phone': '9999999999', 'address_line_1': '1 Hazratganj',
+    'address_line_2': '', 'city': 'Lucknow', 'state': 'Uttar Pradesh', 'pin_code': '226001',
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order placement for 1, 10 and 50 line carts (queries and latency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50], help='Cart sizes to place')
+        parser.add_argument('--repeat', type=int, default=20, help='Orders per cart size (median is reported)')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            build_synthetic_catalog(max(options['lines']) * 2, variants_per_product=1)
+            # Every order takes stock; keep enough for all runs
+            ProductVariant.objects.update(stock_quantity=1_000_000)
+            variants = list(ProductVariant.objects.order_by('pk'))
+            user = get_user_model().objects.create_user(
+                username='benchmark', email='benchmark@example.com', password='benchmark',
+            )
+            cart = Cart.objects.create(user=user)
+
+            results = {'scenarios': []}
+            self.stdout.write(f'{"lines":>6} {"path":<10} {"median ms":>10} {"min ms":>9} {"queries":>8}')
+            self.stdout.write('-' * 47)
+            for lines in options['lines']:
+                row = {'lines': lines}
+                for path, func in (('per-line', self.per_line_order), ('service', self.service_order)):
+                    timings, queries = [], set()
+                    for _ in range(options['repeat']):
+                        self.fill_cart(cart, variants[:lines])
+                        with CaptureQueriesContext(connection) as captured:
+                            start = time.perf_counter()
+                            func(user, cart)
+                            timings.append((time.perf_counter() - start) * 1000)
+                        queries.add(len(captured.captured_queries))
+                    median, best = statistics.median(timings), min(timings)
+                    row[path] = {'median_ms': round(median, 2), 'min_ms': round(best, 2), 'queries': sorted(queries)}
+                    query_counts = '/'.join(str(count) for count in sorted(queries))
+                    self.stdout.write(f'{lines:>6} {path:<10} {median:>10.2f} {best:>9.2f} {query_counts:>8}')
+                results['scenarios'].append(row)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+
+    def fill_cart(self, cart, variants):
+        CartItem.objects.filter(cart=cart).delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=variant.product_id, variant=variant, quantity=2) for variant in variants
+        ])
+
+    def per_line_order(self, user, cart):
+        """What place_order did before the service: one create per line, lazy product/variant loads"""
+        subtotal = cart.get_summary().total_amount
+        order = Order.objects.create(
+            user=user, **{f'shipping_{field}': value for field, value in SHIPPING.items()},
+            payment_method='cod', subtotal=subtotal, total_amount=subtotal,
+        )
+        for cart_item in cart.items.all():
+            OrderItem.objects.create(
+                order=order,
+                product=cart_item.product,
+                variant=cart_item.variant,
+                product_name=cart_item.product.name,
+                product_price=cart_item.product.selling_price,
+                variant_info=f"{cart_item.variant.size} - {cart_item.variant.color}" if cart_item.variant else "",
+                quantity=cart_item.quantity,
+                total_price=cart_item.get_total_price(),
+            )
+        cart.items.all().delete()
+        return order
+
+    def service_order(self, user, cart):
+        return place_order(user, SHIPPING, payment_method='cod')
+
+
+# Usage examples:
+# python manage.py benchmark_checkout
+# python manage.py benchmark_checkout --lines 1 10 50 100 --repeat 50 --json checkout.json
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from checkout.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired checkout reservations (run every few minutes from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations released per transaction')
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Released {released} expired stock reservations'))
+
+
+# Usage examples:
+# python manage.py release_expired_reservations
+# */5 * * * * cd /path/to/project && python manage.py release_expired_reservations
@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from cart.models import Cart, CartItem
+from checkout import inventory
+from checkout.models import Order, OrderItem, StockReservation
+from checkout.orders import OutOfStockError, place_order
+from shop.benchmarks import isolated_database, build_synthetic_catalog
+from shop.models import Product, ProductVariant
+
+
+SHIPPING = {
+    'full_name': 'Stress Buyer', 'phone': '9999999999', 'address_line_1': '1 Aminabad',
+    'address_line_2': '', 'city': 'Lucknow', 'state': 'Uttar Pradesh', 'pin_code': '226018',
+}
+
+
+class Command(BaseCommand):
+    help = 'Contention test: many concurrent buyers for scarce stock must never oversell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=100, help='Concurrent buyer threads')
+        parser.add_argument('--stock', type=int, default=50, help='Units of the product variant on sale')
+        parser.add_argument('--max-quantity', type=int, default=1, help='Each buyer wants 1..N units')
+        parser.add_argument('--reserve', action='store_true', help='Buyers hold stock on the checkout page first')
+        parser.add_argument('--abandon', type=float, default=0.0,
+                            help='Share of buyers who reserve and leave (released by a concurrent sweeper)')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with isolated_database(concurrent=True):
+            build_synthetic_catalog(2, variants_per_product=1)
+            variant = ProductVariant.objects.select_related('product').first()
+            ProductVariant.objects.filter(pk=variant.pk).update(stock_quantity=options['stock'])
+            # A second line without a variant exercises the product stock path
+            other = Product.objects.exclude(pk=variant.product_id).first()
+            Product.objects.filter(pk=other.pk).update(stock_quantity=options['stock'])
+
+            User = get_user_model()
+            users = User.objects.bulk_create([
+                User(username=f'buyer{number}', email=f'buyer{number}@example.com', password='!')
+                for number in range(options['buyers'])
+            ])
+            carts = Cart.objects.bulk_create([Cart(user=user) for user in users])
+            wanted = {}
+            items = []
+            for user, cart in zip(users, carts):
+                quantity = rng.randint(1, options['max_quantity'])
+                wanted[user.pk] = quantity
+                items.append(CartItem(cart=cart, product_id=variant.product_id, variant=variant, quantity=quantity))
+                items.append(CartItem(cart=cart, product=other, quantity=quantity))
+            CartItem.objects.bulk_create(items)
+            abandoning = set(rng.sample([user.pk for user in users], int(len(users) * options['abandon'])))
+
+            outcomes = {'placed': 0, 'out_of_stock': 0, 'abandoned': 0, 'errors': []}
+            lock = threading.Lock()
+            barrier = threading.Barrier(len(users) + 1)
+            done = threading.Event()
+
+            def buyer(user):
+                try:
+                    barrier.wait()
+                    lines = [(variant.product_id, variant.pk, wanted[user.pk]), (other.pk, None, wanted[user.pk])]
+                    if user.pk in abandoning:
+                        inventory.reserve(user, lines, minutes=0)
+                        outcome = 'abandoned'
+                    else:
+                        if options['reserve']:
+                            inventory.reserve(user, lines)
+                        place_order(user, SHIPPING)
+                        outcome = 'placed'
+                except (OutOfStockError, inventory.InsufficientStock):
+                    outcome = 'out_of_stock'
+                except Exception as exc:
+                    with lock:
+                        outcomes['errors'].append(f'{type(exc).__name__}: {exc}')
+                    return
+                finally:
+                    connection.close()
+                with lock:
+                    outcomes[outcome] += 1
+
+            def sweeper():
+                try:
+                    barrier.wait()
+                    while not done.is_set():
+                        inventory.release_expired()
+                        time.sleep(0.01)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=buyer, args=(user,)) for user in users]
+            threads.append(threading.Thread(target=sweeper))
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads[:-1]:
+                thread.join()
+            done.set()
+            threads[-1].join()
+            elapsed = time.perf_counter() - start
+            inventory.release_expired()
+
+            variant_left = ProductVariant.objects.get(pk=variant.pk).stock_quantity
+            product_left = Product.objects.get(pk=other.pk).stock_quantity
+            sold = OrderItem.objects.filter(variant=variant).aggregate(total=Sum('quantity'))['total'] or 0
+            sold_other = OrderItem.objects.filter(product=other).aggregate(total=Sum('quantity'))['total'] or 0
+            orders = Order.objects.count()
+            held = StockReservation.objects.count()
+
+        self.stdout.write(f'Buyers: {len(users)}  stock: {options["stock"]}  elapsed: {elapsed:.2f}s')
+        self.stdout.write(f'Orders placed: {outcomes["placed"]}  sold out: {outcomes["out_of_stock"]}  '
+                          f'abandoned: {outcomes["abandoned"]}  errors: {len(outcomes["errors"])}')
+        self.stdout.write(f'Variant: sold {sold}, left {variant_left}  Product: sold {sold_other}, left {product_left}')
+        for error in outcomes['errors'][:5]:
+            self.stdout.write(self.style.ERROR(f'  {error}'))
+
+        problems = []
+        if orders != outcomes['placed']:
+            problems.append(f'{orders} orders in the database but {outcomes["placed"]} reported placed')
+        for label, sold_units, left in (('variant', sold, variant_left), ('product', sold_other, product_left)):
+            if sold_units + left != options['stock']:
+                problems.append(f'{label}: sold {sold_units} + left {left} != stock {options["stock"]}')
+        if held:
+            problems.append(f'{held} reservations were not released')
+        if outcomes['errors']:
+            problems.append(f'{len(outcomes["errors"])} buyers failed with errors')
+        if problems:
+            raise CommandError('❌ ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('✅ No oversell: every unit is either sold once or back in stock'))
+
+
+# Usage examples:
+# python manage.py stress_inventory
+# python manage.py stress_inventory --buyers 100 --stock 30 --max-quantity 3 --reserve
+# python manage.py stress_inventory --reserve --abandon 0.3
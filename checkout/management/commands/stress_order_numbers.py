@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+from array import array
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from checkout.models import OrderNumberSequence
+from checkout.numbering import BlockAllocator, format_order_number
+from shop.benchmarks import isolated_database
+
+
+def allocate(year, count, block_size, results):
+    """Worker process: draw `count` numbers and send them back as a packed array"""
+    allocator = BlockAllocator(block_size)
+    values = array('q')
+    start = time.perf_counter()
+    for _ in range(count):
+        values.append(allocator.next_value(year))
+    elapsed = time.perf_counter() - start
+    connection.close()
+    results.put((values.tobytes(), elapsed))
+
+
+class Command(BaseCommand):
+    help = 'Allocate order numbers from many processes at once and check there are no collisions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--numbers', type=int, default=1_000_000, help='Numbers to allocate in total')
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--block-size', type=int, default=1000, help='Numbers reserved per database round trip')
+        parser.add_argument('--year', type=int, default=2026)
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        per_process = options['numbers'] // processes
+        year = options['year']
+
+        with isolated_database(concurrent=True):
+            # Workers are forked and open their own connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            workers = [
+                context.Process(target=allocate, args=(year, per_process, options['block_size'], results))
+                for _ in range(processes)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            batches = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            next_value = OrderNumberSequence.objects.get(year=year).next_value
+
+        seen = set()
+        total = 0
+        out_of_order = 0
+        for data, _ in batches:
+            values = array('q')
+            values.frombytes(data)
+            out_of_order += sum(1 for previous, value in zip(values, values[1:]) if value <= previous)
+            seen.update(values)
+            total += len(values)
+        collisions = total - len(seen)
+
+        self.stdout.write(f'Processes: {processes}  block size: {options["block_size"]}')
+        self.stdout.write(f'Allocated {total:,} numbers in {elapsed:.2f}s '
+                          f'({total / elapsed:,.0f}/s, slowest worker {max(t for _, t in batches):.2f}s)')
+        self.stdout.write(f'Range {format_order_number(year, min(seen))} .. {format_order_number(year, max(seen))}, '
+                          f'{next_value - 1 - total:,} reserved but unused')
+        if collisions or out_of_order:
+            raise CommandError(f'❌ {collisions} collisions, {out_of_order} numbers out of order within a process')
+        self.stdout.write(self.style.SUCCESS('✅ No collisions; numbers increase within every process'))
+
+
+# Usage examples:
+# python manage.py stress_order_numbers
+# python manage.py stress_order_numbers --numbers 100000 --processes 16 --block-size 1
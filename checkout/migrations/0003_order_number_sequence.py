@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0002_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(blank=True, max_length=20, unique=True),
+        ),
+    ]
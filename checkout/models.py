@@ -1,7 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from shop.models import Product, ProductVariant
-import uuid
 
 User = get_user_model()
 
@@ -33,7 +32,7 @@ class Order(models.Model):
         ('wallet', 'Digital Wallet'),
     ]
 
-    order_number = models.CharField(max_length=20, unique=True, default=uuid.uuid4)
+    order_number = models.CharField(max_length=20, unique=True, blank=True)  # assigned on first save, see numbering.py
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     
     # Shipping address
@@ -83,13 +82,20 @@ class Order(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate order number
-            import random
-            import string
-            self.order_number = f"ORD-2025-{''.join(random.choices(string.digits, k=6))}"
+            from .numbering import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
 
+class OrderNumberSequence(models.Model):
+    """Next unused order number of a year; handed out in blocks by checkout/numbering.py"""
+    year = models.PositiveIntegerField(primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.year}: next {self.next_value}"
+
+
 class OrderItem(models.Model):
     """Order item model"""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -153,3 +159,26 @@ class Coupon(models.Model):
             discount = self.discount_value
         
         return min(discount, order_amount)
+
+
+class StockReservation(models.Model):
+    """Stock held for a customer on the checkout page (see checkout/inventory.py).
+
+    The quantity has already been taken off the product or variant stock; it is
+    returned when the reservation is released or expires, or kept when the
+    order is placed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    # Set by whoever is consuming or releasing the row, so it is only ever handled once
+    claim = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['expires_at']
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant or self.product} for {self.user} until {self.expires_at:%H:%M}"
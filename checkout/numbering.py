@@ -0,0 +1,82 @@
+"""
+Order numbers.
+
+Numbers look like ORD-2026-000042: a prefix, the year and a sequence that
+restarts every year. Each year's next unused value is one OrderNumberSequence
+row, advanced with an UPDATE ... SET next_value = next_value + n and read
+back in the same transaction, so no two callers can get the same range.
+
+To keep that row from becoming a hot spot every process reserves a block of
+ORDER_NUMBER_BLOCK_SIZE numbers at a time and hands them out from memory.
+Numbers therefore increase within a process but interleave across processes,
+and the unused end of a block is skipped when a process exits. Set the block
+size to 1 for strictly consecutive numbers at the cost of one UPDATE per order.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def block_size():
+    return getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 20)
+
+
+def format_order_number(year, value):
+    return f"{getattr(settings, 'ORDER_NUMBER_PREFIX', 'ORD')}-{year}-{value:06d}"
+
+
+def reserve_block(year, size):
+    """Reserve `size` consecutive numbers of a year; returns the first of them"""
+    from .models import OrderNumberSequence
+
+    sequences = OrderNumberSequence.objects.filter(year=year)
+    for attempt in range(2):
+        with transaction.atomic():
+            if sequences.update(next_value=F('next_value') + size):
+                # The UPDATE holds the row until commit, so this reads our own increment
+                return sequences.values_list('next_value', flat=True).get() - size
+        try:
+            with transaction.atomic():
+                OrderNumberSequence.objects.create(year=year, next_value=1)
+        except IntegrityError:
+            pass  # Another process started the year first
+    raise RuntimeError(f'Could not reserve order numbers for {year}')
+
+
+class BlockAllocator:
+    """Hands out numbers from a block reserved per process and year"""
+
+    def __init__(self, size=None):
+        self.size = size
+        self._blocks = {}  # year -> [pid, next value, end]
+        self._lock = threading.Lock()
+
+    def next_value(self, year):
+        if connection.in_atomic_block:
+            # A block reserved here would be undone by a rollback while this process kept
+            # handing it out; take a single number that lives and dies with the transaction.
+            return reserve_block(year, 1)
+
+        with self._lock:
+            pid = os.getpid()
+            block = self._blocks.get(year)
+            # A forked worker must not continue its parent's block
+            if block is None or block[0] != pid or block[1] >= block[2]:
+                size = self.size or block_size()
+                start = reserve_block(year, size)
+                block = self._blocks[year] = [pid, start, start + size]
+            value = block[1]
+            block[1] += 1
+            return value
+
+
+_allocator = BlockAllocator()
+
+
+def next_order_number(year=None):
+    year = year or timezone.localdate().year
+    return format_order_number(year, _allocator.next_value(year))
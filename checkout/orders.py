@@ -0,0 +1,137 @@
+"""
+Order placement.
+
+`place_order` turns a cart into an Order inside one transaction: the cart row
+is locked (so a double submit places one order), its lines are loaded with
+their product and variant in a single query, the order items are written
+with one bulk insert, the coupon is consumed with a conditional UPDATE and
+the cart is emptied. Stock is taken at the same time (see inventory.py),
+drawing on the customer's checkout reservation first. Any failure rolls all
+of it back, and the number of queries does not grow with the size of the cart.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from cart.models import Cart, CartItem
+from . import inventory
+from .models import Order, OrderItem, Coupon
+from .numbering import next_order_number
+
+
+class OrderPlacementError(Exception):
+    """Raised when a cart cannot be turned into an order; the message is shown to the customer"""
+
+
+class CouponError(OrderPlacementError):
+    """The applied coupon is unknown, no longer valid or used up"""
+
+
+class OutOfStockError(OrderPlacementError):
+    """Some cart lines ask for more than is in stock"""
+
+
+def stock_message(lines, shortages):
+    """Customer-facing description of InsufficientStock shortages for cart lines"""
+    problems = []
+    for line in lines:
+        key = (line.product_id, line.variant_id)
+        if key in shortages:
+            name = f"{line.product.name} ({line.variant.size} - {line.variant.color})" if line.variant else line.product.name
+            available = shortages.pop(key)
+            problems.append(f"only {available} left of {name}" if available else f"{name} is out of stock")
+    return 'Sorry, ' + '; '.join(problems) + '.'
+
+
+def standard_shipping_cost(subtotal):
+    """Free above FREE_SHIPPING_THRESHOLD, express rate below it"""
+    return Decimal('0') if subtotal >= settings.FREE_SHIPPING_THRESHOLD else Decimal(str(settings.EXPRESS_SHIPPING_COST))
+
+
+def _find_coupon(code):
+    """A PromoCode or, for older codes, a checkout Coupon, locked for the rest of the transaction"""
+    from shop.models import PromoCode
+
+    for model in (PromoCode, Coupon):
+        coupon = model.objects.select_for_update().filter(code=code).first()
+        if coupon is not None:
+            return coupon
+    return None
+
+
+def consume_coupon(code, subtotal):
+    """Count one use of a coupon and return its discount on the subtotal.
+
+    The usage limit is enforced by the UPDATE itself, so concurrent orders
+    cannot use a coupon more often than allowed.
+    """
+    coupon = _find_coupon(code.upper())
+    if coupon is None:
+        raise CouponError('Invalid coupon code.')
+    discount = Decimal(str(coupon.calculate_discount(subtotal))).quantize(Decimal('0.01'))
+    if not discount:
+        raise CouponError('This coupon is not valid for this order.')
+
+    consumed = type(coupon).objects.filter(pk=coupon.pk).filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    ).update(used_count=F('used_count') + 1)
+    if not consumed:
+        raise CouponError('This coupon has reached its usage limit.')
+    return discount
+
+
+def place_order(user, shipping, payment_method='cod', coupon_code=None,
+                shipping_cost=standard_shipping_cost, default_variant_info=''):
+    """Create an order from the user's cart, consume the coupon and empty the cart, atomically.
+
+    `shipping` holds the shipping_* fields of the order (without the prefix);
+    `shipping_cost` is an amount or a function of the subtotal.
+    """
+    # Taken before the transaction so it comes from this process's block; a failed order skips it
+    order_number = next_order_number()
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        if cart is None:
+            raise OrderPlacementError('Your cart is empty.')
+        lines = list(CartItem.objects.filter(cart=cart).select_related('product', 'variant').order_by('pk'))
+        if not lines:
+            raise OrderPlacementError('Your cart is empty.')
+
+        try:
+            inventory.commit(user, [(line.product_id, line.variant_id, line.quantity) for line in lines])
+        except inventory.InsufficientStock as e:
+            raise OutOfStockError(stock_message(lines, dict(e.shortages)))
+
+        subtotal = sum((line.get_total_price() for line in lines), Decimal('0.00'))
+        discount = consume_coupon(coupon_code, subtotal) if coupon_code else Decimal('0.00')
+        shipping_amount = shipping_cost(subtotal) if callable(shipping_cost) else shipping_cost
+
+        order = Order.objects.create(
+            order_number=order_number,
+            user=user,
+            **{f'shipping_{field}': value for field, value in shipping.items()},
+            payment_method=payment_method,
+            subtotal=subtotal,
+            shipping_cost=shipping_amount,
+            discount_amount=discount,
+            total_amount=subtotal - discount + shipping_amount,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=line.product,
+                variant=line.variant,
+                product_name=line.product.name,
+                product_price=line.product.selling_price,
+                variant_info=f"{line.variant.size} - {line.variant.color}" if line.variant else default_variant_info,
+                quantity=line.quantity,
+                total_price=line.get_total_price(),
+            )
+            for line in lines
+        ])
+
+        # Deleting through cart.items attaches the cart to each line, so the delete signals need no queries
+        cart.items.all().delete()
+    return order
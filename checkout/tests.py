@@ -1,3 +1,233 @@
-from django.test import TestCase
+import random
+import threading
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+from shop.benchmarks import build_synthetic_catalog
+from shop.models import Product, ProductVariant, PromoCode
+from . import inventory
+from .models import Order, OrderItem, OrderNumberSequence, StockReservation
+from .numbering import BlockAllocator, format_order_number, next_order_number
+from .orders import CouponError, OutOfStockError, place_order
+
+
+SHIPPING = {
+    'full_name': 'Test Buyer', 'phone': '9999999999', 'address_line_1': '1 Aminabad',
+    'address_line_2': '', 'city': 'Lucknow', 'state': 'Uttar Pradesh', 'pin_code': '226018',
+}
+
+
+def run_concurrently(target, arguments):
+    """Call target(argument) from one thread per argument, all released at once; returns the outcomes"""
+    barrier = threading.Barrier(len(arguments))
+    outcomes = [None] * len(arguments)
+
+    def run(index, argument):
+        try:
+            barrier.wait()
+            outcomes[index] = target(argument)
+        except Exception as exc:
+            outcomes[index] = exc
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index, argument)) for index, argument in enumerate(arguments)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many buyers at once for scarce stock and a limited coupon"""
+
+    buyers = 100
+    stock = 30
+
+    def setUp(self):
+        build_synthetic_catalog(2, variants_per_product=1)
+        self.variant = ProductVariant.objects.select_related('product').first()
+        self.other = Product.objects.exclude(pk=self.variant.product_id).first()
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock_quantity=self.stock)
+        Product.objects.filter(pk=self.other.pk).update(stock_quantity=self.stock)
+
+        User = get_user_model()
+        self.users = User.objects.bulk_create([
+            User(username=f'buyer{number}', email=f'buyer{number}@example.com', password='!')
+            for number in range(self.buyers)
+        ])
+        rng = random.Random(7)
+        self.wanted = {user.pk: rng.randint(1, 3) for user in self.users}
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in self.users])
+        CartItem.objects.bulk_create([
+            item
+            for user, cart in zip(self.users, carts)
+            for item in (
+                CartItem(cart=cart, product_id=self.variant.product_id, variant=self.variant,
+                         quantity=self.wanted[user.pk]),
+                CartItem(cart=cart, product=self.other, quantity=self.wanted[user.pk]),
+            )
+        ])
+
+    def lines(self, user):
+        quantity = self.wanted[user.pk]
+        return [(self.variant.product_id, self.variant.pk, quantity), (self.other.pk, None, quantity)]
+
+    def assertNoOversell(self, outcomes):
+        errors = [outcome for outcome in outcomes
+                  if isinstance(outcome, Exception) and not isinstance(outcome, (OutOfStockError,
+                                                                                 inventory.InsufficientStock))]
+        self.assertEqual(errors, [])
+        variant_left = ProductVariant.objects.get(pk=self.variant.pk).stock_quantity
+        product_left = Product.objects.get(pk=self.other.pk).stock_quantity
+        sold = OrderItem.objects.filter(variant=self.variant).aggregate(total=Sum('quantity'))['total'] or 0
+        sold_other = OrderItem.objects.filter(product=self.other).aggregate(total=Sum('quantity'))['total'] or 0
+        for sold_units, left in ((sold, variant_left), (sold_other, product_left)):
+            self.assertGreaterEqual(left, 0)
+            self.assertLessEqual(sold_units, self.stock)
+            self.assertEqual(sold_units + left, self.stock)
+        self.assertEqual(Order.objects.count(), sum(isinstance(outcome, Order) for outcome in outcomes))
+        return sold
+
+    def test_place_order_never_oversells(self):
+        outcomes = run_concurrently(lambda user: place_order(user, SHIPPING), self.users)
+        sold = self.assertNoOversell(outcomes)
+        # Stock runs out before the buyers do
+        self.assertTrue(any(isinstance(outcome, OutOfStockError) for outcome in outcomes))
+        self.assertGreater(sold, self.stock - 3)
+
+    def test_reservations_and_commits_never_oversell(self):
+        def buy(user):
+            if user.pk % 3 == 0:
+                inventory.reserve(user, self.lines(user))
+            return place_order(user, SHIPPING)
+
+        outcomes = run_concurrently(buy, self.users)
+        self.assertNoOversell(outcomes)
+        # Every hold either became an order or was refused; nothing is left to sweep
+        self.assertEqual(inventory.release_expired(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_direct_commits_never_oversell(self):
+        def commit(user):
+            inventory.commit(user, self.lines(user))
+            return user
+
+        outcomes = run_concurrently(commit, self.users)
+        taken = sum(self.wanted[outcome.pk] for outcome in outcomes if not isinstance(outcome, Exception))
+        self.assertEqual(ProductVariant.objects.get(pk=self.variant.pk).stock_quantity, self.stock - taken)
+        self.assertEqual(Product.objects.get(pk=self.other.pk).stock_quantity, self.stock - taken)
+        self.assertLessEqual(taken, self.stock)
+
+    def test_coupon_is_not_used_beyond_its_limit(self):
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock_quantity=10_000)
+        Product.objects.filter(pk=self.other.pk).update(stock_quantity=10_000)
+        now = timezone.now()
+        promo = PromoCode.objects.create(
+            code='FIRST5', description='First five orders', discount_type='fixed',
+            discount_value=Decimal('50'), usage_limit=5,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+
+        outcomes = run_concurrently(lambda user: place_order(user, SHIPPING, coupon_code='first5'), self.users)
+        placed = [outcome for outcome in outcomes if isinstance(outcome, Order)]
+        self.assertEqual(len(placed), 5)
+        self.assertTrue(all(isinstance(outcome, (Order, CouponError)) for outcome in outcomes))
+        self.assertTrue(all(order.discount_amount == Decimal('50.00') for order in placed))
+        promo.refresh_from_db()
+        self.assertEqual(promo.used_count, 5)
+        # A buyer whose coupon was refused keeps the cart and the stock
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(CartItem.objects.count(), 2 * (self.buyers - 5))
+
+
+class OrderNumberTests(TransactionTestCase):
+    """Year-scoped order numbers from blocks reserved per process (see numbering.py)"""
+
+    year = 2026
+
+    def sequence_value(self):
+        return OrderNumberSequence.objects.get(year=self.year).next_value
+
+    def test_format(self):
+        self.assertEqual(format_order_number(2026, 42), 'ORD-2026-000042')
+        self.assertEqual(format_order_number(2027, 1234567), 'ORD-2027-1234567')
+        with override_settings(ORDER_NUMBER_PREFIX='KDH'):
+            self.assertEqual(format_order_number(2026, 7), 'KDH-2026-000007')
+        self.assertRegex(next_order_number(self.year), r'^ORD-2026-\d{6}$')
+
+    def test_block_is_handed_out_then_refilled(self):
+        allocator = BlockAllocator(size=5)
+        values = [allocator.next_value(self.year) for _ in range(5)]
+        self.assertEqual(values, [1, 2, 3, 4, 5])
+        # One reservation for the whole block
+        self.assertEqual(self.sequence_value(), 6)
+
+        values.append(allocator.next_value(self.year))
+        self.assertEqual(values[-1], 6)
+        self.assertEqual(self.sequence_value(), 11)
+
+    def test_blocks_of_separate_processes_do_not_overlap(self):
+        first, second = BlockAllocator(size=3), BlockAllocator(size=3)
+        values = [allocator.next_value(self.year) for _ in range(4) for allocator in (first, second)]
+        self.assertEqual(len(set(values)), len(values))
+        self.assertEqual(sorted(values), [1, 2, 3, 4, 5, 6, 7, 10])
+
+    def test_years_have_their_own_sequence(self):
+        allocator = BlockAllocator(size=2)
+        self.assertEqual(allocator.next_value(2026), 1)
+        self.assertEqual(allocator.next_value(2027), 1)
+        self.assertEqual(allocator.next_value(2026), 2)
+
+    def test_single_numbers_inside_a_transaction(self):
+        allocator = BlockAllocator(size=10)
+        with transaction.atomic():
+            self.assertEqual(allocator.next_value(self.year), 1)
+            self.assertEqual(allocator.next_value(self.year), 2)
+        # No block was reserved: the sequence moved by exactly the numbers taken
+        self.assertEqual(self.sequence_value(), 3)
+
+        try:
+            with transaction.atomic():
+                self.assertEqual(allocator.next_value(self.year), 3)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        # The rolled back number is given out again
+        self.assertEqual(allocator.next_value(self.year), 3)
+
+    def test_concurrent_threads_get_no_duplicates(self):
+        shared = BlockAllocator(size=7)
+
+        def allocate(allocator):
+            return [allocator.next_value(self.year) for _ in range(50)]
+
+        # Threads sharing one process's allocator, and threads with allocators of their own
+        outcomes = run_concurrently(allocate, [shared] * 10 + [BlockAllocator(size=7) for _ in range(10)])
+        self.assertFalse([outcome for outcome in outcomes if isinstance(outcome, Exception)])
+        values = [value for outcome in outcomes for value in outcome]
+        self.assertEqual(len(values), 1000)
+        self.assertEqual(len(set(values)), len(values))
+        # Numbers increase within each thread
+        for outcome in outcomes:
+            self.assertEqual(outcome, sorted(outcome))
+        self.assertLessEqual(max(values), self.sequence_value() - 1)
+
+    def test_concurrent_single_numbers_are_consecutive(self):
+        allocator = BlockAllocator(size=1)
+
+        def allocate(_):
+            with transaction.atomic():
+                return [allocator.next_value(self.year) for _ in range(10)]
+
+        outcomes = run_concurrently(allocate, range(20))
+        values = sorted(value for outcome in outcomes for value in outcome)
+        self.assertEqual(values, list(range(1, 201)))
@@ -6,7 +6,9 @@ from django.views.decorators.http import require_POST
 from django.conf import settings
 import json
 
-from .models import Order, OrderItem, Coupon
+from .models import Order, Coupon
+from . import inventory
+from .orders import CouponError, OrderPlacementError, place_order as place_cart_order, stock_message
 from cart.models import Cart
 from accounts.models import Address
 from .forms import ShippingAddressForm, PaymentForm
@@ -23,6 +25,13 @@ def checkout(request):
         cart = None
         cart_items = []
     
+    # Hold the stock while the customer is on the checkout page
+    if cart_items:
+        try:
+            inventory.reserve(request.user, [(item.product_id, item.variant_id, item.quantity) for item in cart_items])
+        except inventory.InsufficientStock as e:
+            messages.warning(request, stock_message(cart_items, dict(e.shortages)))
+    
     # Get user's saved addresses
     addresses = Address.objects.filter(user=request.user).order_by('-is_default', '-created_at')
     
@@ -35,8 +44,7 @@ def checkout(request):
     promo_codes = PromoCode.objects.filter(is_active=True).order_by('-discount_value')
     
     # Calculate totals
-    cart_total = cart.total_amount if cart else 0
-    cart_items_count = cart.total_items if cart else 0
+    cart_items_count, cart_total = cart.get_summary() if cart else (0, 0)
     
     # Check for applied coupon in session
     applied_coupon = request.session.get('applied_coupon', None)
@@ -121,11 +129,13 @@ def payment_info(request):
     if request.method == 'POST':
         form = PaymentForm(request.POST)
         if form.is_valid():
-            # Process order
-            order = create_order(request, cart, request.session['shipping_info'], form.cleaned_data)
+            # Process order; the cart is emptied in the same transaction
+            try:
+                order = create_order(request, cart, request.session['shipping_info'], form.cleaned_data)
+            except OrderPlacementError as e:
+                messages.error(request, str(e))
+                return redirect('cart:cart_detail')
             
-            # Clear cart and session
-            cart.items.all().delete()
             del request.session['shipping_info']
             
             return redirect('checkout:order_confirmation', order_number=order.order_number)
@@ -143,38 +153,19 @@ def payment_info(request):
 
 def create_order(request, cart, shipping_info, payment_info):
     """Create order from cart"""
-    order = Order.objects.create(
-        user=request.user,
-        # Shipping address
-        shipping_full_name=shipping_info['full_name'],
-        shipping_phone=shipping_info['phone'],
-        shipping_address_line_1=shipping_info['address_line_1'],
-        shipping_address_line_2=shipping_info.get('address_line_2', ''),
-        shipping_city=shipping_info['city'],
-        shipping_state=shipping_info['state'],
-        shipping_pin_code=shipping_info['pin_code'],
-        # Payment info
+    return place_cart_order(
+        request.user,
+        shipping={
+            'full_name': shipping_info['full_name'],
+            'phone': shipping_info['phone'],
+            'address_line_1': shipping_info['address_line_1'],
+            'address_line_2': shipping_info.get('address_line_2', ''),
+            'city': shipping_info['city'],
+            'state': shipping_info['state'],
+            'pin_code': shipping_info['pin_code'],
+        },
         payment_method=payment_info['payment_method'],
-        # Totals
-        subtotal=cart.total_amount,
-        shipping_cost=0 if cart.is_eligible_for_free_shipping else settings.EXPRESS_SHIPPING_COST,
-        total_amount=cart.total_amount + (0 if cart.is_eligible_for_free_shipping else settings.EXPRESS_SHIPPING_COST),
     )
-    
-    # Create order items
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
-            order=order,
-            product=cart_item.product,
-            variant=cart_item.variant,
-            product_name=cart_item.product.name,
-            product_price=cart_item.product.selling_price,
-            variant_info=f"{cart_item.variant.size} - {cart_item.variant.color}" if cart_item.variant else "",
-            quantity=cart_item.quantity,
-            total_price=cart_item.get_total_price(),
-        )
-    
-    return order
 
 
 @login_required
@@ -376,22 +367,6 @@ def place_order(request):
     try:
         data = json.loads(request.body)
         
-        # Get user's cart
-        try:
-            cart = Cart.objects.get(user=request.user)
-            cart_items = cart.items.all()
-        except Cart.DoesNotExist:
-            return JsonResponse({
-                'success': False,
-                'error': 'Your cart is empty.'
-            })
-        
-        if not cart_items.exists():
-            return JsonResponse({
-                'success': False,
-                'error': 'Your cart is empty.'
-            })
-        
         # Get selected address
         address_id = data.get('selected_address')
         if address_id:
@@ -409,50 +384,34 @@ def place_order(request):
                 'error': 'Please select a shipping address.'
             })
         
-        # Get applied coupon
+        # Get applied coupon; it is re-checked and consumed with the order
         applied_coupon = request.session.get('applied_coupon', None)
-        discount_amount = applied_coupon.get('discount', 0) if applied_coupon else 0
         
-        # Calculate totals
-        subtotal = cart.total_amount
-        shipping_cost = 0  # Free shipping for now
-        total_amount = subtotal - discount_amount + shipping_cost
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            # Shipping address
-            shipping_full_name=f"{data.get('first_name', '')} {data.get('last_name', '')}".strip(),
-            shipping_phone=data.get('phone', ''),
-            shipping_address_line_1=address.address_line_1,
-            shipping_address_line_2=address.address_line_2 or '',
-            shipping_city=address.city,
-            shipping_state=address.state,
-            shipping_pin_code=address.pin_code,
-            # Payment info
-            payment_method='cod',  # Default to COD for now
-            # Totals
-            subtotal=subtotal,
-            shipping_cost=shipping_cost,
-            discount_amount=discount_amount,
-            total_amount=total_amount,
-        )
-        
-        # Create order items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                product_name=cart_item.product.name,
-                product_price=cart_item.product.selling_price,
-                variant_info=f"{cart_item.variant.size} - {cart_item.variant.color}" if cart_item.variant else "Default",
-                quantity=cart_item.quantity,
-                total_price=cart_item.get_total_price(),
+        # Create order, order items, coupon use and empty cart in one transaction
+        try:
+            order = place_cart_order(
+                request.user,
+                shipping={
+                    'full_name': f"{data.get('first_name', '')} {data.get('last_name', '')}".strip(),
+                    'phone': data.get('phone', ''),
+                    'address_line_1': address.address_line_1,
+                    'address_line_2': address.address_line_2 or '',
+                    'city': address.city,
+                    'state': address.state,
+                    'pin_code': address.pin_code,
+                },
+                payment_method='cod',  # Default to COD for now
+                coupon_code=applied_coupon['code'] if applied_coupon else None,
+                shipping_cost=0,  # Free shipping for now
+                default_variant_info='Default',
             )
-        
-        # Clear cart
-        cart.items.all().delete()
+        except OrderPlacementError as e:
+            if isinstance(e, CouponError):
+                del request.session['applied_coupon']
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            })
         
         # Clear applied coupon
         if 'applied_coupon' in request.session:
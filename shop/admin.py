@@ -3,8 +3,9 @@ from django.utils.html import format_html
 from .models import (
     Category, SubCategory, Product, ProductImage, 
     ProductVariant, Review, Wishlist, RecentlyViewed, WhatsAppSubscription,
-    PromoCode, DeliveryOption
+    PromoCode, DeliveryOption, SiteStats, SearchQuery
 )
+from .exports import SUBSCRIBERS
 
 
 @admin.register(Category)
@@ -131,12 +132,18 @@ class ReviewAdmin(admin.ModelAdmin):
     actions = ['approve_reviews', 'disapprove_reviews']
     
     def approve_reviews(self, request, queryset):
+        product_ids = set(queryset.values_list('product_id', flat=True))
         updated = queryset.update(is_approved=True)
+        Product.update_rating_stats(product_ids)
+        SiteStats.rebuild()
         self.message_user(request, f'{updated} reviews approved.')
     approve_reviews.short_description = "Approve selected reviews"
     
     def disapprove_reviews(self, request, queryset):
+        product_ids = set(queryset.values_list('product_id', flat=True))
         updated = queryset.update(is_approved=False)
+        Product.update_rating_stats(product_ids)
+        SiteStats.rebuild()
         self.message_user(request, f'{updated} reviews disapproved.')
     disapprove_reviews.short_description = "Disapprove selected reviews"
 
@@ -167,7 +174,10 @@ class WhatsAppSubscriptionAdmin(admin.ModelAdmin):
     
     readonly_fields = ('subscribed_at',)
     
-    actions = ['activate_subscriptions', 'deactivate_subscriptions']
+    actions = [
+        'activate_subscriptions', 'deactivate_subscriptions',
+        SUBSCRIBERS.admin_action('csv'), SUBSCRIBERS.admin_action('xlsx'),
+    ]
     
     def activate_subscriptions(self, request, queryset):
         updated = queryset.update(is_active=True)
@@ -232,3 +242,11 @@ class DeliveryOptionAdmin(admin.ModelAdmin):
             'fields': ('price', 'estimated_days', 'sort_order')
         })
     )
+
+
+@admin.register(SearchQuery)
+class SearchQueryAdmin(admin.ModelAdmin):
+    list_display = ('query', 'search_count', 'last_searched')
+    search_fields = ('query',)
+    ordering = ('-search_count',)
+    readonly_fields = ('last_searched',)
@@ -0,0 +1,255 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks run against a throwaway test database filled with a synthetic
+catalog, so they can be pointed at any settings without touching real data.
+The builders are reproducible for a given seed and write with bulk inserts
+in batches; they bypass save() and signals, so derived data (rating
+aggregates, site stats, search and facet indexes) is rebuilt afterwards.
+"""
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count
+
+
+COLORS = ['Red', 'Maroon', 'Pink', 'Peach', 'Yellow', 'Mustard', 'Green', 'Teal', 'Blue',
+          'Navy', 'Purple', 'Black', 'White', 'Cream', 'Beige', 'Grey', 'Gold', 'Silver']
+PATTERNS = ['Bandhani', 'Chikankari', 'Phulkari', 'Block Print', 'Leheriya', 'Zari', 'Mirror Work',
+            'Embroidered', 'Floral', 'Solid', 'Striped', 'Checked', 'Paisley', 'Ombre', 'Gota Patti']
+PRODUCT_TYPES = {
+    'Dupattas': ['Dupatta', 'Stole', 'Shawl'],
+    'Leggings': ['Leggings', 'Churidar Leggings', 'Jeggings'],
+    'Pants': ['Palazzo', 'Cigarette Pants', 'Trousers'],
+}
+SUBCATEGORIES = {
+    'Dupattas': ['Cotton', 'Silk', 'Chiffon', 'Georgette', 'Net'],
+    'Leggings': ['Ankle Length', 'Full Length', 'Printed', 'Solid'],
+    'Pants': ['Palazzo', 'Formal', 'Wide-leg', 'Cigarette'],
+}
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', '3XL']
+
+
+@contextmanager
+def isolated_database(verbosity=0, concurrent=False):
+    """Run the body against a freshly migrated test database, destroyed afterwards.
+
+    SQLite test databases live in memory, where threads cannot write at the
+    same time; concurrent=True puts it in a file with IMMEDIATE transactions.
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    old_options = dict(connection.settings_dict['OPTIONS'])
+    directory = None
+    if concurrent and connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        connection.settings_dict['OPTIONS'].update(transaction_mode='IMMEDIATE', timeout=60)
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        connection.settings_dict['OPTIONS'] = old_options
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def build_synthetic_catalog(products, variants_per_product=0, seed=42, batch_size=2000, stdout=None):
+    """Bulk create a reproducible catalog; signals are not fired, so rebuild derived data afterwards"""
+    from .models import Category, SubCategory, Product, ProductVariant
+
+    rng = random.Random(seed)
+    fabrics = [value for value, label in Product.FABRIC_CHOICES]
+    occasions = [value for value, label in Product.OCCASION_CHOICES]
+
+    subcategories = []
+    for sort_order, (category_name, names) in enumerate(SUBCATEGORIES.items()):
+        category = Category.objects.create(
+            name=category_name, slug=category_name.lower(), description=f'{category_name} collection',
+            sort_order=sort_order,
+        )
+        for name in names:
+            subcategories.append(SubCategory.objects.create(
+                category=category, name=name, slug=name.lower().replace(' ', '-'),
+                description=f'{name} {category_name.lower()}',
+            ))
+
+    created = 0
+    while created < products:
+        batch = []
+        for number in range(created, min(created + batch_size, products)):
+            subcategory = rng.choice(subcategories)
+            category_name = subcategory.category.name
+            color, pattern = rng.choice(COLORS), rng.choice(PATTERNS)
+            fabric = rng.choice(fabrics)
+            kind = rng.choice(PRODUCT_TYPES[category_name])
+            mrp = Decimal(rng.randrange(299, 4999))
+            batch.append(Product(
+                category_id=subcategory.category_id,
+                subcategory=subcategory,
+                name=f'{color} {pattern} {subcategory.name} {kind}',
+                slug=f'synthetic-product-{number}',
+                description=(
+                    f'{pattern} {kind.lower()} in {color.lower()} {fabric.replace("_", " ")} with '
+                    f'{rng.choice(PATTERNS).lower()} border. Handcrafted in Lucknow.'
+                ),
+                short_description=f'{color} {pattern.lower()} {kind.lower()}',
+                fabric=fabric,
+                occasion=rng.choice(occasions),
+                care_instructions='Dry clean only',
+                mrp=mrp,
+                selling_price=(mrp * Decimal(rng.choice(['1', '0.9', '0.8', '0.7']))).quantize(Decimal('1')),
+                stock_quantity=rng.randrange(0, 100),
+                is_featured=rng.random() < 0.05,
+                is_bestseller=rng.random() < 0.02,
+            ))
+        Product.objects.bulk_create(batch)
+        created += len(batch)
+        if stdout:
+            stdout.write(f'  products: {created}/{products}')
+
+    if variants_per_product:
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        batch = []
+        for product_id in product_ids:
+            for size in rng.sample(SIZES, min(variants_per_product, len(SIZES))):
+                batch.append(ProductVariant(
+                    product_id=product_id, size=size, color=rng.choice(COLORS),
+                    stock_quantity=rng.randrange(0, 30),
+                    additional_price=Decimal(rng.choice([0, 0, 0, 50, 100])),
+                ))
+            if len(batch) >= batch_size:
+                ProductVariant.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            ProductVariant.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def build_synthetic_users(count, batch_size=5000):
+    """Bulk create customers with unusable passwords; returns their ids"""
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    for offset in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(username=f'shopper{number}', email=f'shopper{number}@example.com', password='!',
+                 first_name='Shopper', last_name=str(number))
+            for number in range(offset, min(offset + batch_size, count))
+        ])
+    return list(User.objects.filter(username__startswith='shopper').order_by('pk').values_list('pk', flat=True))
+
+
+def build_synthetic_reviews(count, user_ids, seed=42, batch_size=10000, stdout=None):
+    """Bulk create reviews spread evenly over the catalog, one per (product, user) pair"""
+    from .models import Product, Review
+
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    if count > len(product_ids) * len(user_ids):
+        raise ValueError(f'{count} reviews need more than {len(product_ids)} products x {len(user_ids)} users')
+    rng = random.Random(seed)
+    ratings = [5, 5, 5, 4, 4, 4, 3, 2, 1]
+    for offset in range(0, count, batch_size):
+        batch = []
+        for number in range(offset, min(offset + batch_size, count)):
+            # The n-th review of a product goes to the next user along, so pairs never repeat
+            product_index, round_number = number % len(product_ids), number // len(product_ids)
+            rating = rng.choice(ratings)
+            batch.append(Review(
+                product_id=product_ids[product_index],
+                user_id=user_ids[(product_index + round_number) % len(user_ids)],
+                rating=rating, title=f'{rating} stars', comment='Lovely fabric and colour, as pictured.',
+                is_approved=rng.random() < 0.9, is_verified_purchase=rng.random() < 0.5,
+            ))
+        Review.objects.bulk_create(batch)
+        if stdout:
+            stdout.write(f'  reviews: {offset + len(batch)}/{count}')
+
+
+def rebuild_rating_stats(batch_size=5000):
+    """Recompute every product's rating aggregates and the site stats from the approved reviews"""
+    from .models import Product, Review, SiteStats
+
+    histograms = {product_id: [0] * 5 for product_id in Product.objects.values_list('pk', flat=True)}
+    star_counts = (Review.objects.filter(is_approved=True).order_by()
+                   .values_list('product_id', 'rating').annotate(count=Count('id')))
+    for product_id, rating, count in star_counts:
+        if 1 <= rating <= 5:
+            histograms[product_id][rating - 1] = count
+
+    products = []
+    for product_id, histogram in histograms.items():
+        count = sum(histogram)
+        total = sum(stars * n for stars, n in enumerate(histogram, start=1))
+        products.append(Product(
+            pk=product_id, rating_count=count, rating_histogram=histogram,
+            rating_avg=(Decimal(total) / count).quantize(Decimal('0.01')) if count else Decimal('0'),
+        ))
+    Product.objects.bulk_update(products, ['rating_avg', 'rating_count', 'rating_histogram'], batch_size=batch_size)
+    SiteStats.rebuild()
+
+
+def build_synthetic_orders(count, user_ids, seed=42, batch_size=5000, stdout=None):
+    """Bulk create past orders of one to four catalog products each"""
+    from checkout.models import Order, OrderItem
+    from .models import Product
+
+    rng = random.Random(seed)
+    products = list(Product.objects.order_by('pk').values_list('pk', 'name', 'selling_price'))
+    statuses = ['delivered', 'delivered', 'delivered', 'shipped', 'confirmed', 'pending', 'cancelled', 'returned']
+    for offset in range(0, count, batch_size):
+        orders, lines = [], []
+        for number in range(offset, min(offset + batch_size, count)):
+            items = []
+            for product_id, name, price in rng.sample(products, min(rng.randint(1, 4), len(products))):
+                quantity = rng.randint(1, 3)
+                items.append(OrderItem(product_id=product_id, product_name=name, product_price=price,
+                                       quantity=quantity, total_price=price * quantity))
+            subtotal = sum(item.total_price for item in items)
+            orders.append(Order(
+                order_number=f'SYN{number:010d}', user_id=rng.choice(user_ids),
+                shipping_full_name='Synthetic Shopper', shipping_phone='9999999999',
+                shipping_address_line_1='1 Hazratganj', shipping_city='Lucknow',
+                shipping_state='Uttar Pradesh', shipping_pin_code='226001',
+                status=rng.choice(statuses), payment_method=rng.choice(['cod', 'upi', 'card']),
+                payment_status='completed', subtotal=subtotal, total_amount=subtotal,
+            ))
+            lines.append(items)
+        Order.objects.bulk_create(orders)
+        for order, items in zip(orders, lines):
+            for item in items:
+                item.order = order
+        OrderItem.objects.bulk_create([item for items in lines for item in items], batch_size=batch_size)
+        if stdout:
+            stdout.write(f'  orders: {offset + len(orders)}/{count}')
+
+
+def measure(func, repeat=5):
+    """Run func repeat times; returns (median ms, min ms, last result)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), min(timings), result
+
+
+def rss_bytes():
+    """Current resident set size of this process (Linux), or the peak so far elsewhere"""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,300 @@
+"""
+Bulk catalog writes for management commands.
+
+Saving products one at a time runs an UPDATE, the auto_now bump and every
+catalog signal receiver (facet and search index refresh, site stats, cache
+version bumps) per row. BulkOperation writes the same changes with
+QuerySet.update, bulk_update and bulk_create in chunks and, instead of the
+per-row receivers, brings the derived data up to date once per chunk.
+
+Rows are read in primary key order, one chunk per query (keyset pagination
+rather than a single server-side cursor: SQLite has no isolation between a
+cursor and writes to the table it is reading, and every operation here
+writes while it reads). auto_now fields are set explicitly, since update()
+and bulk_update() skip them.
+
+Signal modes (--signals on a BulkCommand):
+
+    batch  (default) receivers are muted; the facet and search index entries
+           and primary images of the changed rows are refreshed per chunk,
+           cache versions and site stats once at the end
+    each   every row is saved on its own and fires its signals, as before
+    off    receivers are muted and only the cheap end-of-run refreshes run
+           (cache versions, so facet indexes rebuild lazily, and site stats);
+           run rebuild_search_index, or backfill_primary_images and
+           generate_image_derivatives after image changes, afterwards
+
+With dry_run nothing is written; operations return the number of rows they
+would have changed.
+"""
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from . import facets, search_engine
+from .models import Product, ProductImage, ProductVariant, SiteStats
+from .versioning import CATALOG_VERSION, bump_version
+
+
+SIGNAL_MODES = ('batch', 'each', 'off')
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Product fields whose changes reach the facet or search index
+SEARCH_FIELDS = {
+    'name', 'short_description', 'description', 'fabric', 'occasion', 'category', 'subcategory', 'is_active',
+}
+VARIANT_FACET_FIELDS = {'product', 'size', 'color', 'is_active'}
+
+_muted = ContextVar('bulk_signals_muted', default=False)
+
+
+def unless_muted(receiver):
+    """Skip a signal receiver while a bulk operation has muted signals"""
+    @functools.wraps(receiver)
+    def wrapper(*args, **kwargs):
+        if _muted.get():
+            return None
+        return receiver(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def muted_signals():
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def _auto_now_fields(model):
+    return [field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+
+def _touches(fields, watched):
+    """fields is None for rows that were created or deleted"""
+    return fields is None or bool(set(fields) & set(watched))
+
+
+class BulkOperation:
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, signals='batch', progress=None):
+        if signals not in SIGNAL_MODES:
+            raise ValueError(f'signals must be one of {", ".join(SIGNAL_MODES)}')
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.signals = signals
+        self.progress = progress
+        self.pending = set()
+
+    # Reading
+
+    def chunks(self, queryset, label=None):
+        """Lists of at most chunk_size objects, in primary key order"""
+        total = queryset.count() if self.progress and label else None
+        queryset = queryset.order_by('pk')
+        done, last, started = 0, None, time.perf_counter()
+        while True:
+            page = queryset if last is None else queryset.filter(pk__gt=last)
+            chunk = list(page[:self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last = chunk[-1].pk
+            done += len(chunk)
+            if total is not None:
+                self.progress(f'  {done:,}/{total:,} {label} ({time.perf_counter() - started:.1f}s)')
+
+    # Writing
+
+    def update(self, queryset, label=None, **values):
+        """QuerySet.update() of the given values; returns the number of rows"""
+        model = queryset.model
+        fields = list(values)
+        if self.dry_run:
+            return queryset.count()
+        now = timezone.now()
+        for name in _auto_now_fields(model):
+            values.setdefault(name, now)
+
+        if self.signals == 'each':
+            count = 0
+            for chunk in self.chunks(queryset, label):
+                with transaction.atomic():
+                    for instance in chunk:
+                        for name, value in values.items():
+                            setattr(instance, name, value)
+                        instance.save(update_fields=list(values))
+                count += len(chunk)
+            return count
+
+        if self.signals == 'off' or not self._needs_rows(model, fields):
+            with muted_signals():
+                count = queryset.update(**values)
+            self._defer(model, fields, facet_index=self._needs_rows(model, fields))
+            return count
+
+        # The derived data of the changed rows is refreshed, so update them a chunk at a time
+        count = 0
+        for chunk in self.chunks(queryset.only('pk', *self._key_fields(model)), label):
+            with muted_signals():
+                count += model.objects.filter(pk__in=[instance.pk for instance in chunk]).update(**values)
+            self._sync(model, chunk, fields)
+        return count
+
+    def bulk_update(self, instances, fields):
+        """bulk_update() of instances whose fields were changed in memory"""
+        instances = list(instances)
+        if self.dry_run or not instances:
+            return len(instances)
+        model = type(instances[0])
+        fields = list(fields)
+        now = timezone.now()
+        for name in _auto_now_fields(model):
+            for instance in instances:
+                setattr(instance, name, now)
+
+        if self.signals == 'each':
+            with transaction.atomic():
+                for instance in instances:
+                    instance.save(update_fields=fields + _auto_now_fields(model))
+            return len(instances)
+        with muted_signals():
+            model.objects.bulk_update(instances, fields + _auto_now_fields(model), batch_size=self.chunk_size)
+        self._sync(model, instances, fields)
+        return len(instances)
+
+    def bulk_create(self, instances):
+        """bulk_create(); returns the created instances (unsaved on a dry run)"""
+        instances = list(instances)
+        if self.dry_run or not instances:
+            return instances
+        if self.signals == 'each':
+            with transaction.atomic():
+                for instance in instances:
+                    instance.save()
+            return instances
+        model = type(instances[0])
+        with muted_signals():
+            created = model.objects.bulk_create(instances, batch_size=self.chunk_size)
+        self._sync(model, created, None)
+        return created
+
+    def delete(self, queryset):
+        """QuerySet.delete(); returns the number of rows of the queryset's model"""
+        model = queryset.model
+        if self.dry_run:
+            return queryset.count()
+        if self.signals == 'each':
+            return queryset.delete()[1].get(model._meta.label, 0)
+        instances = list(queryset.only('pk', *self._key_fields(model)))
+        with muted_signals():
+            deleted = model.objects.filter(pk__in=[instance.pk for instance in instances]).delete()
+        self._sync(model, instances, None)
+        return deleted[1].get(model._meta.label, 0)
+
+    def finish(self):
+        """Apply the refreshes collected for the end of the run"""
+        if 'facet_index' in self.pending:
+            bump_version(facets.FACET_INDEX_VERSION)
+        if 'catalog' in self.pending:
+            bump_version(CATALOG_VERSION)
+        if 'cart_prices' in self.pending:
+            from cart.summary import CART_PRICES_VERSION
+            bump_version(CART_PRICES_VERSION)
+        if 'stats' in self.pending:
+            SiteStats.rebuild()
+        self.pending.clear()
+
+    # What the muted receivers in shop/signals.py and cart/signals.py would have done
+
+    def _key_fields(self, model):
+        return ['product'] if model in (ProductVariant, ProductImage) else []
+
+    def _needs_rows(self, model, fields):
+        """Whether refreshing after a change of fields needs to know which rows changed"""
+        if model is Product:
+            return _touches(fields, set(facets.INDEXED_FIELDS) | SEARCH_FIELDS)
+        if model is ProductVariant:
+            return _touches(fields, VARIANT_FACET_FIELDS)
+        return model is ProductImage
+
+    def _defer(self, model, fields, facet_index=False):
+        """The once-per-run refreshes; facet_index rebuilds the facet index everywhere, lazily"""
+        if facet_index:
+            self.pending.add('facet_index')
+        if model in (Product, ProductVariant) and not (fields is not None and set(fields) <= {'updated_at'}):
+            self.pending.add('catalog')
+        if model is Product and _touches(fields, ['is_active']):
+            self.pending.add('stats')
+        if _touches(fields, ['selling_price', 'additional_price']) and model in (Product, ProductVariant):
+            self.pending.add('cart_prices')
+
+    def _sync(self, model, instances, fields):
+        """Refresh the derived data of changed, created (fields None) or deleted instances"""
+        if model is ProductImage and fields is not None and 'image' in fields:
+            # bulk_update() skips ProductImage.save(): mark the files pending for generate_image_derivatives
+            ProductImage.objects.filter(pk__in=[instance.pk for instance in instances]).update(content_hash='')
+        if self.signals == 'off':
+            self._defer(model, fields, facet_index=model is not ProductImage)
+            return
+        self._defer(model, fields)
+        if model is Product:
+            product_ids = [instance.pk for instance in instances]
+            if _touches(fields, facets.INDEXED_FIELDS):
+                facets.refresh_products(product_ids)
+            if _touches(fields, SEARCH_FIELDS):
+                products = list(Product.objects.filter(pk__in=product_ids).select_related('category', 'subcategory'))
+                search_engine.index_products(products)
+                deleted = set(product_ids) - {product.pk for product in products}
+                if deleted:
+                    search_engine.remove_products(deleted)
+        elif model is ProductVariant:
+            if _touches(fields, VARIANT_FACET_FIELDS):
+                facets.refresh_products({instance.product_id for instance in instances})
+        elif model is ProductImage:
+            product_ids = {instance.product_id for instance in instances}
+            Product.update_primary_images(product_ids)
+            Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+            if fields is None:
+                # Created rows are pending (blank content_hash); this renders them when
+                # IMAGE_DERIVATIVES_MODE is 'sync', as ProductImage.save() would
+                from .images import schedule
+                for image in ProductImage.objects.filter(pk__in=[instance.pk for instance in instances]):
+                    schedule(image)
+
+
+class BulkCommand(BaseCommand):
+    """A management command whose writes go through self.bulk, a BulkOperation"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per query')
+        parser.add_argument('--progress', action='store_true', help='Report progress after every chunk')
+        parser.add_argument('--signals', choices=SIGNAL_MODES, default='batch',
+                            help='batch: refresh derived data per chunk (default); each: save row by row, '
+                                 'firing signals; off: no refresh, rebuild indexes and stats afterwards')
+
+    def execute(self, *args, **options):
+        self.bulk = BulkOperation(
+            chunk_size=options['chunk_size'], dry_run=options['dry_run'], signals=options['signals'],
+            progress=self.stdout.write if options['progress'] else None,
+        )
+        started = time.perf_counter()
+        output = super().execute(*args, **options)
+        self.bulk.finish()
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: nothing was written'))
+        elif options['signals'] == 'off':
+            self.stdout.write(self.style.WARNING(
+                'Signals were off: run rebuild_search_index, or backfill_primary_images and '
+                'generate_image_derivatives after image changes'
+            ))
+        if options['progress']:
+            self.stdout.write(f'Finished in {time.perf_counter() - started:.1f}s')
+        return output
@@ -1,41 +1,59 @@
+import threading
+from types import MappingProxyType
+
 from django.conf import settings
-from django.db import models
+from django.db.models import Prefetch
 from .models import Category, SubCategory, Wishlist
-from cart.models import Cart
+from .versioning import NAVIGATION_VERSION, get_version
+from cart.summary import get_cart_summary
 
 
-def categories_context(request):
-    """Add categories and subcategories to template context"""
-    categories = Category.objects.filter(is_active=True).order_by('sort_order', 'name')
-    
-    # Get subcategories grouped by category for navbar dropdown
+_navigation_cache = {'version': None, 'tree': None}
+_navigation_lock = threading.Lock()
+
+
+def _build_navigation_tree():
+    """Load active categories with their active subcategories in two queries"""
+    active_subcategories = SubCategory.objects.filter(is_active=True).order_by('sort_order', 'name')
+    categories = tuple(
+        Category.objects.filter(is_active=True)
+        .order_by('sort_order', 'name')
+        .prefetch_related(Prefetch('subcategories', queryset=active_subcategories))
+    )
+
     subcategories_by_category = {}
     for category in categories:
-        subcategories = SubCategory.objects.filter(
-            category=category, 
-            is_active=True
-        ).order_by('sort_order', 'name')
-        if subcategories.exists():
+        subcategories = tuple(category.subcategories.all())
+        if subcategories:
             subcategories_by_category[category] = subcategories
-    
+
     return {
         'categories': categories,
-        'subcategories_by_category': subcategories_by_category
+        'subcategories_by_category': MappingProxyType(subcategories_by_category),
     }
 
 
+def get_navigation_tree():
+    """Return the shared navbar tree, rebuilding it when the catalog version changes"""
+    version = get_version(NAVIGATION_VERSION)
+    if _navigation_cache['version'] != version:
+        with _navigation_lock:
+            if _navigation_cache['version'] != version:
+                _navigation_cache['tree'] = _build_navigation_tree()
+                _navigation_cache['version'] = version
+    return _navigation_cache['tree']
+
+
+def categories_context(request):
+    """Add categories and subcategories to template context"""
+    return dict(get_navigation_tree())
+
+
 def cart_context(request):
     """Add cart information to template context"""
-    cart_items_count = 0
-    cart_total = 0
-    
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            cart_items_count = cart.total_items
-            cart_total = cart.total_amount
-        except Cart.DoesNotExist:
-            pass
+    summary = get_cart_summary(request.user)
+    cart_items_count = summary.total_items
+    cart_total = summary.total_amount
     
     return {
         'cart_items_count': cart_items_count,
@@ -62,14 +80,12 @@ def wishlist_context(request):
 
 def site_settings(request):
     """Add site-wide settings to template context"""
-    from .models import Product, Review
+    from .models import SiteStats
     
-    # Calculate dynamic stats
-    total_products = Product.objects.filter(is_active=True).count()
-    total_reviews = Review.objects.filter(is_approved=True).count()
-    avg_rating = Review.objects.filter(is_approved=True).aggregate(
-        avg_rating=models.Avg('rating')
-    )['avg_rating'] or 4.0
+    # Precomputed stats, maintained by signals in shop.signals
+    stats = SiteStats.get_snapshot()
+    total_products = stats.total_products
+    avg_rating = stats.average_rating or 4.0
     
     return {
         'site_name': 'King Dupatta House',
@@ -0,0 +1,368 @@
+"""
+Facet index for the shop listing.
+
+Every active product gets a slot; each facet value (fabric, occasion,
+category, subcategory, variant size, variant colour, price bucket and the
+special flags) keeps a bitset of slots held in a Python int. Filters are
+intersected with `&` and facet counts come from `int.bit_count()`, so a
+listing with all of its facet counts is answered without touching the
+database. The index lives per process: changes are applied incrementally
+in the process that saw them, and other processes rebuild lazily when the
+index version moves on.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from .versioning import get_version, bump_held_version, bump_version, register
+
+
+FACET_INDEX_VERSION = register('facet_index')
+
+FACETS = ('category', 'subcategory', 'fabric', 'occasion', 'size', 'color', 'price')
+FLAGS = ('sale', 'bestseller', 'featured')
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = (
+    ('under-500', 'Under ₹500', None, 500),
+    ('500-1000', '₹500 - ₹1,000', 500, 1000),
+    ('1000-2000', '₹1,000 - ₹2,000', 1000, 2000),
+    ('2000-5000', '₹2,000 - ₹5,000', 2000, 5000),
+    ('over-5000', 'Above ₹5,000', 5000, None),
+)
+
+NEW_ARRIVAL_DAYS = 30
+
+# Same orders as shop.pagination.SORT_ORDERS
+SORT_KEYS = {
+    'featured': lambda entry: (not entry.is_featured, -entry.created, -entry.id),
+    'price_low': lambda entry: (entry.price, entry.id),
+    'price_high': lambda entry: (-entry.price, entry.id),
+    'newest': lambda entry: (-entry.created, -entry.id),
+    'rating': lambda entry: (-entry.rating_avg, -entry.rating_count, -entry.created, -entry.id),
+    'popularity': lambda entry: (not entry.is_bestseller, not entry.is_featured, -entry.created, -entry.id),
+}
+
+# Fields whose changes alter a product's slot, facet values or sort position
+INDEXED_FIELDS = [
+    'category', 'subcategory', 'fabric', 'occasion', 'mrp', 'selling_price', 'is_active',
+    'is_featured', 'is_bestseller', 'rating_avg', 'rating_count',
+]
+
+Entry = namedtuple('Entry', [
+    'id', 'price', 'created', 'is_featured', 'is_bestseller', 'rating_avg', 'rating_count', 'values',
+])
+
+FacetResult = namedtuple('FacetResult', ['product_ids', 'counts'])
+
+# Set bit positions of every byte value, for walking a bitset a byte at a time
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+
+
+def price_bucket(price):
+    for key, label, low, high in PRICE_BUCKETS:
+        if (low is None or price >= low) and (high is None or price < high):
+            return key
+    return None
+
+
+def iter_slots(bits):
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(data):
+        if byte:
+            base = index * 8
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+def bits_from_slots(slots, size):
+    data = bytearray((size + 7) // 8)
+    for slot in slots:
+        data[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(data, 'little')
+
+
+class FacetSelection:
+    """Filters requested for a listing, parsed from query parameters"""
+
+    def __init__(self, values=None, flags=(), min_price=None, max_price=None, new=False,
+                 color=None, product_ids=None):
+        self.values = {facet: list(selected) for facet, selected in (values or {}).items() if selected}
+        self.flags = set(flags)
+        self.min_price = min_price
+        self.max_price = max_price
+        self.new = new
+        self.color = color
+        self.product_ids = product_ids
+
+    def copy(self, **changes):
+        attributes = dict(
+            values=self.values, flags=self.flags, min_price=self.min_price, max_price=self.max_price,
+            new=self.new, color=self.color, product_ids=self.product_ids,
+        )
+        attributes.update(changes)
+        return FacetSelection(**attributes)
+
+    def signature(self):
+        """Hashable identity of the filters; product_ids are left to the caller to identify"""
+        return (
+            tuple(sorted((facet, tuple(sorted(values))) for facet, values in self.values.items())),
+            tuple(sorted(self.flags)), self.min_price, self.max_price, self.new, self.color,
+        )
+
+    @classmethod
+    def from_params(cls, params):
+        def price(name):
+            try:
+                return float(Decimal(params.get(name)))
+            except (TypeError, InvalidOperation):
+                return None
+
+        flags = [flag for flag in FLAGS if params.get(flag) == 'true']
+        if params.get('trending') == 'true':
+            flags.append('featured')
+        return cls(
+            values={
+                'category': [slug for slug in [params.get('category')] if slug],
+                'subcategory': [slug for slug in [params.get('subcategory')] if slug],
+                'fabric': params.getlist('fabric'),
+                'occasion': params.getlist('occasion'),
+                'size': [size for size in [params.get('size')] if size],
+                'price': params.getlist('price'),
+            },
+            flags=flags,
+            min_price=price('min_price'),
+            max_price=price('max_price'),
+            new=params.get('new') == 'true',
+            color=(params.get('color') or '').strip().lower() or None,
+        )
+
+
+class FacetIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self.entries = []        # slot -> Entry, or None for a free slot
+        self.slots = {}          # product_id -> slot
+        self.free = []
+        self.all = 0
+        self.bits = {facet: {} for facet in FACETS + FLAGS}
+        self.by_price = []       # sorted (price, slot)
+        self.by_created = []     # sorted (created, slot)
+
+    def _load(self, product_ids=None):
+        """Read the indexed values of active products (all of them when product_ids is None)"""
+        from .models import Product, ProductVariant
+
+        products = Product.objects.filter(is_active=True)
+        variants = ProductVariant.objects.filter(is_active=True, product__is_active=True)
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+            variants = variants.filter(product_id__in=product_ids)
+
+        variant_values = {}
+        for product_id, size, color in variants.values_list('product_id', 'size', 'color').iterator(chunk_size=5000):
+            sizes, colors = variant_values.setdefault(product_id, (set(), set()))
+            sizes.add(size)
+            colors.add(color.strip().lower())
+
+        rows = products.values_list(
+            'id', 'category__slug', 'subcategory__slug', 'fabric', 'occasion', 'mrp', 'selling_price',
+            'created_at', 'is_featured', 'is_bestseller', 'rating_avg', 'rating_count',
+        )
+        entries = []
+        for (product_id, category, subcategory, fabric, occasion, mrp, price, created,
+             is_featured, is_bestseller, rating_avg, rating_count) in rows.iterator(chunk_size=5000):
+            sizes, colors = variant_values.get(product_id, ((), ()))
+            values = {
+                'category': (category,),
+                'subcategory': (subcategory,),
+                'fabric': (fabric,),
+                'occasion': (occasion,),
+                'size': tuple(sizes),
+                'color': tuple(colors),
+                'price': (price_bucket(price),),
+                'sale': (True,) if mrp > price else (),
+                'bestseller': (True,) if is_bestseller else (),
+                'featured': (True,) if is_featured else (),
+            }
+            entries.append(Entry(
+                product_id, float(price), created.timestamp(), is_featured, is_bestseller,
+                float(rating_avg), rating_count, values,
+            ))
+        return entries
+
+    def _build(self):
+        self._reset()
+        entries = self._load()
+        size = len(entries)
+        slots_by_value = {facet: {} for facet in self.bits}
+        for slot, entry in enumerate(entries):
+            self.entries.append(entry)
+            self.slots[entry.id] = slot
+            for facet, values in entry.values.items():
+                for value in values:
+                    slots_by_value[facet].setdefault(value, []).append(slot)
+        for facet, values in slots_by_value.items():
+            self.bits[facet] = {value: bits_from_slots(slots, size) for value, slots in values.items()}
+        self.all = (1 << size) - 1
+        self.by_price = sorted((entry.price, slot) for slot, entry in enumerate(entries))
+        self.by_created = sorted((entry.created, slot) for slot, entry in enumerate(entries))
+
+    def _ensure_current(self):
+        version = get_version(FACET_INDEX_VERSION)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build()
+                    self._version = version
+
+    def rebuild(self):
+        with self._lock:
+            self._build()
+            self._version = bump_version(FACET_INDEX_VERSION)
+        return len(self.slots)
+
+    def _remove(self, product_id):
+        slot = self.slots.pop(product_id, None)
+        if slot is None:
+            return
+        entry = self.entries[slot]
+        mask = ~(1 << slot)
+        for facet, values in entry.values.items():
+            for value in values:
+                bits = self.bits[facet][value] & mask
+                if bits:
+                    self.bits[facet][value] = bits
+                else:
+                    del self.bits[facet][value]
+        self.all &= mask
+        del self.by_price[bisect_left(self.by_price, (entry.price, slot))]
+        del self.by_created[bisect_left(self.by_created, (entry.created, slot))]
+        self.entries[slot] = None
+        self.free.append(slot)
+
+    def _add(self, entry):
+        if self.free:
+            slot = self.free.pop()
+            self.entries[slot] = entry
+        else:
+            slot = len(self.entries)
+            self.entries.append(entry)
+        self.slots[entry.id] = slot
+        bit = 1 << slot
+        for facet, values in entry.values.items():
+            for value in values:
+                self.bits[facet][value] = self.bits[facet].get(value, 0) | bit
+        self.all |= bit
+        insort(self.by_price, (entry.price, slot))
+        insort(self.by_created, (entry.created, slot))
+
+    def refresh_products(self, product_ids):
+        """Re-read products after a change; missing or inactive ones drop out of the index"""
+        product_ids = list(product_ids)
+        with self._lock:
+            current = self._version is not None and self._version == get_version(FACET_INDEX_VERSION)
+            if current:
+                for product_id in product_ids:
+                    self._remove(product_id)
+                for entry in self._load(product_ids):
+                    self._add(entry)
+            # Keep the local copy only if no other process bumped in between
+            version = bump_held_version(FACET_INDEX_VERSION, self._version)
+            self._version = version if current else None
+
+    def _range_bits(self, pairs, low, high):
+        """Bitset of slots whose value in a sorted (value, slot) list lies in [low, high]"""
+        start = 0 if low is None else bisect_left(pairs, (low, -1))
+        end = len(pairs) if high is None else bisect_right(pairs, (high, len(self.entries)))
+        if start == 0 and end == len(pairs):
+            return self.all
+        return bits_from_slots((slot for value, slot in pairs[start:end]), len(self.entries))
+
+    def _constraints(self, selection):
+        """(facet or None, bitset) for every active filter"""
+        constraints = []
+        for facet, selected in selection.values.items():
+            bits = 0
+            for value in selected:
+                bits |= self.bits[facet].get(value, 0)
+            constraints.append((facet, bits))
+        if selection.color:
+            # Substring match, as the colour filter has always been
+            bits = 0
+            for value, value_bits in self.bits['color'].items():
+                if selection.color in value:
+                    bits |= value_bits
+            constraints.append(('color', bits))
+        for flag in selection.flags:
+            constraints.append((None, self.bits[flag].get(True, 0)))
+        if selection.min_price is not None or selection.max_price is not None:
+            constraints.append((None, self._range_bits(self.by_price, selection.min_price, selection.max_price)))
+        if selection.new:
+            cutoff = (timezone.now() - timedelta(days=NEW_ARRIVAL_DAYS)).timestamp()
+            constraints.append((None, self._range_bits(self.by_created, cutoff, None)))
+        if selection.product_ids is not None:
+            slots = (self.slots[product_id] for product_id in selection.product_ids if product_id in self.slots)
+            constraints.append((None, bits_from_slots(slots, len(self.entries))))
+        return constraints
+
+    def query(self, selection, sort='featured', counts=True):
+        """Matching product ids in sort order, plus live counts for every facet value.
+
+        Counts for a facet ignore that facet's own filter, so selecting one
+        fabric still shows how many products every other fabric would add.
+        """
+        self._ensure_current()
+        with self._lock:
+            constraints = self._constraints(selection)
+            matched = self.all
+            for facet, bits in constraints:
+                matched &= bits
+
+            facet_counts = {}
+            if counts:
+                for facet in FACETS:
+                    base = matched
+                    if any(name == facet for name, bits in constraints):
+                        base = self.all
+                        for name, bits in constraints:
+                            if name != facet:
+                                base &= bits
+                    facet_counts[facet] = {
+                        value: (base & bits).bit_count() for value, bits in self.bits[facet].items()
+                    }
+                for flag in FLAGS:
+                    facet_counts[flag] = (matched & self.bits[flag].get(True, 0)).bit_count()
+
+            entries = [self.entries[slot] for slot in iter_slots(matched)]
+
+        entries.sort(key=SORT_KEYS.get(sort, SORT_KEYS['featured']))
+        return FacetResult([entry.id for entry in entries], facet_counts)
+
+
+_index = FacetIndex()
+
+
+def get_index():
+    return _index
+
+
+def query(selection, sort='featured', counts=True):
+    return _index.query(selection, sort, counts)
+
+
+def refresh_products(product_ids):
+    _index.refresh_products(product_ids)
+
+
+def rebuild_index():
+    return _index.rebuild()
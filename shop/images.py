@@ -0,0 +1,330 @@
+"""
+Product image derivatives.
+
+Uploads are kept as they are; a fixed set of sizes is rendered from them in
+WebP and JPEG. Derivatives are content-addressed: they live under
+derivatives/<hash[:2]>/<hash>/ in the default storage, hash being the
+sha256 of the original, next to a manifest.json, so the same bytes are only
+ever rendered once and re-saving an image is a no-op. The manifest is also
+stored on ProductImage.derivatives, which is what templates read.
+
+Saving an image whose manifest does not match its file only marks it
+pending, by clearing content_hash; web processes never render. Pending
+images are rendered by `generate_image_derivatives`, from cron or running as
+a worker with --watch. IMAGE_DERIVATIVES_MODE = 'sync' renders in the saving
+process instead, after the transaction commits (development and tests).
+
+Files are read and written through the storage API, so any storage backend
+works. `render_derivatives` takes and returns bytes and only needs Pillow,
+so it can run in a process pool without Django being set up in the workers.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+
+logger = logging.getLogger(__name__)
+
+# Name -> target width in pixels; never upscaled past the original
+DERIVATIVE_SIZES = {
+    'thumbnail': 120,
+    'card': 400,
+    'gallery': 800,
+    'zoom': 1600,
+}
+
+FORMATS = {
+    'webp': {'extension': 'webp', 'options': {'quality': 80, 'method': 4}},
+    'jpeg': {'extension': 'jpg', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+DERIVATIVES_DIR = 'derivatives'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def derivatives_dir(digest):
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}'
+
+
+def _flatten(image):
+    """JPEG has no alpha channel; composite transparent images onto white"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def render_derivatives(data, digest=None):
+    """Render every size and format of an original's bytes; returns (manifest, {storage path: bytes})"""
+    digest = digest or content_hash(data)
+    directory = derivatives_dir(digest)
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    width, height = image.size
+
+    sizes = {}
+    files = {}
+    rendered = {}  # width -> entry, for sizes capped at the original width
+    for name, target_width in DERIVATIVE_SIZES.items():
+        scaled_width = min(target_width, width)
+        if scaled_width in rendered:
+            sizes[name] = rendered[scaled_width]
+            continue
+        scaled_height = max(1, round(height * scaled_width / width))
+        resized = image if scaled_width == width else image.resize((scaled_width, scaled_height), Image.LANCZOS)
+        entry = {'width': scaled_width, 'height': scaled_height}
+        for format_name, spec in FORMATS.items():
+            if format_name == 'webp' and not features.check('webp'):
+                continue
+            if format_name == 'jpeg':
+                output = _flatten(resized)
+            else:
+                output = resized if resized.mode in ('RGB', 'RGBA') else resized.convert('RGBA')
+            path = f'{directory}/{name}.{spec["extension"]}'
+            buffer = io.BytesIO()
+            output.save(buffer, format=format_name.upper(), **spec['options'])
+            files[path] = buffer.getvalue()
+            entry[format_name] = path
+        sizes[name] = rendered[scaled_width] = entry
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'hash': digest,
+        'width': width,
+        'height': height,
+        'sizes': sizes,
+    }
+    return manifest, files
+
+
+def _render_job(job):
+    image_id, source_name, data, digest = job
+    try:
+        manifest, files = render_derivatives(data, digest)
+        return image_id, source_name, manifest, files, None
+    except Exception as exc:  # reported per image, the batch carries on
+        return image_id, source_name, None, None, f'{type(exc).__name__}: {exc}'
+
+
+# Storage
+
+def _storage():
+    from django.core.files.storage import default_storage
+    return default_storage
+
+
+def _write(storage, path, data):
+    from django.core.files.base import ContentFile
+
+    # save() would pick another name for an existing file; derivatives are rewritten in place
+    if storage.exists(path):
+        storage.delete(path)
+    storage.save(path, ContentFile(data))
+
+
+def stored_manifest(digest, storage=None):
+    """The manifest already rendered for these bytes, or None"""
+    storage = storage or _storage()
+    path = f'{derivatives_dir(digest)}/{MANIFEST_NAME}'
+    if not storage.exists(path):
+        return None
+    with storage.open(path, 'rb') as handle:
+        manifest = json.loads(handle.read())
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def store_derivatives(manifest, files, storage=None):
+    storage = storage or _storage()
+    for path, data in files.items():
+        _write(storage, path, data)
+    # Written last: its presence means every derivative is in place
+    _write(storage, f'{derivatives_dir(manifest["hash"])}/{MANIFEST_NAME}', json.dumps(manifest).encode())
+
+
+def generate(product_images, workers=None, batch_size=None):
+    """Render and store the derivatives of ProductImages; yields (image_id, error or None) as each finishes.
+
+    Originals are read a batch at a time in this process and rendered by
+    `workers` processes (default one per CPU; 1 renders in this process).
+    """
+    storage = _storage()
+    batch_size = batch_size or (workers or os.cpu_count() or 1) * 4
+    pool = None if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+    try:
+        batch = []
+        for product_image in product_images:
+            batch.append(product_image)
+            if len(batch) >= batch_size:
+                yield from _generate_batch(batch, storage, pool)
+                batch = []
+        if batch:
+            yield from _generate_batch(batch, storage, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _generate_batch(product_images, storage, pool):
+    jobs = []
+    for product_image in product_images:
+        try:
+            with product_image.image.open('rb') as handle:
+                data = handle.read()
+        except (OSError, ValueError) as exc:
+            yield product_image.pk, f'Cannot read {product_image.image.name}: {exc}'
+            continue
+        digest = content_hash(data)
+        manifest = stored_manifest(digest, storage)
+        if manifest is not None:
+            manifest['source'] = product_image.image.name
+            apply_manifest(product_image.pk, manifest)
+            yield product_image.pk, None
+        else:
+            jobs.append((product_image.pk, product_image.image.name, data, digest))
+
+    results = map(_render_job, jobs) if pool is None else pool.map(_render_job, jobs)
+    for image_id, source_name, manifest, files, error in results:
+        if error:
+            yield image_id, error
+            continue
+        store_derivatives(manifest, files, storage)
+        manifest['source'] = source_name
+        apply_manifest(image_id, manifest)
+        yield image_id, None
+
+
+def apply_manifest(image_id, manifest):
+    """Store a manifest, unless the image has been replaced while it was rendering"""
+    from .models import Product, ProductImage
+
+    images = ProductImage.objects.filter(pk=image_id, image=manifest['source'])
+    updated = images.update(content_hash=manifest['hash'], derivatives=manifest)
+    if updated:
+        # update() skips the ProductImage signals, so refresh the product's copy here
+        Product.update_primary_images(images.values_list('product_id', flat=True))
+    return updated
+
+
+def needs_derivatives(product_image):
+    manifest = product_image.derivatives or {}
+    return bool(product_image.image) and (
+        not product_image.content_hash
+        or manifest.get('source') != product_image.image.name
+        or manifest.get('version') != MANIFEST_VERSION
+    )
+
+
+# Lookups from a stored manifest; no filesystem access while rendering
+
+# Default `sizes` attribute for each slot an image is displayed in
+DISPLAY_SIZES = {
+    'thumbnail': '120px',
+    'card': '(max-width: 576px) 50vw, (max-width: 992px) 33vw, 25vw',
+    'gallery': '(max-width: 992px) 100vw, 50vw',
+    'zoom': '100vw',
+}
+
+
+def _media_url(path):
+    from django.core.files.storage import default_storage
+    return default_storage.url(path)
+
+
+def derivative(manifest, size):
+    """The manifest entry for a size, or None when derivatives are not ready"""
+    if not manifest or 'sizes' not in manifest:
+        return None
+    return manifest['sizes'].get(size)
+
+
+def derivative_url(manifest, size='card', image_format='jpeg'):
+    entry = derivative(manifest, size)
+    if entry and entry.get(image_format):
+        return _media_url(entry[image_format])
+    return None
+
+
+def srcset(manifest, image_format='jpeg', size=None):
+    """`url 120w, url 400w, ...` — up to the first width covering a 2x screen for the given size"""
+    if not manifest or 'sizes' not in manifest:
+        return ''
+    limit = DERIVATIVE_SIZES.get(size, max(DERIVATIVE_SIZES.values())) * 2
+    candidates = {}
+    for entry in manifest['sizes'].values():
+        if entry.get(image_format):
+            candidates[entry['width']] = entry[image_format]
+    parts = []
+    for width in sorted(candidates):
+        parts.append(f'{_media_url(candidates[width])} {width}w')
+        if width >= limit:
+            break
+    return ', '.join(parts)
+
+
+def picture_html(manifest, fallback_url, size='card', alt='', sizes=None, loading='lazy', **attrs):
+    """<picture> with WebP and JPEG srcsets, or a plain <img> when there is no manifest"""
+    from django.utils.html import format_html, format_html_join
+
+    extra = format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
+    entry = derivative(manifest, size)
+    if entry is None or not entry.get('jpeg'):
+        if not fallback_url:
+            return ''
+        return format_html('<img src="{}" alt="{}" loading="{}"{}>', fallback_url, alt, loading, extra)
+
+    sizes = sizes or DISPLAY_SIZES.get(size, '100vw')
+    webp = srcset(manifest, 'webp', size)
+    source = format_html('<source type="image/webp" srcset="{}" sizes="{}">', webp, sizes) if webp else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"{}></picture>',
+        source, _media_url(entry['jpeg']), srcset(manifest, 'jpeg', size), sizes,
+        entry['width'], entry['height'], alt, loading, extra,
+    )
+
+
+# Uploads made through the site and admin
+
+def pending_images():
+    """Images marked pending, whose derivatives are missing or were rendered from another file"""
+    from .models import ProductImage
+    return ProductImage.objects.exclude(image='').filter(content_hash='')
+
+
+def mark_pending(product_image):
+    """Clear content_hash when the manifest does not match the file; returns whether it changed"""
+    if product_image.content_hash and needs_derivatives(product_image):
+        product_image.content_hash = ''
+        return True
+    return False
+
+
+def schedule(product_image):
+    """With IMAGE_DERIVATIVES_MODE = 'sync', render a pending image once the transaction commits.
+
+    Otherwise (the default) the image stays pending for generate_image_derivatives.
+    """
+    from django.conf import settings
+    from django.db import transaction
+
+    if getattr(settings, 'IMAGE_DERIVATIVES_MODE', 'queue') != 'sync' or not needs_derivatives(product_image):
+        return
+
+    def run():
+        for image_id, error in generate([product_image], workers=1):
+            if error:
+                logger.warning('Could not render derivatives for product image %s: %s', image_id, error)
+
+    transaction.on_commit(run)
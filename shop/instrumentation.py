@@ -0,0 +1,261 @@
+"""
+Per-request query and latency instrumentation.
+
+RequestMetricsMiddleware records, for every request, the view it resolved
+to, its status and duration, the number of SQL queries and the time spent
+in them, the time spent rendering templates and the time taken by each
+context processor. Queries are counted with a database execute wrapper;
+template and context processor times come from InstrumentedTemplates, the
+template backend configured in settings.TEMPLATES, which times the
+outermost render of each template and wraps every context processor of the
+engine. Template time includes the context processors that ran inside it.
+
+Records are plain tuples appended to a bounded deque per process, which is
+cheap and safe under threads and keeps the last REQUEST_METRICS_SIZE
+(default 5000) requests. summary() turns them into per-view percentiles;
+the staff-only request_metrics view serves it as JSON. Each process
+records its own requests, so with several workers every response covers the
+worker that answered it (see 'pid').
+
+Query budgets cap the queries a view may run: REQUEST_QUERY_BUDGETS maps
+view names ('shop:product_detail') to a number of queries, defaulting to
+QUERY_BUDGETS below, and REQUEST_QUERY_BUDGET applies to every other view
+(default: no budget). A request over its budget is logged as a warning, or,
+with REQUEST_QUERY_BUDGET_ACTION = 'raise', fails with QueryBudgetExceeded,
+which the test client re-raises so the test fails. Settings are read per
+request, so override_settings works in tests.
+
+Queries run while a StreamingHttpResponse is consumed happen after the
+middleware has returned and are not counted. Set REQUEST_METRICS_ENABLED =
+False to leave the middleware out entirely.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 5000
+
+# Queries per request, including the first request of a process with cold caches, which
+# also reads the shared cache versions (shop/versioning.py); shop/test_query_budgets.py checks them
+QUERY_BUDGETS = {
+    'shop:homepage': 18,
+    'shop:shop': 12,
+    'shop:product_detail': 18,
+    'cart:cart_detail': 12,
+    'billing:advanced_dashboard': 14,
+}
+
+PERCENTILES = (50, 90, 99)
+
+# Requests to these views are not recorded
+UNRECORDED_VIEWS = {'shop:request_metrics'}
+
+# One record per request
+FIELDS = ('view', 'method', 'status', 'duration_ms', 'queries', 'db_ms', 'template_ms', 'context_processors', 'at')
+
+_current = ContextVar('request_metrics', default=None)
+_records = deque(maxlen=getattr(settings, 'REQUEST_METRICS_SIZE', DEFAULT_SIZE))
+_started = {'at': timezone.now()}
+_reset_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL queries than its view's budget"""
+
+
+class _Metrics:
+    __slots__ = ('queries', 'db_seconds', 'template_seconds', 'render_depth', 'processors')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.render_depth = 0
+        self.processors = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def query_budget(view_name):
+    budgets = getattr(settings, 'REQUEST_QUERY_BUDGETS', QUERY_BUDGETS)
+    if view_name in budgets:
+        return budgets[view_name]
+    return getattr(settings, 'REQUEST_QUERY_BUDGET', None)
+
+
+class RequestMetricsMiddleware:
+    """Record query count, DB time, template and context processor time of each request"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _Metrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view_name = match.view_name if match else '<unresolved>'
+        if view_name in UNRECORDED_VIEWS:
+            return response
+        _records.append((
+            view_name, request.method, response.status_code, duration * 1000, metrics.queries,
+            metrics.db_seconds * 1000, metrics.template_seconds * 1000,
+            tuple((name, seconds * 1000) for name, seconds in metrics.processors.items()),
+            time.time(),
+        ))
+
+        budget = query_budget(view_name)
+        if budget is not None and metrics.queries > budget:
+            message = f'{view_name} ran {metrics.queries} queries, over its budget of {budget} ({request.path})'
+            if getattr(settings, 'REQUEST_QUERY_BUDGET_ACTION', 'log') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+# Template backend
+
+def _timed_processor(processor):
+    name = f'{processor.__module__}.{processor.__qualname__}'
+
+    def timed(request):
+        metrics = _current.get()
+        if metrics is None:
+            return processor(request)
+        started = time.perf_counter()
+        try:
+            return processor(request)
+        finally:
+            metrics.processors[name] = metrics.processors.get(name, 0.0) + time.perf_counter() - started
+
+    timed.__name__ = processor.__name__
+    timed.__qualname__ = processor.__qualname__
+    timed.__module__ = processor.__module__
+    return timed
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        metrics.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.render_depth -= 1
+            if not metrics.render_depth:
+                metrics.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """The Django template backend, with render and context processor timings"""
+
+    def __init__(self, params):
+        super().__init__(params)
+        processors = self.engine.template_context_processors
+        # Replaces the engine's cached_property value with the timed processors
+        self.engine.__dict__['template_context_processors'] = tuple(map(_timed_processor, processors))
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# Reading the ring buffer
+
+def records(limit=None):
+    """The recorded requests as dictionaries, newest last"""
+    recorded = list(_records)
+    if limit is not None:
+        recorded = recorded[-limit:] if limit else []
+    return [dict(zip(FIELDS, record)) for record in recorded]
+
+
+def reset():
+    with _reset_lock:
+        _records.clear()
+        _started['at'] = timezone.now()
+
+
+def _percentiles(values):
+    """Nearest-rank percentiles, rounded to two decimals"""
+    values = sorted(values)
+    result = {f'p{percentile}': round(values[max(0, -(-len(values) * percentile // 100) - 1)], 2)
+              for percentile in PERCENTILES}
+    result['max'] = round(values[-1], 2)
+    return result
+
+
+def summary(view=None):
+    """Per-view request counts, budget overruns and percentiles of the recorded requests"""
+    by_view = {}
+    for record in list(_records):
+        if view is None or record[0] == view:
+            by_view.setdefault(record[0], []).append(record)
+
+    views = []
+    for view_name, rows in by_view.items():
+        budget = query_budget(view_name)
+        processors = {}
+        for row in rows:
+            for name, milliseconds in row[7]:
+                processors.setdefault(name, []).append(milliseconds)
+        views.append({
+            'view': view_name,
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[2] >= 500),
+            'query_budget': budget,
+            'over_budget': sum(1 for row in rows if budget is not None and row[4] > budget),
+            'duration_ms': _percentiles(row[3] for row in rows),
+            'queries': _percentiles(row[4] for row in rows),
+            'db_ms': _percentiles(row[5] for row in rows),
+            'template_ms': _percentiles(row[6] for row in rows),
+            'context_processors_ms': {name: _percentiles(values) for name, values in sorted(processors.items())},
+        })
+    views.sort(key=lambda row: row['duration_ms']['p90'], reverse=True)
+    return {
+        'pid': os.getpid(),
+        'since': _started['at'].isoformat(),
+        'recorded': len(_records),
+        'capacity': _records.maxlen,
+        'views': views,
+    }
@@ -0,0 +1,189 @@
+"""
+Product listing pipeline shared by the shop, category and subcategory pages.
+
+A ProductListing combines a scope (category/subcategory), the filters of a
+request, an optional search query, a sort order, a select/prefetch plan and
+pagination. By default it is answered from the facet index and the result
+(ordered ids plus facet counts) is cached per normalised filter signature
+for LISTING_CACHE_TIMEOUT seconds, keyed on the catalog version so any
+catalog change starts from fresh results. With PRODUCT_LISTING_BACKEND =
+'database' the same filters run as a queryset, paged by keyset.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from . import facets
+from .facets import FacetSelection, PRICE_BUCKETS, NEW_ARRIVAL_DAYS
+from .pagination import SORT_ORDERS, paginate
+from .search_engine import search_products, tokenize
+from .versioning import CATALOG_VERSION, get_version
+
+
+# Upper bound on search matches combined with the other listing filters
+SEARCH_LIMIT = 1000
+
+ListingResult = namedtuple('ListingResult', ['product_ids', 'counts'])
+
+
+class ProductListing:
+    """Composable product query; each step returns a new listing"""
+
+    def __init__(self, selection=None, sort='featured', search=None,
+                 select_related=('category', 'subcategory'), prefetch_related=()):
+        self.selection = selection or FacetSelection()
+        self.sort = sort if sort in SORT_ORDERS else 'featured'
+        self.search_query = (' '.join(tokenize(search)) or None) if search else None
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self._result = None
+
+    @classmethod
+    def from_request(cls, request, category=None, subcategory=None):
+        """Listing for a request's query parameters, optionally scoped to a (sub)category"""
+        listing = cls(
+            selection=FacetSelection.from_params(request.GET),
+            sort=request.GET.get('sort', 'featured'),
+            search=request.GET.get('q'),
+        )
+        if category is not None:
+            listing = listing.scope(category=category, subcategory=subcategory)
+        return listing
+
+    def _clone(self, **changes):
+        listing = ProductListing.__new__(ProductListing)
+        listing.__dict__.update(self.__dict__, _result=None, **changes)
+        return listing
+
+    def scope(self, category, subcategory=None):
+        """Restrict to a category, or one of its subcategories (subcategory slugs repeat across categories)"""
+        values = dict(self.selection.values, category=[category.slug])
+        if subcategory is not None:
+            values['subcategory'] = [subcategory.slug]
+        return self._clone(selection=self.selection.copy(values=values))
+
+    def order_by(self, sort):
+        return self._clone(sort=sort if sort in SORT_ORDERS else 'featured')
+
+    def plan(self, select_related=(), prefetch_related=()):
+        """Relations loaded with the products of a page"""
+        return self._clone(select_related=tuple(select_related), prefetch_related=tuple(prefetch_related))
+
+    def signature(self):
+        return (self.selection.signature(), self.sort, self.search_query)
+
+    @property
+    def uses_index(self):
+        return getattr(settings, 'PRODUCT_LISTING_BACKEND', 'index') != 'database'
+
+    # Index backend
+
+    def _selection_with_search(self):
+        if not self.search_query:
+            return self.selection
+        return self.selection.copy(product_ids=search_products(self.search_query, limit=SEARCH_LIMIT))
+
+    def result(self):
+        """Ordered ids and facet counts, from the listing cache when possible"""
+        if self._result is None:
+            timeout = getattr(settings, 'LISTING_CACHE_TIMEOUT', 60)
+            digest = hashlib.md5(repr(self.signature()).encode()).hexdigest()
+            key = f'shop:listing:{get_version(CATALOG_VERSION)}:{digest}'
+            cached = cache.get(key) if timeout else None
+            if cached is None:
+                found = facets.query(self._selection_with_search(), self.sort)
+                cached = ListingResult(found.product_ids, found.counts)
+                if timeout:
+                    cache.set(key, tuple(cached), timeout)
+            self._result = ListingResult(*cached)
+        return self._result
+
+    # Database backend
+
+    def queryset(self):
+        """The listing as a queryset, without sorting or the page plan"""
+        from .models import Product, ProductVariant
+
+        selection = self.selection
+        products = Product.objects.filter(is_active=True)
+        lookups = {'category': 'category__slug__in', 'subcategory': 'subcategory__slug__in',
+                   'fabric': 'fabric__in', 'occasion': 'occasion__in'}
+        for facet, lookup in lookups.items():
+            if selection.values.get(facet):
+                products = products.filter(**{lookup: selection.values[facet]})
+
+        # Exists() rather than a join, so a product with several matching variants appears once
+        variants = ProductVariant.objects.filter(product=OuterRef('pk'), is_active=True)
+        if selection.values.get('size'):
+            products = products.filter(Exists(variants.filter(size__in=selection.values['size'])))
+        if selection.color:
+            products = products.filter(Exists(variants.filter(color__icontains=selection.color)))
+
+        if selection.values.get('price'):
+            buckets = Q()
+            for key, label, low, high in PRICE_BUCKETS:
+                if key in selection.values['price']:
+                    bucket = Q()
+                    if low is not None:
+                        bucket &= Q(selling_price__gte=low)
+                    if high is not None:
+                        bucket &= Q(selling_price__lt=high)
+                    buckets |= bucket
+            products = products.filter(buckets)
+        if selection.min_price is not None:
+            products = products.filter(selling_price__gte=selection.min_price)
+        if selection.max_price is not None:
+            products = products.filter(selling_price__lte=selection.max_price)
+
+        if 'sale' in selection.flags:
+            products = products.filter(mrp__gt=F('selling_price'))
+        if 'bestseller' in selection.flags:
+            products = products.filter(is_bestseller=True)
+        if 'featured' in selection.flags:
+            products = products.filter(is_featured=True)
+        if selection.new:
+            products = products.filter(created_at__gte=timezone.now() - timedelta(days=NEW_ARRIVAL_DAYS))
+
+        if self.search_query:
+            products = products.filter(id__in=search_products(self.search_query, limit=SEARCH_LIMIT))
+        return products
+
+    # Pages
+
+    def _load(self, product_ids):
+        from .models import Product
+
+        products = Product.objects.filter(id__in=product_ids)
+        if self.select_related:
+            products = products.select_related(*self.select_related)
+        if self.prefetch_related:
+            products = products.prefetch_related(*self.prefetch_related)
+        products_by_id = products.in_bulk()
+        return [products_by_id[pk] for pk in product_ids if pk in products_by_id]
+
+    def page(self, request, per_page):
+        """A page object (by number, or by cursor) with products loaded per the plan"""
+        if self.uses_index:
+            page_obj = paginate(request, self.result().product_ids, per_page)
+            page_obj.object_list = self._load(page_obj.object_list)
+            return page_obj
+
+        products = self.queryset()
+        if self.select_related:
+            products = products.select_related(*self.select_related)
+        if self.prefetch_related:
+            products = products.prefetch_related(*self.prefetch_related)
+        return paginate(
+            request, products, per_page, sort=self.sort,
+            count_signature=('listing',) + self.signature(),
+        )
+
+    @property
+    def counts(self):
+        """Live facet counts, or None when the database backend answers the listing"""
+        return self.result().counts if self.uses_index else None
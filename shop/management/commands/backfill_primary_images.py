@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Copy each product\'s primary image and derivative manifest onto the product row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+
+        start = time.perf_counter()
+        checked = updated = 0
+        batch = []
+        for product_id in product_ids.iterator(chunk_size=batch_size):
+            batch.append(product_id)
+            if len(batch) == batch_size:
+                updated += Product.update_primary_images(batch)
+                checked += len(batch)
+                batch = []
+                self.stdout.write(f'  {checked} products checked')
+        if batch:
+            updated += Product.update_primary_images(batch)
+            checked += len(batch)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Checked {checked} products, updated {updated} primary images in {elapsed:.1f}s'
+        ))
+
+
+# Usage examples:
+# python manage.py backfill_primary_images
+# python manage.py backfill_primary_images --batch-size 5000
@@ -0,0 +1,82 @@
+import gc
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from shop.benchmarks import isolated_database, rss_bytes
+from shop.exports import SUBSCRIBERS
+from shop.models import WhatsAppSubscription
+
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory of streaming exports (1M subscriber rows by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv', 'xlsx'])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--compare', action='store_true',
+                            help='Also build the export in memory the way manage_newsletter used to')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        # A file database, so the rows themselves do not count towards this process's memory
+        with isolated_database(concurrent=True):
+            started = time.perf_counter()
+            self.generate(options['rows'])
+            self.stdout.write(f'Generated {options["rows"]:,} subscribers in {time.perf_counter() - started:.1f}s\n')
+
+            queryset = WhatsAppSubscription.objects.order_by('pk')
+            results = {'rows': options['rows'], 'chunk_size': options['chunk_size'], 'runs': []}
+            self.stdout.write(f'{"path":<16} {"seconds":>8} {"output MB":>10} {"peak RSS +MB":>13}')
+            self.stdout.write('-' * 50)
+            for file_format in options['formats']:
+                response = SUBSCRIBERS.response(queryset, file_format, chunk_size=options['chunk_size'])
+                results['runs'].append(self.run(f'stream {file_format}', lambda: response.streaming_content))
+            if options['compare']:
+                results['runs'].append(self.run('in-memory csv', lambda: [self.in_memory_csv(queryset)]))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+
+    def run(self, name, chunks):
+        gc.collect()
+        baseline = peak = rss_bytes()
+        size = 0
+        started = time.perf_counter()
+        for number, chunk in enumerate(chunks()):
+            size += len(chunk)
+            if number % 20 == 0:
+                peak = max(peak, rss_bytes())
+        seconds = time.perf_counter() - started
+        peak = max(peak, rss_bytes())
+        self.stdout.write(f'{name:<16} {seconds:>8.1f} {size / MB:>10.1f} {(peak - baseline) / MB:>13.1f}')
+        return {'path': name, 'seconds': round(seconds, 2), 'output_bytes': size, 'peak_rss_delta_bytes': peak - baseline}
+
+    def in_memory_csv(self, queryset):
+        """What manage_newsletter --action export did: every object loaded, then one line each"""
+        lines = ['Phone Number,Name,Subscribed Date,Source']
+        for sub in list(queryset):
+            name = sub.name if sub.name else "No name"
+            lines.append(f'{sub.phone_number},{name},{sub.subscribed_at.strftime("%Y-%m-%d")},{sub.source}')
+        return '\n'.join(lines).encode()
+
+    def generate(self, rows, batch_size=10000):
+        for offset in range(0, rows, batch_size):
+            WhatsAppSubscription.objects.bulk_create([
+                WhatsAppSubscription(
+                    phone_number=f'+91 9{number:09d}', name=f'Subscriber {number}' if number % 3 else '',
+                    source='website' if number % 4 else 'instagram', is_active=number % 10 != 0,
+                )
+                for number in range(offset, min(offset + batch_size, rows))
+            ])
+
+
+# Usage examples:
+# python manage.py benchmark_exports
+# python manage.py benchmark_exports --rows 200000 --formats csv --compare --json exports.json
@@ -0,0 +1,110 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+from django.http import QueryDict
+from shop import facets
+from shop.benchmarks import isolated_database, build_synthetic_catalog, measure
+from shop.models import Product
+
+
+SCENARIOS = [
+    ('no filters', ''),
+    ('category', 'category=dupattas'),
+    ('fabric x2 + occasion', 'fabric=cotton&fabric=silk&occasion=party'),
+    ('size + color', 'size=M&color=red'),
+    ('price range + sale', 'min_price=500&max_price=1500&sale=true'),
+    ('everything', 'category=dupattas&fabric=cotton&size=L&color=blue&min_price=300&sort=price_low'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the facet index against the ORM filter chain on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Synthetic catalog size')
+        parser.add_argument('--variants', type=int, default=3, help='Variants per product')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario (median is reported)')
+        parser.add_argument('--per-page', type=int, default=12)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        with isolated_database():
+            self.stdout.write(f'Building synthetic catalog of {options["products"]} products...')
+            build_synthetic_catalog(options['products'], variants_per_product=options['variants'])
+
+            index = facets.FacetIndex()
+            start = time.perf_counter()
+            index.rebuild()
+            build_seconds = time.perf_counter() - start
+            self.stdout.write(f'Facet index build: {build_seconds:.2f}s')
+
+            results = {'products': options['products'], 'build_seconds': round(build_seconds, 3), 'scenarios': []}
+            self.stdout.write('')
+            self.stdout.write(f'{"scenario":<24} {"path":<14} {"median ms":>10} {"min ms":>9} {"matches":>8}')
+            self.stdout.write('-' * 69)
+            for name, query_string in SCENARIOS:
+                params = QueryDict(query_string)
+                sort = params.get('sort', 'featured')
+                row = {'scenario': name, 'params': query_string}
+
+                for path, func in (
+                    ('orm', lambda: self.orm_listing(params, sort, per_page, with_counts=False)),
+                    ('orm+counts', lambda: self.orm_listing(params, sort, per_page, with_counts=True)),
+                    ('facet index', lambda: self.index_listing(index, params, sort, per_page)),
+                ):
+                    median, best, count = measure(func, options['repeat'])
+                    row[path] = {'median_ms': round(median, 2), 'min_ms': round(best, 2), 'matches': count}
+                    self.stdout.write(f'{name:<24} {path:<14} {median:>10.2f} {best:>9.2f} {count:>8}')
+                results['scenarios'].append(row)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+
+    def orm_queryset(self, params, exclude=None):
+        """The filter chain shop() used before the facet index, with distinct() for the variant joins"""
+        products = Product.objects.filter(is_active=True)
+        if params.get('category') and exclude != 'category':
+            products = products.filter(category__slug=params['category'])
+        if params.get('min_price'):
+            products = products.filter(selling_price__gte=params['min_price'])
+        if params.get('max_price'):
+            products = products.filter(selling_price__lte=params['max_price'])
+        if params.getlist('fabric') and exclude != 'fabric':
+            products = products.filter(fabric__in=params.getlist('fabric'))
+        if params.getlist('occasion') and exclude != 'occasion':
+            products = products.filter(occasion__in=params.getlist('occasion'))
+        if params.get('size') and exclude != 'size':
+            products = products.filter(variants__size=params['size'], variants__is_active=True)
+        if params.get('color'):
+            products = products.filter(variants__color__icontains=params['color'], variants__is_active=True)
+        if params.get('sale') == 'true':
+            products = products.filter(mrp__gt=F('selling_price'))
+        return products.distinct()
+
+    def orm_listing(self, params, sort, per_page, with_counts):
+        ordering = {
+            'price_low': ['selling_price'],
+        }.get(sort, ['-is_featured', '-created_at'])
+        products = self.orm_queryset(params)
+        count = products.count()
+        list(products.select_related('category', 'subcategory').order_by(*ordering)[:per_page])
+        if with_counts:
+            for facet, field in (('category', 'category__slug'), ('fabric', 'fabric'),
+                                 ('occasion', 'occasion'), ('size', 'variants__size')):
+                list(self.orm_queryset(params, exclude=facet).values(field).annotate(n=Count('id', distinct=True)))
+        return count
+
+    def index_listing(self, index, params, sort, per_page):
+        result = index.query(facets.FacetSelection.from_params(params), sort)
+        list(Product.objects.filter(id__in=result.product_ids[:per_page]).select_related('category', 'subcategory'))
+        return len(result.product_ids)
+
+
+# Usage examples:
+# python manage.py benchmark_facets
+# python manage.py benchmark_facets --products 20000 --variants 2 --json facets.json
@@ -0,0 +1,91 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from shop import search_engine
+from shop.benchmarks import isolated_database, build_synthetic_catalog, measure
+from shop.models import Product
+
+
+DEFAULT_QUERIES = ['dupatta', 'red silk', 'chikankari cotton dupatta', 'bandh', 'navy palazzo', 'zari border']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the search index against the old icontains ORM search on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Synthetic catalog size')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query (median is reported)')
+        parser.add_argument('--query', action='append', dest='queries', help='Query to run (repeatable)')
+        parser.add_argument('--per-page', type=int, default=12)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or DEFAULT_QUERIES
+        per_page = options['per_page']
+        repeat = options['repeat']
+
+        backends = [search_engine.InMemoryBackend()]
+        with isolated_database():
+            if search_engine.SQLiteFTSBackend.is_available():
+                backends.insert(0, search_engine.SQLiteFTSBackend())
+
+            self.stdout.write(f'Building synthetic catalog of {options["products"]} products...')
+            build_synthetic_catalog(options['products'])
+
+            results = {'products': options['products'], 'build_seconds': {}, 'queries': []}
+            for backend in backends:
+                start = time.perf_counter()
+                backend.rebuild()
+                results['build_seconds'][backend.name] = round(time.perf_counter() - start, 3)
+                self.stdout.write(f'Index build ({backend.name}): {results["build_seconds"][backend.name]}s')
+
+            self.stdout.write('')
+            self.stdout.write(f'{"query":<28} {"path":<12} {"median ms":>10} {"min ms":>9} {"matches":>8}')
+            self.stdout.write('-' * 71)
+            for query in queries:
+                row = {'query': query}
+                median, best, count = measure(lambda: self.orm_search(query, per_page), repeat)
+                row['orm'] = {'median_ms': round(median, 2), 'min_ms': round(best, 2), 'matches': count}
+                self.report(query, 'orm', median, best, count)
+
+                terms = search_engine.tokenize(query)
+                for backend in backends:
+                    median, best, count = measure(lambda: self.index_search(backend, terms, per_page), repeat)
+                    row[backend.name] = {'median_ms': round(median, 2), 'min_ms': round(best, 2), 'matches': count}
+                    self.report(query, backend.name, median, best, count)
+                results['queries'].append(row)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+
+    def report(self, query, path, median, best, count):
+        self.stdout.write(f'{query[:28]:<28} {path:<12} {median:>10.2f} {best:>9.2f} {count:>8}')
+
+    def orm_search(self, query, per_page):
+        """The search() view before the index: five OR'd icontains predicates, count + first page"""
+        products = Product.objects.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(short_description__icontains=query) |
+            Q(category__name__icontains=query) |
+            Q(subcategory__name__icontains=query),
+            is_active=True
+        ).select_related('category', 'subcategory')
+        count = products.count()
+        list(products[:per_page])
+        return count
+
+    def index_search(self, backend, terms, per_page):
+        """The indexed path: ranked ids, then one query for the first page"""
+        product_ids = backend.search(terms)
+        list(Product.objects.filter(id__in=product_ids[:per_page]).select_related('category', 'subcategory'))
+        return len(product_ids)
+
+
+# Usage examples:
+# python manage.py benchmark_search
+# python manage.py benchmark_search --products 20000 --query "red silk" --json search.json
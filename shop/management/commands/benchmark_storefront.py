@@ -0,0 +1,262 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import Address
+from billing import rollups
+from billing.benchmarks import build_synthetic_billing
+from cart.models import Cart, CartItem
+from shop import search_engine
+from shop.benchmarks import (
+    isolated_database, build_synthetic_catalog, build_synthetic_users, build_synthetic_reviews,
+    build_synthetic_orders, rebuild_rating_stats,
+)
+from shop.models import Product
+from shop.pagination import SORT_ORDERS
+
+
+FILTERS = [
+    ('no filters', ''),
+    ('category', 'category=dupattas'),
+    ('subcategory', 'category=dupattas&subcategory=cotton'),
+    ('fabric', 'fabric=cotton'),
+    ('occasion', 'occasion=party'),
+    ('size', 'size=M'),
+    ('color', 'color=red'),
+    ('price bucket', 'price=500-1000'),
+    ('price range', 'min_price=500&max_price=1500'),
+    ('sale', 'sale=true'),
+    ('bestseller', 'bestseller=true'),
+    ('featured', 'featured=true'),
+    ('new arrivals', 'new=true'),
+]
+
+SEARCHES = ['dupatta', 'red silk', 'chikankari cotton dupatta', 'bandh']
+
+CART_LINES = 3
+
+# Full scale; --scale multiplies every count
+SCALE = {
+    'products': 100_000,
+    'variants_per_product': 5,
+    'users': 20_000,
+    'reviews': 2_000_000,
+    'orders': 1_000_000,
+    'invoice_lines': 200_000,
+}
+
+
+class Command(BaseCommand):
+    help = ('Time and count the queries of the storefront hot paths (homepage, shop filters and sorts, search, '
+            'product detail, cart, place order, billing dashboard) on a large synthetic dataset')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiply the dataset (100k products, 500k variants, 2M reviews, 1M orders)')
+        parser.add_argument('--repeat', type=int, default=10, help='Warm runs per scenario (median is reported)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Median slowdown in percent reported as a regression (default 20)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when a scenario regressed in time or queries')
+
+    def handle(self, *args, **options):
+        sizes = {name: max(1, round(count * options['scale'])) for name, count in SCALE.items()}
+        sizes['variants_per_product'] = SCALE['variants_per_product']
+        baseline = self.load_baseline(options['compare'])
+
+        # A file database: at full scale the data does not fit comfortably in memory
+        with isolated_database(concurrent=True):
+            generate_seconds = self.generate(sizes, options['seed'])
+            self.stdout.write(f'Generated in {generate_seconds:.1f}s\n')
+
+            results = {
+                'commit': self.commit(),
+                'run_at': timezone.now().isoformat(),
+                'dataset': sizes,
+                'generate_seconds': round(generate_seconds, 1),
+                'repeat': options['repeat'],
+                'scenarios': [],
+            }
+            self.stdout.write(f'{"scenario":<36} {"first ms":>9} {"median ms":>10} {"min ms":>9} {"queries":>8}')
+            self.stdout.write('-' * 76)
+            for name, request, setup in self.scenarios():
+                row = self.run(name, request, setup, options['repeat'])
+                results['scenarios'].append(row)
+
+        if baseline:
+            regressions = self.compare(baseline, results, options['threshold'])
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'\nResults written to {options["json_path"]}'))
+        if baseline and regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} scenario(s) regressed: {", ".join(regressions)}')
+
+    def generate(self, sizes, seed):
+        started = time.perf_counter()
+        self.stdout.write(f'Building {sizes["products"]:,} products with {sizes["variants_per_product"]} variants each...')
+        build_synthetic_catalog(sizes['products'], variants_per_product=sizes['variants_per_product'], seed=seed)
+        self.stdout.write(f'Building {sizes["users"]:,} users, {sizes["reviews"]:,} reviews and {sizes["orders"]:,} orders...')
+        user_ids = build_synthetic_users(sizes['users'])
+        build_synthetic_reviews(sizes['reviews'], user_ids, seed=seed)
+        build_synthetic_orders(sizes['orders'], user_ids, seed=seed)
+        self.stdout.write(f'Building {sizes["invoice_lines"]:,} invoice lines...')
+        build_synthetic_billing(sizes['invoice_lines'], seed=seed)
+
+        self.stdout.write('Rebuilding ratings, site stats, search index and revenue rollups...')
+        rebuild_rating_stats()
+        search_engine.rebuild_index()
+        rollups.rebuild()
+        return time.perf_counter() - started
+
+    def scenarios(self):
+        """(name, request, setup) triples; setup runs untimed before every request"""
+        User = get_user_model()
+        anonymous = Client()
+        shopper = User.objects.create_user(username='benchmark', email='benchmark@example.com', password='benchmark')
+        customer = Client()
+        customer.force_login(shopper)
+        staff = Client()
+        staff.force_login(User.objects.create_superuser(
+            username='benchmark-staff', email='staff@example.com', password='benchmark',
+        ))
+        address = Address.objects.create(
+            user=shopper, full_name='Benchmark Shopper', phone_number='9999999999',
+            address_line_1='1 Hazratganj', city='Lucknow', state='Uttar Pradesh', pin_code='226001',
+        )
+        cart = Cart.objects.create(user=shopper)
+        cart_products = list(Product.objects.filter(is_active=True).order_by('pk')[:CART_LINES])
+        # Every order takes stock; keep enough for all runs
+        Product.objects.filter(pk__in=[product.pk for product in cart_products]).update(stock_quantity=1_000_000)
+        for product in cart_products:
+            product.variants.update(stock_quantity=1_000_000)
+        most_reviewed = Product.objects.order_by('-rating_count', 'pk').first()
+        typical = Product.objects.filter(is_active=True).order_by('pk')[Product.objects.count() // 2]
+
+        def get(client, url):
+            return lambda: client.get(url)
+
+        def post_json(client, url, data):
+            return lambda: client.post(url, json.dumps(data), content_type='application/json')
+
+        def fill_cart():
+            CartItem.objects.filter(cart=cart).delete()
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for product in cart_products])
+
+        def one_cart_line():
+            CartItem.objects.filter(cart=cart).delete()
+            return CartItem.objects.create(cart=cart, product=cart_products[0], quantity=1)
+
+        cart_line = {}
+
+        yield 'homepage', get(anonymous, reverse('shop:homepage')), None
+        for name, query_string in FILTERS:
+            yield f'shop: {name}', get(anonymous, f'{reverse("shop:shop")}?{query_string}'), None
+        for sort in SORT_ORDERS:
+            yield f'shop: sort {sort}', get(anonymous, f'{reverse("shop:shop")}?sort={sort}'), None
+        for query in SEARCHES:
+            yield f'search: {query}', get(anonymous, f'{reverse("shop:search")}?q={query}'), None
+        yield ('product_detail: typical',
+               get(anonymous, reverse('shop:product_detail', args=[typical.slug])), None)
+        yield ('product_detail: most reviewed',
+               get(anonymous, reverse('shop:product_detail', args=[most_reviewed.slug])), None)
+        yield ('cart: add',
+               post_json(customer, reverse('cart:ajax_add_to_cart'), {'product_id': cart_products[0].pk, 'quantity': 1}),
+               lambda: CartItem.objects.filter(cart=cart).delete())
+        yield ('cart: update',
+               lambda: customer.post(reverse('cart:ajax_update_cart'),
+                                     json.dumps({'item_id': cart_line['item'].pk, 'quantity': 3}),
+                                     content_type='application/json'),
+               lambda: cart_line.update(item=one_cart_line()))
+        yield 'cart: detail', get(customer, reverse('cart:cart_detail')), fill_cart
+        yield ('checkout: place_order',
+               post_json(customer, reverse('checkout:place_order'), {
+                   'selected_address': address.pk, 'first_name': 'Benchmark', 'last_name': 'Shopper',
+                   'phone': '9999999999',
+               }),
+               fill_cart)
+        yield 'billing: dashboard', get(staff, reverse('billing:advanced_dashboard')), None
+
+    def run(self, name, request, setup, repeat):
+        timings, queries = [], set()
+        for _ in range(repeat + 1):
+            if setup:
+                setup()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{name}: HTTP {response.status_code}')
+            if response.get('Content-Type', '').startswith('application/json') and not json.loads(response.content).get('success', True):
+                raise CommandError(f'{name}: {response.content.decode()}')
+            queries.add(len(captured.captured_queries))
+
+        first, median, best = timings[0], statistics.median(timings[1:]), min(timings[1:])
+        query_counts = '/'.join(str(count) for count in sorted(queries))
+        self.stdout.write(f'{name[:36]:<36} {first:>9.1f} {median:>10.2f} {best:>9.2f} {query_counts:>8}')
+        return {'scenario': name, 'first_ms': round(first, 2), 'median_ms': round(median, 2),
+                'min_ms': round(best, 2), 'queries': sorted(queries)}
+
+    def load_baseline(self, path):
+        if not path:
+            return None
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+    def compare(self, baseline, results, threshold):
+        """Print the change of every scenario against the baseline; returns the names of regressions"""
+        before = {row['scenario']: row for row in baseline['scenarios']}
+        self.stdout.write(f'\nCompared with {baseline.get("commit") or "baseline"} ({baseline.get("run_at", "?")})')
+        if baseline.get('dataset') != results['dataset']:
+            self.stdout.write(self.style.WARNING('The baseline was measured on a different dataset size'))
+        self.stdout.write(f'{"scenario":<36} {"median ms":>19} {"change":>8} {"queries":>10}')
+        self.stdout.write('-' * 76)
+        regressions = []
+        for row in results['scenarios']:
+            old = before.get(row['scenario'])
+            if old is None:
+                self.stdout.write(f'{row["scenario"][:36]:<36} {"(new)":>19}')
+                continue
+            change = (row['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+            slower = change > threshold
+            more_queries = max(row['queries']) > max(old['queries'])
+            line = (f'{row["scenario"][:36]:<36} {old["median_ms"]:>8.2f} → {row["median_ms"]:>8.2f} {change:>+7.1f}% '
+                    f'{max(old["queries"]):>4} → {max(row["queries"]):<4}')
+            if slower or more_queries:
+                regressions.append(row['scenario'])
+                self.stdout.write(self.style.WARNING(f'{line} ⚠️'))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            self.stdout.write(self.style.WARNING(f'\n{len(regressions)} regression(s) over {threshold:g}% or in query count'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✅ No regressions'))
+        return regressions
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+
+# Usage examples:
+# python manage.py benchmark_storefront --json storefront.json
+# python manage.py benchmark_storefront --scale 0.05 --repeat 5 --json quick.json
+# python manage.py benchmark_storefront --scale 0.05 --compare quick.json --fail-on-regression
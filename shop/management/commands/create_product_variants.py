@@ -1,10 +1,16 @@
-from django.core.management.base import BaseCommand
+import random
+
+from shop.bulk import BulkCommand
 from shop.models import Product, ProductVariant
 
 
-class Command(BaseCommand):
+class Command(BulkCommand):
     help = 'Create product variants with different sizes and colors'
 
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--seed', type=int, help='Seed for the random colours and stock')
+
     def handle(self, *args, **options):
         # Get all products
         products = Product.objects.all()
@@ -34,38 +40,44 @@ class Command(BaseCommand):
         # Size options
         sizes = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
 
-        created_count = 0
+        rng = random.Random(options['seed'])
+        created_count = existing_count = 0
         
-        for product in products:
-            # Create variants for each product
-            for size in sizes:
-                # Select 2-4 random colors for each product
-                import random
-                product_colors = random.sample(colors, random.randint(2, 4))
-                
-                for color in product_colors:
-                    variant, created = ProductVariant.objects.get_or_create(
-                        product=product,
-                        size=size,
-                        color=color['name'],
-                        defaults={
-                            'color_code': color['code'],
-                            'stock_quantity': random.randint(0, 50),
-                            'additional_price': 0,
-                            'is_active': True
-                        }
-                    )
+        for chunk in self.bulk.chunks(products.only('pk'), label='products'):
+            # One query for the variants this chunk already has instead of a get_or_create per variant
+            existing = set(
+                ProductVariant.objects.filter(product__in=chunk).values_list('product_id', 'size', 'color')
+            )
+            variants = []
+            for product in chunk:
+                # Create variants for each product
+                for size in sizes:
+                    # Select 2-4 random colors for each product
+                    product_colors = rng.sample(colors, rng.randint(2, 4))
                     
-                    if created:
-                        created_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(f'Created variant: {product.name} - {size} - {color["name"]}')
-                        )
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(f'Variant already exists: {product.name} - {size} - {color["name"]}')
-                        )
+                    for color in product_colors:
+                        stock_quantity = rng.randint(0, 50)
+                        if (product.pk, size, color['name']) in existing:
+                            existing_count += 1
+                            continue
+                        variants.append(ProductVariant(
+                            product=product,
+                            size=size,
+                            color=color['name'],
+                            color_code=color['code'],
+                            stock_quantity=stock_quantity,
+                            additional_price=0,
+                            is_active=True
+                        ))
+            created_count += len(self.bulk.bulk_create(variants))
 
+        if existing_count:
+            self.stdout.write(self.style.WARNING(f'{existing_count} variants already existed'))
         self.stdout.write(
             self.style.SUCCESS(f'Successfully created {created_count} product variants!')
         )
+
+
+# Usage examples:
+# python manage.py create_product_variants
+# python manage.py create_product_variants --seed 7 --progress
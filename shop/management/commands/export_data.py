@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from shop.exports import CHUNK_SIZE, FORMATS
+
+
+EXPORTS = {
+    'invoices': ('billing.exports.INVOICES', 'billing.advanced_models.AdvancedInvoice'),
+    'customers': ('billing.exports.CUSTOMERS', 'billing.models.Customer'),
+    'orders': ('checkout.exports.ORDERS', 'checkout.models.Order'),
+    'subscribers': ('shop.exports.SUBSCRIBERS', 'shop.models.WhatsAppSubscription'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Stream invoices, customers, orders or WhatsApp subscribers to a CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='file_format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output, CSV only)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        export_path, model_path = EXPORTS[options['export']]
+        export, model = import_string(export_path), import_string(model_path)
+        queryset = model.objects.order_by('pk')
+        file_format, output = options['file_format'], options['output']
+
+        if not output:
+            if file_format != 'csv':
+                raise CommandError('XLSX exports need --output')
+            export.write(queryset, self.stdout, 'csv', options['chunk_size'])
+            return
+
+        mode = 'w' if file_format == 'csv' else 'wb'
+        with open(output, mode, **({'newline': '', 'encoding': 'utf-8'} if mode == 'w' else {})) as handle:
+            export.write(queryset, handle, file_format, options['chunk_size'])
+        self.stderr.write(self.style.SUCCESS(f'✅ {options["export"].title()} exported to {output}'))
+
+
+# Usage examples:
+# python manage.py export_data orders --output orders.csv
+# python manage.py export_data invoices --format xlsx --output invoices.xlsx
+# python manage.py export_data subscribers > subscribers.csv
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.images import generate, needs_derivatives, pending_images
+from shop.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate card/gallery/zoom/thumbnail derivatives for pending product images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--all', action='store_true',
+                            help='Check every image, not only pending ones (e.g. after MANIFEST_VERSION changes)')
+        parser.add_argument('--product', type=int, help='Only images of this product id')
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help='Keep running, looking for newly pending images every SECONDS')
+
+    def handle(self, *args, **options):
+        failed_ids = set()
+        while True:
+            self.run(options, failed_ids)
+            if not options['watch']:
+                break
+            try:
+                time.sleep(options['watch'])
+            except KeyboardInterrupt:
+                break
+
+    def run(self, options, failed_ids):
+        if options['all']:
+            images = ProductImage.objects.exclude(image='')
+        else:
+            images = pending_images()
+        images = images.exclude(pk__in=failed_ids).only('id', 'image', 'content_hash', 'derivatives').order_by('id')
+        if options['product']:
+            images = images.filter(product_id=options['product'])
+        # An image that fails keeps failing until it is replaced; a watching worker retries it on restart
+        todo = [image for image in images.iterator(chunk_size=2000) if not options['all'] or needs_derivatives(image)]
+        if not todo and options['watch']:
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'🖼️  {len(todo)} images to process'))
+        start = time.perf_counter()
+        done = 0
+        for image_id, error in generate(todo, workers=options['workers']):
+            if error:
+                failed_ids.add(image_id)
+                self.stdout.write(self.style.ERROR(f'❌ Image {image_id}: {error}'))
+                continue
+            done += 1
+            if done % 100 == 0:
+                self.stdout.write(f'  {done}/{len(todo)} done')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'✅ Generated derivatives for {done} images in {elapsed:.1f}s'))
+        failed = len(todo) - done
+        if failed:
+            self.stdout.write(self.style.WARNING(f'⚠️  {failed} images failed'))
+
+
+# Usage examples:
+# python manage.py generate_image_derivatives
+# python manage.py generate_image_derivatives --workers 4 --all
+# python manage.py generate_image_derivatives --product 12
+# python manage.py generate_image_derivatives --watch 30   # as a long-running worker
@@ -1,11 +1,12 @@
-from django.core.management.base import BaseCommand
+from shop.bulk import BulkCommand
 from shop.models import Product
 
 
-class Command(BaseCommand):
+class Command(BulkCommand):
     help = 'Manage bestseller products for King Dupatta House'
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument(
             '--action',
             type=str,
@@ -40,11 +41,12 @@ class Command(BaseCommand):
 
     def list_bestsellers(self):
         """List all current bestseller products"""
-        bestsellers = Product.objects.filter(is_bestseller=True, is_active=True)
+        bestsellers = Product.objects.filter(is_bestseller=True, is_active=True).only('name', 'selling_price')
+        count = bestsellers.count()
         
-        if bestsellers:
-            self.stdout.write(self.style.SUCCESS(f'Found {bestsellers.count()} bestseller products:'))
-            for product in bestsellers:
+        if count:
+            self.stdout.write(self.style.SUCCESS(f'Found {count} bestseller products:'))
+            for product in bestsellers.iterator(chunk_size=self.bulk.chunk_size):
                 self.stdout.write(f'  • {product.name} (ID: {product.id}) - ₹{product.selling_price}')
         else:
             self.stdout.write(self.style.WARNING('No bestseller products found.'))
@@ -64,8 +66,7 @@ class Command(BaseCommand):
             if product.is_bestseller:
                 self.stdout.write(self.style.WARNING(f'Product "{product.name}" is already a bestseller.'))
             else:
-                product.is_bestseller = True
-                product.save()
+                self.bulk.update(Product.objects.filter(pk=product.pk), is_bestseller=True)
                 self.stdout.write(self.style.SUCCESS(f'Added "{product.name}" to bestsellers.'))
                 
         except Product.DoesNotExist:
@@ -88,8 +89,7 @@ class Command(BaseCommand):
             if not product.is_bestseller:
                 self.stdout.write(self.style.WARNING(f'Product "{product.name}" is not a bestseller.'))
             else:
-                product.is_bestseller = False
-                product.save()
+                self.bulk.update(Product.objects.filter(pk=product.pk), is_bestseller=False)
                 self.stdout.write(self.style.SUCCESS(f'Removed "{product.name}" from bestsellers.'))
                 
         except Product.DoesNotExist:
@@ -99,8 +99,8 @@ class Command(BaseCommand):
 
     def clear_bestsellers(self):
         """Clear all bestsellers"""
-        count = Product.objects.filter(is_bestseller=True).count()
-        Product.objects.filter(is_bestseller=True).update(is_bestseller=False)
+        # The facet index keeps a bestseller flag, so the cleared products are refreshed chunk by chunk
+        count = self.bulk.update(Product.objects.filter(is_bestseller=True), label='products', is_bestseller=False)
         self.stdout.write(self.style.SUCCESS(f'Cleared {count} bestseller products.'))
 
 
@@ -109,3 +109,4 @@ class Command(BaseCommand):
 # python manage.py manage_bestsellers --action add --product-name "Premium Cotton"
 # python manage.py manage_bestsellers --action remove --product-id 1
 # python manage.py manage_bestsellers --action clear
+# python manage.py manage_bestsellers --action clear --dry-run
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from shop.exports import Export, SUBSCRIBER_COLUMNS
 from shop.models import WhatsAppSubscription
 from django.utils import timezone
 
@@ -104,10 +105,9 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('No active subscriptions to export.'))
             return
         
-        self.stdout.write('Phone Number,Name,Subscribed Date,Source')
-        for sub in active_subscriptions:
-            name = sub.name if sub.name else "No name"
-            self.stdout.write(f'{sub.phone_number},{name},{sub.subscribed_at.strftime("%Y-%m-%d")},{sub.source}')
+        # Streamed in chunks, so memory use does not grow with the number of subscribers
+        export = Export('subscribers', SUBSCRIBER_COLUMNS)
+        export.write(active_subscriptions.order_by('-subscribed_at'), self.stdout)
         
         self.stdout.write(self.style.SUCCESS(f'\nExported {active_subscriptions.count()} active subscriptions.'))
 
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from shop.models import Review, Product
+from shop.models import Review, Product, SiteStats
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -64,7 +64,11 @@ class Command(BaseCommand):
     def approve_reviews(self, review_id, all_reviews):
         """Approve review(s)"""
         if all_reviews:
-            count = Review.objects.filter(is_approved=False).update(is_approved=True)
+            pending = Review.objects.filter(is_approved=False)
+            product_ids = set(pending.values_list('product_id', flat=True))
+            count = pending.update(is_approved=True)
+            Product.update_rating_stats(product_ids)
+            SiteStats.rebuild()
             self.stdout.write(self.style.SUCCESS(f'Approved {count} reviews.'))
         elif review_id:
             try:
@@ -83,7 +87,11 @@ class Command(BaseCommand):
     def disapprove_reviews(self, review_id, all_reviews):
         """Disapprove review(s)"""
         if all_reviews:
-            count = Review.objects.filter(is_approved=True).update(is_approved=False)
+            approved = Review.objects.filter(is_approved=True)
+            product_ids = set(approved.values_list('product_id', flat=True))
+            count = approved.update(is_approved=False)
+            Product.update_rating_stats(product_ids)
+            SiteStats.rebuild()
             self.stdout.write(self.style.SUCCESS(f'Disapproved {count} reviews.'))
         elif review_id:
             try:
@@ -1,16 +1,14 @@
-from django.core.management.base import BaseCommand
-from django.core.files import File
-from shop.models import Product, ProductImage, Category, SubCategory
+from django.core.files.base import ContentFile
+from shop.bulk import BulkCommand
+from shop.models import Product, ProductImage
 import requests
-import os
-from io import BytesIO
-from PIL import Image as PILImage
 
 
-class Command(BaseCommand):
+class Command(BulkCommand):
     help = 'Populate database with diverse sample images for products'
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument(
             '--count',
             type=int,
@@ -56,68 +54,74 @@ class Command(BaseCommand):
             'https://images.unsplash.com/photo-1571513723812-70c0a0a6b4b0?ixlib=rb-4.0.3&auto=format&fit=crop&w=800&q=80',
         ]
 
-        products = Product.objects.filter(is_active=True)[:count]
+        product_ids = list(Product.objects.filter(is_active=True).values_list('pk', flat=True)[:count])
         
-        if not products.exists():
+        if not product_ids:
             self.stdout.write(
                 self.style.WARNING('No active products found. Please create products first.')
             )
             return
 
-        self.stdout.write(f'Adding diverse images to {products.count()} products...')
+        self.stdout.write(f'Adding diverse images to {len(product_ids)} products...')
 
-        for i, product in enumerate(products):
-            try:
-                # Clear existing images
-                product.images.all().delete()
-                
+        # The list repeats the same few photos; each is downloaded once
+        downloads = {}
+        image_field = ProductImage._meta.get_field('image')
+        i = 0
+        added = failed = 0
+        products = Product.objects.filter(pk__in=product_ids).only('pk', 'name', 'slug')
+        for chunk in self.bulk.chunks(products, label='products'):
+            # Clear existing images
+            self.bulk.delete(ProductImage.objects.filter(product__in=chunk))
+            
+            images = []
+            for product in chunk:
                 # Add 2-4 images per product
                 num_images = min(4, len(image_urls) - i * 2)
                 start_idx = (i * 2) % len(image_urls)
+                i += 1
                 
                 for j in range(num_images):
                     image_url = image_urls[(start_idx + j) % len(image_urls)]
+                    product_image = ProductImage(
+                        product=product,
+                        is_primary=(j == 0)  # First image is primary
+                    )
+                    if self.bulk.dry_run:
+                        images.append(product_image)
+                        continue
                     
                     try:
                         # Download image
-                        response = requests.get(image_url, timeout=10)
-                        response.raise_for_status()
-                        
-                        # Create image file
-                        image_file = BytesIO(response.content)
-                        
-                        # Create ProductImage instance
-                        product_image = ProductImage.objects.create(
-                            product=product,
-                            is_primary=(j == 0)  # First image is primary
-                        )
+                        if image_url not in downloads:
+                            response = requests.get(image_url, timeout=10)
+                            response.raise_for_status()
+                            downloads[image_url] = response.content
                         
-                        # Save image file
-                        product_image.image.save(
-                            f'{product.slug}_image_{j+1}.jpg',
-                            File(image_file),
-                            save=True
+                        # Store the file now; the rows are inserted together below
+                        product_image.image = image_field.storage.save(
+                            image_field.generate_filename(product_image, f'{product.slug}_image_{j+1}.jpg'),
+                            ContentFile(downloads[image_url]),
                         )
-                        
-                        self.stdout.write(f'  ✓ Added image {j+1} to {product.name}')
+                        images.append(product_image)
                         
                     except Exception as e:
+                        failed += 1
                         self.stdout.write(
                             self.style.WARNING(f'  ⚠ Failed to add image {j+1} to {product.name}: {str(e)}')
                         )
                         continue
-                
-                self.stdout.write(
-                    self.style.SUCCESS(f'✓ Updated images for {product.name}')
-                )
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'✗ Failed to update {product.name}: {str(e)}')
-                )
-                continue
+            
+            added += len(self.bulk.bulk_create(images))
 
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully updated images for {products.count()} products!')
+            self.style.SUCCESS(
+                f'Successfully added {added} images to {len(product_ids)} products'
+                + (f' ({failed} failed)!' if failed else '!')
+            )
         )
 
+
+# Usage examples:
+# python manage.py populate_diverse_images
+# python manage.py populate_diverse_images --count 500 --progress
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import search_engine
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from the catalog'
+
+    def handle(self, *args, **options):
+        backend = search_engine.get_backend()
+        self.stdout.write(f'Rebuilding search index ({backend.name} backend)...')
+
+        start = time.perf_counter()
+        count = search_engine.rebuild_index()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} active products in {elapsed:.2f}s'))
+
+
+# Usage example:
+# python manage.py rebuild_search_index
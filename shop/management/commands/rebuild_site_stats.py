@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from shop.models import SiteStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed site-wide statistics from scratch'
+
+    def handle(self, *args, **options):
+        stats = SiteStats.rebuild()
+        average = stats.average_rating
+
+        self.stdout.write(self.style.SUCCESS('📊 Site statistics rebuilt:'))
+        self.stdout.write(f'Active Products: {stats.total_products}')
+        self.stdout.write(f'Approved Reviews: {stats.total_reviews}')
+        self.stdout.write(f'Average Rating: {average:.1f}/5' if average else 'Average Rating: -')
+
+
+# Usage example:
+# python manage.py rebuild_site_stats
@@ -1,19 +1,21 @@
-from django.core.management.base import BaseCommand
+from shop.bulk import BulkCommand
 from shop.models import Category, SubCategory, Product, ProductVariant
 from decimal import Decimal
 
 
-class Command(BaseCommand):
+EXISTING_BESTSELLERS = [
+    'Customised Dupatta - Made to Order',
+    'Fancy Embroidered Dupatta - Special Occasions',
+]
+
+
+class Command(BulkCommand):
     help = 'Set specific products as bestsellers in sorted order'
 
     def handle(self, *args, **options):
         self.stdout.write('Setting specific bestseller products in sorted order...')
         
         try:
-            # Clear all current bestsellers
-            Product.objects.update(is_bestseller=False)
-            self.stdout.write('✅ Cleared all current bestsellers')
-            
             # Get or create categories
             dupattas_category = Category.objects.get(name='Dupattas')
             leggings_category = Category.objects.get(name='Leggings')
@@ -23,20 +25,16 @@ class Command(BaseCommand):
             customised_subcat = SubCategory.objects.get(category=dupattas_category, name='Customised Dupatta')
             ankle_subcat = SubCategory.objects.get(category=leggings_category, name='Ankle Length')
             
-            # 1. Customised Dupatta (Already exists)
-            customised_product = Product.objects.get(name='Customised Dupatta - Made to Order')
-            customised_product.is_bestseller = True
-            customised_product.save()
-            self.stdout.write('✅ 1. Customised Dupatta - Made to Order (Bestseller)')
-            
-            # 2. Fancy Dupatta (Already exists)
-            fancy_product = Product.objects.get(name='Fancy Embroidered Dupatta - Special Occasions')
-            fancy_product.is_bestseller = True
-            fancy_product.save()
-            self.stdout.write('✅ 2. Fancy Embroidered Dupatta - Special Occasions (Bestseller)')
+            # 1. and 2. Customised and Fancy Dupatta (Already exist)
+            existing = Product.objects.filter(name__in=EXISTING_BESTSELLERS).values_list('name', flat=True)
+            missing = set(EXISTING_BESTSELLERS) - set(existing)
+            if missing:
+                raise Product.DoesNotExist(f'Product not found: {", ".join(sorted(missing))}')
+            for number, name in enumerate(EXISTING_BESTSELLERS, 1):
+                self.stdout.write(f'✅ {number}. {name} (Bestseller)')
             
             # 3. White Heavy Fancy Dupatta (Create new)
-            white_heavy_product, created = Product.objects.get_or_create(
+            white_heavy_product, created = self.get_or_create_product(
                 name='White Heavy Fancy Dupatta',
                 defaults={
                     'category': dupattas_category,
@@ -60,22 +58,20 @@ class Command(BaseCommand):
             
             if created:
                 # Create variants
-                ProductVariant.objects.create(
+                self.bulk.bulk_create([ProductVariant(
                     product=white_heavy_product,
                     size='One Size',
                     color='White',
                     color_code='#FFFFFF',
                     stock_quantity=25,
                     is_active=True
-                )
+                )])
                 self.stdout.write('✅ 3. White Heavy Fancy Dupatta (Created & Bestseller)')
             else:
-                white_heavy_product.is_bestseller = True
-                white_heavy_product.save()
                 self.stdout.write('✅ 3. White Heavy Fancy Dupatta (Bestseller)')
             
             # 4. Lyra Leggings (Create new)
-            lyra_leggings, created = Product.objects.get_or_create(
+            lyra_leggings, created = self.get_or_create_product(
                 name='Lyra Leggings',
                 defaults={
                     'category': leggings_category,
@@ -108,8 +104,8 @@ class Command(BaseCommand):
                     {'size': 'L', 'color': 'Navy', 'color_code': '#000080'},
                 ]
                 
-                for variant_data in variants:
-                    ProductVariant.objects.create(
+                self.bulk.bulk_create([
+                    ProductVariant(
                         product=lyra_leggings,
                         size=variant_data['size'],
                         color=variant_data['color'],
@@ -117,12 +113,26 @@ class Command(BaseCommand):
                         stock_quantity=50,
                         is_active=True
                     )
+                    for variant_data in variants
+                ])
                 self.stdout.write('✅ 4. Lyra Leggings (Created & Bestseller)')
             else:
-                lyra_leggings.is_bestseller = True
-                lyra_leggings.save()
                 self.stdout.write('✅ 4. Lyra Leggings (Bestseller)')
             
+            # Swap the bestseller flags in two updates, leaving rows that keep their flag alone
+            bestseller_names = EXISTING_BESTSELLERS + [white_heavy_product.name, lyra_leggings.name]
+            cleared = self.bulk.update(
+                Product.objects.filter(is_bestseller=True).exclude(name__in=bestseller_names),
+                label='products', is_bestseller=False,
+            )
+            self.stdout.write(f'✅ Cleared {cleared} other bestsellers')
+            self.bulk.update(
+                Product.objects.filter(name__in=bestseller_names, is_bestseller=False), is_bestseller=True,
+            )
+            
+            if self.bulk.dry_run:
+                return
+            
             # Verify the bestsellers
             bestsellers = Product.objects.filter(is_bestseller=True).order_by('name')
             self.stdout.write(self.style.SUCCESS('\n🎉 Bestseller Products Set Successfully!'))
@@ -134,3 +144,15 @@ class Command(BaseCommand):
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'❌ Error: {str(e)}'))
+
+    def get_or_create_product(self, name, defaults):
+        """Product.objects.get_or_create(), without creating anything on a dry run"""
+        if self.bulk.dry_run:
+            product = Product.objects.filter(name=name).first()
+            return (product, False) if product else (Product(name=name, **defaults), True)
+        return Product.objects.get_or_create(name=name, defaults=defaults)
+
+
+# Usage examples:
+# python manage.py set_specific_bestsellers
+# python manage.py set_specific_bestsellers --dry-run
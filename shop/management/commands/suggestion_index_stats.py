@@ -0,0 +1,87 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from shop import suggestions
+from shop.benchmarks import isolated_database, build_synthetic_catalog, measure
+
+
+DEFAULT_PREFIXES = ['d', 're', 'sil', 'red s', 'chikan', 'palazzo', 'navy blue']
+
+
+class Command(BaseCommand):
+    help = 'Report build time, memory footprint and lookup latency of the search suggestion index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Measure against a throwaway database with this many synthetic products')
+        parser.add_argument('--prefix', action='append', dest='prefixes', help='Prefix to time (repeatable)')
+        parser.add_argument('--repeat', type=int, default=1000, help='Lookups per prefix')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            with isolated_database():
+                self.stdout.write(f'Building synthetic catalog of {options["synthetic"]} products...')
+                build_synthetic_catalog(options['synthetic'])
+                results = self.measure_index(options)
+        else:
+            results = self.measure_index(options)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["json_path"]}'))
+
+    def measure_index(self, options):
+        self.stdout.write(self.style.SUCCESS('🔎 Suggestion index'))
+
+        start = time.perf_counter()
+        collected = suggestions._collect_suggestions()
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = suggestions.SuggestionIndex(collected)
+        build_seconds = time.perf_counter() - start
+
+        # Traced separately, tracemalloc slows allocation-heavy code down several times
+        del index
+        tracemalloc.start()
+        index = suggestions.SuggestionIndex(collected)
+        footprint, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        kinds = {}
+        for suggestion in index.suggestions:
+            kinds[suggestion.kind] = kinds.get(suggestion.kind, 0) + 1
+
+        results = {
+            'suggestions': len(index.suggestions),
+            'by_kind': kinds,
+            'keys': len(index.keys),
+            'precomputed_prefixes': len(index.top),
+            'load_seconds': round(load_seconds, 3),
+            'build_seconds': round(build_seconds, 3),
+            'index_bytes': footprint,
+            'build_peak_bytes': peak,
+            'lookups': {},
+        }
+        self.stdout.write(f'Suggestions: {results["suggestions"]} ({", ".join(f"{k}: {v}" for k, v in sorted(kinds.items()))})')
+        self.stdout.write(f'Prefix keys: {results["keys"]}, precomputed prefixes: {results["precomputed_prefixes"]}')
+        self.stdout.write(f'Load from database: {load_seconds:.3f}s, index build: {build_seconds:.3f}s')
+        self.stdout.write(f'Index memory: {footprint / 1024 / 1024:.1f} MB (peak during build {peak / 1024 / 1024:.1f} MB)')
+
+        self.stdout.write('')
+        self.stdout.write(f'{"prefix":<14} {"first ms":>9} {"median us":>10} {"results":>8}')
+        for prefix in options['prefixes'] or DEFAULT_PREFIXES:
+            first, _, _ = measure(lambda: index.lookup(prefix), repeat=1)
+            median, best, found = measure(lambda: index.lookup(prefix), repeat=options['repeat'])
+            results['lookups'][prefix] = {'first_ms': round(first, 3), 'median_us': round(median * 1000, 2)}
+            self.stdout.write(f'{prefix:<14} {first:>9.3f} {median * 1000:>10.2f} {len(found):>8}')
+        return results
+
+
+# Usage examples:
+# python manage.py suggestion_index_stats
+# python manage.py suggestion_index_stats --synthetic 100000 --json suggestions.json
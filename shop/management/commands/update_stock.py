@@ -1,29 +1,31 @@
-from django.core.management.base import BaseCommand
+from shop.bulk import BulkCommand
 from shop.models import Product, ProductVariant
 
 
-class Command(BaseCommand):
+class Command(BulkCommand):
     help = 'Update stock quantities for products and variants'
 
-    def handle(self, *args, **options):
-        # Update product stock quantities
-        products_updated = 0
-        for product in Product.objects.all():
-            product.stock_quantity = 50
-            product.save()
-            products_updated += 1
-            self.stdout.write(f'Updated {product.name} stock to 50')
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--product-stock', type=int, default=50, help='Stock for every product (default: 50)')
+        parser.add_argument('--variant-stock', type=int, default=25, help='Stock for every variant (default: 25)')
 
-        # Update variant stock quantities  
-        variants_updated = 0
-        for variant in ProductVariant.objects.all():
-            variant.stock_quantity = 25
-            variant.save()
-            variants_updated += 1
-            self.stdout.write(f'Updated variant {variant.color} {variant.size} stock to 25')
+    def handle(self, *args, **options):
+        products_updated = self.bulk.update(
+            Product.objects.all(), label='products', stock_quantity=options['product_stock'],
+        )
+        variants_updated = self.bulk.update(
+            ProductVariant.objects.all(), label='variants', stock_quantity=options['variant_stock'],
+        )
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully updated {products_updated} products and {variants_updated} variants!'
+                f'Successfully updated {products_updated} products (stock {options["product_stock"]}) '
+                f'and {variants_updated} variants (stock {options["variant_stock"]})!'
             )
         )
+
+
+# Usage examples:
+# python manage.py update_stock
+# python manage.py update_stock --product-stock 100 --variant-stock 40 --dry-run
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_deliveryoption_promocode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_products', models.PositiveIntegerField(default=0, help_text='Active products')),
+                ('total_reviews', models.PositiveIntegerField(default=0, help_text='Approved reviews')),
+                ('rating_total', models.PositiveIntegerField(default=0, help_text='Sum of approved review ratings')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Site Statistics',
+                'verbose_name_plural': 'Site Statistics',
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:03
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+
+    histograms = {}
+    star_counts = Review.objects.filter(is_approved=True).values('product_id', 'rating').annotate(
+        count=models.Count('id')
+    )
+    for row in star_counts:
+        if 1 <= row['rating'] <= 5:
+            histograms.setdefault(row['product_id'], [0] * 5)[row['rating'] - 1] = row['count']
+
+    for product_id, histogram in histograms.items():
+        count = sum(histogram)
+        total = sum(stars * n for stars, n in enumerate(histogram, start=1))
+        Product.objects.filter(pk=product_id).update(
+            rating_avg=(Decimal(total) / count).quantize(Decimal('0.01')),
+            rating_count=count,
+            rating_histogram=histogram,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_sitestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=list, help_text='Approved review counts for 1 to 5 stars'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_avg', '-rating_count'], name='shop_product_rating_idx'),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=100, unique=True)),
+                ('search_count', models.PositiveIntegerField(default=0)),
+                ('last_searched', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Search Query',
+                'verbose_name_plural': 'Search Queries',
+                'ordering': ['-search_count'],
+                'indexes': [models.Index(fields=['-search_count'], name='shop_searchquery_count_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_searchquery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text='Manifest of generated sizes and formats'),
+        ),
+    ]
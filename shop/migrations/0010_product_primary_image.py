@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+TABLE = 'shop_product_fts'
+
+# The indexed fields of shop.search_engine.FIELD_WEIGHTS, in order
+COLUMNS = ['name', 'categories', 'attributes', 'short_description', 'description']
+
+
+def create_search_index(apps, schema_editor):
+    """Create and fill the FTS5 product index on SQLite builds that have FTS5"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5({', '.join(COLUMNS)}, tokenize='unicode61')"
+        )
+    except OperationalError:
+        return  # No FTS5: the search engine falls back to its in-process index
+
+    Product = apps.get_model('shop', 'Product')
+    sql = f"INSERT INTO {TABLE} (rowid, {', '.join(COLUMNS)}) VALUES (%s, {', '.join(['%s'] * len(COLUMNS))})"
+    products = Product.objects.filter(is_active=True).select_related('category', 'subcategory')
+    with schema_editor.connection.cursor() as cursor:
+        # A table left by earlier versions, which created it on the first search
+        cursor.execute(f'DELETE FROM {TABLE}')
+        batch = []
+        for product in products.iterator(chunk_size=2000):
+            batch.append([
+                product.pk,
+                product.name,
+                f'{product.category.name} {product.subcategory.name}',
+                f'{product.get_fabric_display()} {product.get_occasion_display()}',
+                product.short_description,
+                product.description,
+            ])
+            if len(batch) >= 1000:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_cache_versions_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -2,8 +2,6 @@ from django.db import models
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
-from PIL import Image
-import os
 
 User = get_user_model()
 
@@ -104,6 +102,15 @@ class Product(models.Model):
     is_featured = models.BooleanField(default=False)
     is_bestseller = models.BooleanField(default=False, help_text="Show in Bestsellers This Week section")
     
+    # Rating aggregates over approved reviews (maintained by update_rating_stats)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_histogram = models.JSONField(default=list, blank=True, help_text="Approved review counts for 1 to 5 stars")
+    
+    # Primary image, copied from ProductImage so listings need no images query (maintained by update_primary_images)
+    primary_image = models.ImageField(upload_to='products/', blank=True, editable=False)
+    primary_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    
     # SEO
     meta_title = models.CharField(max_length=200, blank=True)
     meta_description = models.TextField(max_length=300, blank=True)
@@ -114,6 +121,9 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-rating_avg', '-rating_count'], name='shop_product_rating_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -133,14 +143,75 @@ class Product(models.Model):
 
     @property
     def average_rating(self):
-        reviews = self.reviews.filter(is_approved=True)
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
+        if self.rating_count:
+            return round(float(self.rating_avg), 1)
         return 0
 
     @property
     def review_count(self):
-        return self.reviews.filter(is_approved=True).count()
+        return self.rating_count
+
+    @classmethod
+    def update_primary_images(cls, product_ids):
+        """Copy the primary image (flagged primary, else first by sort order) and its manifest onto the products"""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return 0
+
+        primary = {}
+        images = ProductImage.objects.filter(product_id__in=product_ids).order_by(
+            'product_id', '-is_primary', 'sort_order', 'pk'
+        ).values_list('product_id', 'image', 'derivatives')
+        for product_id, image, derivatives in images:
+            if product_id not in primary:
+                # A manifest left over from a replaced file is not copied
+                manifest = derivatives if derivatives and derivatives.get('source') == image else {}
+                primary[product_id] = (image, manifest)
+
+        changed = []
+        stored = cls.objects.filter(pk__in=product_ids).values_list('pk', 'primary_image', 'primary_image_derivatives')
+        for product_id, current_image, current_manifest in stored:
+            image, manifest = primary.get(product_id, ('', {}))
+            if (current_image, current_manifest) != (image, manifest):
+                changed.append(cls(pk=product_id, primary_image=image, primary_image_derivatives=manifest))
+        cls.objects.bulk_update(changed, ['primary_image', 'primary_image_derivatives'])
+        return len(changed)
+
+    @classmethod
+    def update_rating_stats(cls, product_ids):
+        """Recompute the stored rating aggregates of the given products from approved reviews"""
+        from decimal import Decimal
+        from django.db import transaction
+
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+
+        with transaction.atomic():
+            # Lock the product rows so concurrent review changes apply one at a time
+            list(cls.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', flat=True))
+
+            histograms = {product_id: [0] * 5 for product_id in product_ids}
+            star_counts = Review.objects.filter(
+                product_id__in=product_ids, is_approved=True
+            ).values('product_id', 'rating').annotate(count=models.Count('id'))
+            for row in star_counts:
+                if 1 <= row['rating'] <= 5:
+                    histograms[row['product_id']][row['rating'] - 1] = row['count']
+
+            for product_id, histogram in histograms.items():
+                count = sum(histogram)
+                total = sum(stars * n for stars, n in enumerate(histogram, start=1))
+                average = (Decimal(total) / count).quantize(Decimal('0.01')) if count else Decimal('0')
+                cls.objects.filter(pk=product_id).update(
+                    rating_avg=average,
+                    rating_count=count,
+                    rating_histogram=histogram,
+                )
+
+        # Rating sort order lives in the facet index, which .update() bypasses
+        from .facets import refresh_products
+        refresh_products(product_ids)
 
 
 class ProductImage(models.Model):
@@ -150,6 +221,10 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=200)
     is_primary = models.BooleanField(default=False)
     sort_order = models.PositiveIntegerField(default=0)
+    
+    # Resized copies, rendered off the request (see shop/images.py); blank while pending
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    derivatives = models.JSONField(default=dict, blank=True, help_text="Manifest of generated sizes and formats")
 
     class Meta:
         ordering = ['sort_order']
@@ -158,15 +233,22 @@ class ProductImage(models.Model):
         return f"{self.product.name} - Image {self.sort_order}"
 
     def save(self, *args, **kwargs):
+        # The original is kept; card/gallery/zoom/thumbnail sizes are generated by
+        # generate_image_derivatives, so a new or replaced file is only marked pending here
+        from .images import mark_pending, schedule
+        if mark_pending(self) and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'content_hash'}
         super().save(*args, **kwargs)
-        
-        # Resize image if it's too large
-        if self.image:
-            img = Image.open(self.image.path)
-            if img.height > 800 or img.width > 800:
-                output_size = (800, 800)
-                img.thumbnail(output_size)
-                img.save(self.image.path)
+        schedule(self)
+
+    def derivative_url(self, size='card', image_format='jpeg'):
+        """URL of a generated size, falling back to the original until it exists"""
+        from .images import derivative_url
+        return derivative_url(self.derivatives, size, image_format) or (self.image.url if self.image else '')
+
+    def srcset(self, image_format='jpeg', size=None):
+        from .images import srcset
+        return srcset(self.derivatives, image_format, size)
 
 
 class ProductVariant(models.Model):
@@ -324,4 +406,99 @@ class DeliveryOption(models.Model):
         ordering = ['sort_order', 'name']
     
     def __str__(self):
-        return f"{self.name} - {self.estimated_days}"
\ No newline at end of file
+        return f"{self.name} - {self.estimated_days}"
+
+class SiteStats(models.Model):
+    """Site-wide statistics kept up to date by signals instead of per-page aggregates"""
+    SINGLETON_ID = 1
+
+    total_products = models.PositiveIntegerField(default=0, help_text="Active products")
+    total_reviews = models.PositiveIntegerField(default=0, help_text="Approved reviews")
+    rating_total = models.PositiveIntegerField(default=0, help_text="Sum of approved review ratings")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Site Statistics'
+        verbose_name_plural = 'Site Statistics'
+
+    def __str__(self):
+        return f"{self.total_products} products, {self.total_reviews} reviews"
+
+    @property
+    def average_rating(self):
+        if self.total_reviews:
+            return self.rating_total / self.total_reviews
+        return None
+
+    @classmethod
+    def get_snapshot(cls):
+        """Return the stats row, building it on first use"""
+        stats = cls.objects.filter(pk=cls.SINGLETON_ID).first()
+        if stats is None:
+            stats = cls.rebuild()
+        return stats
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every statistic from scratch"""
+        approved = Review.objects.filter(is_approved=True).aggregate(
+            count=models.Count('id'),
+            total=models.Sum('rating'),
+        )
+        stats, created = cls.objects.update_or_create(
+            pk=cls.SINGLETON_ID,
+            defaults={
+                'total_products': Product.objects.filter(is_active=True).count(),
+                'total_reviews': approved['count'],
+                'rating_total': approved['total'] or 0,
+            }
+        )
+        return stats
+
+    @classmethod
+    def apply_delta(cls, products=0, reviews=0, rating_total=0):
+        """Adjust the counters in place after a single product/review change"""
+        if not (products or reviews or rating_total):
+            return
+        from django.utils import timezone
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            total_products=models.F('total_products') + products,
+            total_reviews=models.F('total_reviews') + reviews,
+            rating_total=models.F('rating_total') + rating_total,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # No snapshot yet - the change is already in the tables, so count it all
+            cls.rebuild()
+
+
+class SearchQuery(models.Model):
+    """Normalised storefront search terms and how often they were searched, used for suggestions"""
+    query = models.CharField(max_length=100, unique=True)
+    search_count = models.PositiveIntegerField(default=0)
+    last_searched = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-search_count']
+        indexes = [models.Index(fields=['-search_count'], name='shop_searchquery_count_idx')]
+        verbose_name = 'Search Query'
+        verbose_name_plural = 'Search Queries'
+
+    def __str__(self):
+        return f"{self.query} ({self.search_count})"
+
+    @classmethod
+    def record(cls, query, count=1):
+        """Count searches for a query (whitespace and case are normalised); see shop/search_counts.py"""
+        query = ' '.join(query.lower().split())[:100]
+        if not query:
+            return
+        from django.utils import timezone
+        updated = cls.objects.filter(query=query).update(
+            search_count=models.F('search_count') + count, last_searched=timezone.now()
+        )
+        if not updated:
+            search_query, created = cls.objects.get_or_create(query=query, defaults={'search_count': count})
+            if not created:
+                # Created by a concurrent search in the meantime
+                cls.objects.filter(pk=search_query.pk).update(search_count=models.F('search_count') + count)
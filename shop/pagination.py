@@ -0,0 +1,247 @@
+"""
+Cursor pagination for product listings.
+
+Page-number pagination needs a COUNT(*) and an OFFSET that grows with the
+page; cursor pages instead continue from the last row shown. Cursors are
+opaque signed tokens. Querysets are paged by keyset on the sort order
+(`WHERE (sort keys, id) > last row`); ranked id lists from the search and
+facet indexes are paged from an anchor id, so inserts and deletes between
+requests do not shift the page.
+
+Page numbers remain the default; `?cursor=` (or PRODUCT_PAGINATION =
+'cursor') switches a listing to cursor mode.
+"""
+import hashlib
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+from .versioning import CATALOG_VERSION, get_version
+
+
+CURSOR_SALT = 'shop.pagination.cursor'
+
+# Sort orders as (field, descending) pairs; each ends in id so every row has a unique position
+SORT_ORDERS = {
+    'featured': (('is_featured', True), ('created_at', True), ('id', True)),
+    'price_low': (('selling_price', False), ('id', False)),
+    'price_high': (('selling_price', True), ('id', False)),
+    'newest': (('created_at', True), ('id', True)),
+    'rating': (('rating_avg', True), ('rating_count', True), ('created_at', True), ('id', True)),
+    'popularity': (('is_bestseller', True), ('is_featured', True), ('created_at', True), ('id', True)),
+}
+
+
+def ordering_for(sort):
+    """order_by() arguments for a sort name, falling back to featured"""
+    return [f'-{field}' if descending else field for field, descending in SORT_ORDERS.get(sort, SORT_ORDERS['featured'])]
+
+
+def encode_cursor(payload):
+    return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """The payload of a cursor token, or None for a missing, tampered or malformed token"""
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def cached_count(signature, compute):
+    """Total for a listing, cached per filter signature until the catalog changes.
+
+    The figure can lag by up to LISTING_COUNT_CACHE_TIMEOUT seconds for changes
+    that do not bump the catalog version, hence "approximate".
+    """
+    timeout = getattr(settings, 'LISTING_COUNT_CACHE_TIMEOUT', 300)
+    if not timeout:
+        return compute()
+    digest = hashlib.md5(repr(signature).encode()).hexdigest()
+    key = f'shop:listing-count:{get_version(CATALOG_VERSION)}:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = compute()
+        cache.set(key, count, timeout)
+    return count
+
+
+class CursorPage:
+    """One page of a cursor paginated listing; mirrors the parts of Page the templates use"""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_url = None
+        self.previous_url = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def set_urls(self, params):
+        """Build next/previous links that keep every other query parameter"""
+        for attribute, cursor in (('next_url', self.next_cursor), ('previous_url', self.previous_cursor)):
+            if cursor is not None:
+                query = params.copy()
+                query.pop('page', None)
+                query['cursor'] = cursor
+                setattr(self, attribute, f'?{query.urlencode()}')
+
+
+class KeysetPaginator:
+    """Cursor pages over a queryset, continuing from the sort keys of the last row"""
+
+    def __init__(self, queryset, sort, per_page, count_signature=None):
+        self.sort = sort if sort in SORT_ORDERS else 'featured'
+        self.order = SORT_ORDERS[self.sort]
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_signature = count_signature
+
+    @property
+    def count(self):
+        """Approximate total, or None when counting is switched off"""
+        if self.count_signature is None:
+            return None
+        return cached_count(self.count_signature, self.queryset.count)
+
+    def _keys(self, obj):
+        return [_serialize(getattr(obj, field)) for field, descending in self.order]
+
+    def _after(self, keys, forward):
+        """Rows strictly after (forward) or before the given sort keys"""
+        model = self.queryset.model
+        values = [model._meta.get_field(field).to_python(key) for (field, descending), key in zip(self.order, keys)]
+        condition = Q()
+        for index, (field, descending) in enumerate(self.order):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{field}__{lookup}': values[index]})
+            for (previous, _), value in zip(self.order[:index], values[:index]):
+                term &= Q(**{previous: value})
+            condition |= term
+        return condition
+
+    def page(self, token):
+        payload = decode_cursor(token)
+        if payload and (payload.get('s') != self.sort or len(payload.get('k', ())) != len(self.order)):
+            payload = None
+
+        ordering = [f'-{field}' if descending else field for field, descending in self.order]
+        if payload is None:
+            rows = list(self.queryset.order_by(*ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif payload.get('d') == 'prev':
+            reverse = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+            rows = list(self.queryset.filter(self._after(payload['k'], False)).order_by(*reverse)[:self.per_page + 1])
+            has_before, has_more = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+        else:
+            rows = list(self.queryset.filter(self._after(payload['k'], True)).order_by(*ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+
+        next_cursor = previous_cursor = None
+        if rows and has_more:
+            next_cursor = encode_cursor({'s': self.sort, 'k': self._keys(rows[-1]), 'd': 'next'})
+        if rows and has_before:
+            previous_cursor = encode_cursor({'s': self.sort, 'k': self._keys(rows[0]), 'd': 'prev'})
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class SequencePaginator:
+    """Cursor pages over an already ranked list of ids, anchored on the ids at the page edges"""
+
+    def __init__(self, ids, per_page):
+        self.ids = ids
+        self.per_page = per_page
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    def _locate(self, anchor, hint):
+        if 0 <= hint < len(self.ids) and self.ids[hint] == anchor:
+            return hint
+        try:
+            return self.ids.index(anchor)
+        except ValueError:
+            # The anchor left the listing; its old position is the best guess
+            return min(max(hint, 0), len(self.ids))
+
+    def page(self, token):
+        payload = decode_cursor(token)
+        start = 0
+        if payload and 'a' in payload:
+            position = self._locate(payload['a'], payload.get('p', 0))
+            if payload.get('d') == 'prev':
+                start = max(position - self.per_page, 0)
+            else:
+                start = position + 1
+        end = min(start + self.per_page, len(self.ids))
+        ids = self.ids[start:end]
+
+        next_cursor = previous_cursor = None
+        if ids and end < len(self.ids):
+            next_cursor = encode_cursor({'a': ids[-1], 'p': end - 1, 'd': 'next'})
+        if ids and start > 0:
+            previous_cursor = encode_cursor({'a': ids[0], 'p': start, 'd': 'prev'})
+        return CursorPage(ids, self, next_cursor, previous_cursor)
+
+
+def use_cursor(request):
+    """Cursor mode when the request carries a cursor or it is the configured default"""
+    if 'cursor' in request.GET:
+        return True
+    return getattr(settings, 'PRODUCT_PAGINATION', 'page') == 'cursor' and 'page' not in request.GET
+
+
+def paginate(request, source, per_page, sort=None, count_signature=None):
+    """Page a queryset or ranked id list in cursor mode or, as the fallback, by page number"""
+    if use_cursor(request):
+        if isinstance(source, (list, tuple)):
+            paginator = SequencePaginator(list(source), per_page)
+        else:
+            if not getattr(settings, 'PRODUCT_CURSOR_COUNT', True):
+                count_signature = None
+            paginator = KeysetPaginator(source, sort, per_page, count_signature)
+        page_obj = paginator.page(request.GET.get('cursor'))
+        page_obj.set_urls(request.GET)
+        return page_obj
+
+    if not isinstance(source, (list, tuple)) and sort is not None:
+        source = source.order_by(*ordering_for(sort))
+    return Paginator(source, per_page).get_page(request.GET.get('page'))
+
@@ -0,0 +1,88 @@
+"""
+Search query counts for the popular-query suggestions.
+
+Counting every search with an UPDATE would put a write, and a lock on a hot
+row, on the search page. Searches are instead counted in a per-process
+buffer and written with SearchQuery.record once SEARCH_COUNT_BATCH (default
+50) searches have been buffered or SEARCH_COUNT_INTERVAL seconds (default
+60) have passed, after the response's transaction, and when the process
+exits. A crash loses at most one batch, which the suggestions can afford.
+
+Searches from crawlers and queries shorter than SEARCH_COUNT_MIN_LENGTH
+characters (default 3) are not counted: they say nothing about what
+shoppers look for.
+"""
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+
+logger = logging.getLogger(__name__)
+
+BOT_USER_AGENT_RE = re.compile(
+    r'bot|crawl|spider|slurp|fetch|scrap|curl|wget|python-requests|httpclient|headless|preview|monitor',
+    re.IGNORECASE,
+)
+
+_pending = Counter()
+_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+
+
+def normalize(query):
+    return ' '.join((query or '').lower().split())[:100]
+
+
+def is_bot(request):
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    return not user_agent or bool(BOT_USER_AGENT_RE.search(user_agent))
+
+
+def count_search(request, query):
+    """Buffer one search for a query; returns whether it was counted"""
+    query = normalize(query)
+    if len(query) < getattr(settings, 'SEARCH_COUNT_MIN_LENGTH', 3) or is_bot(request):
+        return False
+    with _lock:
+        _pending[query] += 1
+        due = (sum(_pending.values()) >= getattr(settings, 'SEARCH_COUNT_BATCH', 50)
+               or time.monotonic() - _last_flush[0] >= getattr(settings, 'SEARCH_COUNT_INTERVAL', 60))
+    if due:
+        transaction.on_commit(flush)
+    return True
+
+
+def flush():
+    """Write the buffered counts; returns the number of searches written"""
+    with _lock:
+        counts = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.monotonic()
+    if not counts:
+        return 0
+    from .models import SearchQuery
+
+    try:
+        for query, count in counts.items():
+            SearchQuery.record(query, count)
+    except DatabaseError:
+        logger.exception('Could not write %s search counts', sum(counts.values()))
+        return 0
+    return sum(counts.values())
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        # The database may already be gone at interpreter shutdown
+        pass
+
+
+atexit.register(_flush_at_exit)
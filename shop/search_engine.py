@@ -0,0 +1,331 @@
+"""
+Product search engine.
+
+Products are indexed over their name, category names, fabric/occasion,
+short description and description. On SQLite the index is an FTS5 virtual
+table ranked with bm25(), created by a migration; on other databases (or
+SQLite builds without FTS5, where the migration skips it) an in-process
+inverted index with BM25 scoring is used instead. Both treat
+the last query word as a prefix so the same engine serves type-ahead.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .versioning import get_version, bump_held_version, bump_version, register
+
+
+SEARCH_INDEX_VERSION = register('search_index')
+
+# Indexed fields and their ranking weights
+FIELD_WEIGHTS = (
+    ('name', 10.0),
+    ('categories', 4.0),
+    ('attributes', 3.0),
+    ('short_description', 2.0),
+    ('description', 1.0),
+)
+
+# Cap on how many vocabulary terms a prefix may expand to in the Python index
+MAX_PREFIX_EXPANSIONS = 50
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def indexable_products():
+    from .models import Product
+    return Product.objects.filter(is_active=True).select_related('category', 'subcategory')
+
+
+def product_document(product):
+    """Text of each indexed field for a product"""
+    return {
+        'name': product.name,
+        'categories': f'{product.category.name} {product.subcategory.name}',
+        'attributes': f'{product.get_fabric_display()} {product.get_occasion_display()}',
+        'short_description': product.short_description,
+        'description': product.description,
+    }
+
+
+class SQLiteFTSBackend:
+    """FTS5 index stored next to the catalog in the SQLite database.
+
+    The table is created and filled by migration shop 0012, which skips
+    databases without FTS5; requests only read and update its rows.
+    """
+    name = 'sqlite-fts5'
+    table = 'shop_product_fts'
+
+    @classmethod
+    def is_available(cls):
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [cls.table])
+            return cursor.fetchone() is not None
+
+    def rebuild(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            return self._insert(cursor, indexable_products().iterator(chunk_size=2000))
+
+    def _insert(self, cursor, products):
+        columns = [field for field, weight in FIELD_WEIGHTS]
+        sql = (
+            f"INSERT INTO {self.table} (rowid, {', '.join(columns)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(columns))})"
+        )
+        batch = []
+        count = 0
+        for product in products:
+            document = product_document(product)
+            batch.append([product.pk] + [document[column] for column in columns])
+            if len(batch) >= 1000:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+        return count
+
+    def index_products(self, products):
+        products = list(products)
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._delete(cursor, [product.pk for product in products])
+            self._insert(cursor, products)
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            self._delete(cursor, list(product_ids))
+
+    def _delete(self, cursor, product_ids):
+        if product_ids:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [[pk] for pk in product_ids])
+
+    def search(self, terms, limit=None):
+        # Terms are [a-z0-9]+ so quoting them is enough to neutralise FTS syntax
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        weights = ', '.join(str(weight) for field, weight in FIELD_WEIGHTS)
+        sql = (
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+            f'ORDER BY bm25({self.table}, {weights})'
+        )
+        params = [match]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InMemoryBackend:
+    """Pure-Python inverted index with BM25 ranking, held per process"""
+    name = 'python'
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self.postings = {}     # term -> {product_id: weighted term frequency}
+        self.doc_terms = {}    # product_id -> set of terms
+        self.doc_lengths = {}  # product_id -> weighted document length
+        self.vocabulary = []   # sorted terms, for prefix lookups
+        self.total_length = 0.0
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def _ensure_current(self):
+        version = get_version(SEARCH_INDEX_VERSION)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._build()
+                    self._version = version
+
+    def _build(self):
+        self._reset()
+        for product in indexable_products().iterator(chunk_size=2000):
+            self._add(product)
+        self.vocabulary = sorted(self.postings)
+
+    def rebuild(self):
+        with self._lock:
+            self._build()
+            self._version = bump_version(SEARCH_INDEX_VERSION)
+        return len(self.doc_lengths)
+
+    def _add(self, product):
+        """Index one product; returns the terms that are new to the vocabulary"""
+        document = product_document(product)
+        weighted = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS:
+            tokens = tokenize(document[field])
+            length += weight * len(tokens)
+            for token in tokens:
+                weighted[token] = weighted.get(token, 0.0) + weight
+        new_terms = []
+        for term, frequency in weighted.items():
+            documents = self.postings.get(term)
+            if documents is None:
+                documents = self.postings[term] = {}
+                new_terms.append(term)
+            documents[product.pk] = frequency
+        self.doc_terms[product.pk] = set(weighted)
+        self.doc_lengths[product.pk] = length
+        self.total_length += length
+        return new_terms
+
+    def _remove(self, product_id):
+        for term in self.doc_terms.pop(product_id, ()):
+            documents = self.postings.get(term)
+            if documents is not None:
+                documents.pop(product_id, None)
+                if not documents:
+                    del self.postings[term]
+                    index = bisect_left(self.vocabulary, term)
+                    if index < len(self.vocabulary) and self.vocabulary[index] == term:
+                        del self.vocabulary[index]
+        self.total_length -= self.doc_lengths.pop(product_id, 0.0)
+
+    def _apply(self, change):
+        """Apply an incremental change if this process holds the current index.
+
+        A process that has not built the index yet, or whose copy is already
+        stale, only bumps the version and rebuilds on its next search.
+        """
+        with self._lock:
+            current = self._version is not None and self._version == get_version(SEARCH_INDEX_VERSION)
+            if current:
+                change()
+            # Keep the local copy only if no other process bumped in between
+            version = bump_held_version(SEARCH_INDEX_VERSION, self._version)
+            self._version = version if current else None
+
+    def index_products(self, products):
+        def change():
+            for product in products:
+                self._remove(product.pk)
+                for term in self._add(product):
+                    self.vocabulary.insert(bisect_left(self.vocabulary, term), term)
+        self._apply(change)
+
+    def remove_products(self, product_ids):
+        def change():
+            for product_id in product_ids:
+                self._remove(product_id)
+        self._apply(change)
+
+    def expand_prefix(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, terms, limit=None):
+        self._ensure_current()
+        with self._lock:
+            documents = len(self.doc_lengths)
+            if not documents:
+                return []
+            average_length = self.total_length / documents
+
+            # Every query word must match; the last one may match any term it prefixes
+            groups = [[term] for term in terms[:-1]]
+            groups.append(self.expand_prefix(terms[-1]))
+
+            scores = None
+            for group in groups:
+                group_scores = {}
+                for term in group:
+                    postings = self.postings.get(term)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for product_id, frequency in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[product_id] / average_length)
+                        score = idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        if score > group_scores.get(product_id, 0.0):
+                            group_scores[product_id] = score
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {
+                        product_id: score + group_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in group_scores
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+        return ranked[:limit] if limit else ranked
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured backend: SEARCH_BACKEND = 'auto' (default), 'sqlite-fts5' or 'python'"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                choice = getattr(settings, 'SEARCH_BACKEND', 'auto')
+                if choice == 'python' or (choice == 'auto' and not SQLiteFTSBackend.is_available()):
+                    _backend = InMemoryBackend()
+                else:
+                    _backend = SQLiteFTSBackend()
+    return _backend
+
+
+def search_products(query, limit=None):
+    """Ids of active products matching every word of the query, best match first"""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    return get_backend().search(terms, limit=limit)
+
+
+def index_products(products):
+    """Add or refresh products in the index; inactive products are dropped from it"""
+    products = list(products)
+    active = [product for product in products if product.is_active]
+    inactive = [product.pk for product in products if not product.is_active]
+    backend = get_backend()
+    if active:
+        backend.index_products(active)
+    if inactive:
+        backend.remove_products(inactive)
+
+
+def remove_products(product_ids):
+    get_backend().remove_products(product_ids)
+
+
+def rebuild_index():
+    """Rebuild the whole index from the catalog; returns the number of indexed products"""
+    return get_backend().rebuild()
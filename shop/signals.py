@@ -1,16 +1,223 @@
-from django.db.models.signals import post_save, post_delete
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import ProductImage, Product
+from .models import ProductImage, Product, ProductVariant, Category, SubCategory, Review, SiteStats
+from .versioning import NAVIGATION_VERSION, CATALOG_VERSION, bump_version
+from . import search_engine, facets
+from .bulk import unless_muted
+
+
+def after_commit(function, *args):
+    """Run function(*args) once the current transaction commits, at once outside one.
+
+    The facet and search indexes and the cache versions are not rolled back
+    with the transaction, and other processes must not rebuild their caches
+    before the change is visible to them.
+    """
+    transaction.on_commit(partial(function, *args))
 
 
 @receiver(post_save, sender=ProductImage)
+@unless_muted
 def update_product_updated_at(sender, instance, **kwargs):
     """Update product's updated_at when image is added/modified"""
     instance.product.save(update_fields=['updated_at'])
 
 
 @receiver(post_delete, sender=ProductImage)
+@unless_muted
 def update_product_on_image_delete(sender, instance, **kwargs):
     """Update product's updated_at when image is deleted"""
     if instance.product:
         instance.product.save(update_fields=['updated_at'])
+
+
+@receiver(pre_save, sender=ProductImage)
+@unless_muted
+def remember_image_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'product' in update_fields:
+        instance._primary_previous = _previous_values(sender, instance, ['product_id'])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@unless_muted
+def update_primary_image(sender, instance, **kwargs):
+    """Keep the product's denormalised primary image in step with its gallery"""
+    affected = {instance.product_id}
+    previous = getattr(instance, '_primary_previous', None)
+    if previous:
+        # An image moved to another product leaves its old gallery too
+        affected.add(previous['product_id'])
+    Product.update_primary_images(affected)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_navigation(sender, instance, **kwargs):
+    """Rebuild the cached navbar tree after any category change"""
+    after_commit(bump_version, NAVIGATION_VERSION)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@unless_muted
+def invalidate_catalog(sender, instance, update_fields=None, **kwargs):
+    """Expire the per-process catalog caches after a catalog change"""
+    if update_fields is not None and set(update_fields) <= {'updated_at'}:
+        # Image touches only bump the timestamp
+        return
+    after_commit(bump_version, CATALOG_VERSION)
+
+
+def _previous_values(sender, instance, fields):
+    """Fetch the stored values of an instance before it is overwritten"""
+    if instance.pk is None:
+        return None
+    return sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+def _review_weight(is_approved, rating):
+    """Contribution of a review to the approved count and rating total"""
+    return (1, rating) if is_approved else (0, 0)
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+@receiver(pre_save, sender=Product)
+@unless_muted
+def remember_product_state(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, ['is_active']):
+        instance._stats_previous = _previous_values(sender, instance, ['is_active'])
+
+
+@receiver(post_save, sender=Product)
+@unless_muted
+def update_stats_on_product_save(sender, instance, update_fields=None, **kwargs):
+    """Keep the active product count in step with product saves"""
+    if not _touches(update_fields, ['is_active']):
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    was_active = bool(previous and previous['is_active'])
+    SiteStats.apply_delta(products=int(instance.is_active) - int(was_active))
+
+
+@receiver(post_delete, sender=Product)
+@unless_muted
+def update_stats_on_product_delete(sender, instance, **kwargs):
+    if instance.is_active:
+        SiteStats.apply_delta(products=-1)
+
+
+REVIEW_STAT_FIELDS = ['is_approved', 'rating', 'product']
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_state(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, REVIEW_STAT_FIELDS):
+        instance._stats_previous = _previous_values(sender, instance, ['is_approved', 'rating', 'product_id'])
+
+
+@receiver(post_save, sender=Review)
+def update_stats_on_review_save(sender, instance, update_fields=None, **kwargs):
+    """Keep site and product rating aggregates in step with review saves"""
+    if not _touches(update_fields, REVIEW_STAT_FIELDS):
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    old_count, old_total = _review_weight(previous['is_approved'], previous['rating']) if previous else (0, 0)
+    new_count, new_total = _review_weight(instance.is_approved, instance.rating)
+    SiteStats.apply_delta(reviews=new_count - old_count, rating_total=new_total - old_total)
+
+    moved = previous is not None and previous['product_id'] != instance.product_id
+    if moved or (old_count, old_total) != (new_count, new_total):
+        affected = {instance.product_id}
+        if moved:
+            affected.add(previous['product_id'])
+        after_commit(Product.update_rating_stats, affected)
+
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_review_delete(sender, instance, **kwargs):
+    count, total = _review_weight(instance.is_approved, instance.rating)
+    SiteStats.apply_delta(reviews=-count, rating_total=-total)
+    if count:
+        after_commit(Product.update_rating_stats, [instance.product_id])
+
+
+SEARCH_FIELDS = [
+    'name', 'short_description', 'description', 'fabric', 'occasion',
+    'category', 'subcategory', 'is_active',
+]
+
+
+@receiver(post_save, sender=Product)
+@unless_muted
+def update_search_index_on_product_save(sender, instance, update_fields=None, **kwargs):
+    """Re-index a product whenever one of its searchable fields may have changed"""
+    if _touches(update_fields, SEARCH_FIELDS):
+        after_commit(search_engine.index_products, [instance])
+
+
+@receiver(post_delete, sender=Product)
+@unless_muted
+def update_search_index_on_product_delete(sender, instance, **kwargs):
+    after_commit(search_engine.remove_products, [instance.pk])
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=SubCategory)
+def remember_category_name(sender, instance, **kwargs):
+    instance._search_previous = _previous_values(sender, instance, ['name'])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+def update_search_index_on_category_rename(sender, instance, created, **kwargs):
+    """Category names are indexed with each product, so a rename re-indexes its products"""
+    previous = getattr(instance, '_search_previous', None)
+    if created or not previous or previous['name'] == instance.name:
+        return
+    lookup = 'category' if sender is Category else 'subcategory'
+    after_commit(lambda: search_engine.index_products(search_engine.indexable_products().filter(**{lookup: instance})))
+
+
+@receiver(post_save, sender=Product)
+@unless_muted
+def update_facets_on_product_save(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, facets.INDEXED_FIELDS):
+        after_commit(facets.refresh_products, [instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+@unless_muted
+def update_facets_on_product_delete(sender, instance, **kwargs):
+    after_commit(facets.refresh_products, [instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@unless_muted
+def update_facets_on_variant_change(sender, instance, **kwargs):
+    """Variant sizes and colours are facets of their product"""
+    after_commit(facets.refresh_products, [instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_facets(sender, instance, **kwargs):
+    """Category slugs are facet values; rare enough to rebuild lazily"""
+    after_commit(bump_version, facets.FACET_INDEX_VERSION)
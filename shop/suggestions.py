@@ -0,0 +1,161 @@
+"""
+Search-as-you-type suggestions.
+
+Product names, category/subcategory names and popular search queries are held
+in a sorted array of keys, one key per word start, so a prefix is answered with
+two bisects. Suggestions are stored best first, so the top-k for a prefix are
+the k smallest positions in its key range. Prefixes of up to
+PRECOMPUTED_PREFIX_LENGTH characters are answered from a table built with the
+index; longer ones are memoised after their first lookup. The index lives per process and is rebuilt lazily
+when the catalog version changes.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.urls import reverse
+
+from .versioning import CATALOG_VERSION, get_version
+
+
+Suggestion = namedtuple('Suggestion', ['label', 'kind', 'url', 'weight'])
+
+DEFAULT_LIMIT = 8
+MAX_PREFIX_LENGTH = 50
+PRECOMPUTED_PREFIX_LENGTH = 2
+MEMO_SIZE = 2048
+
+# Base weights so categories lead, then popular queries, then products
+KIND_WEIGHTS = {
+    'category': 1_000_000,
+    'subcategory': 500_000,
+    'query': 1_000,
+    'product': 0,
+}
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def word_keys(label):
+    """The label from each word onwards, so 'silk' finds 'Red Silk Dupatta'"""
+    words = normalize(label).split(' ')
+    return [' '.join(words[index:]) for index in range(len(words)) if words[index]]
+
+
+def _collect_suggestions():
+    from .models import Category, SubCategory, Product, SearchQuery
+
+    suggestions = []
+    for category in Category.objects.filter(is_active=True).only('name', 'slug'):
+        suggestions.append(Suggestion(
+            category.name, 'category', category.get_absolute_url(), KIND_WEIGHTS['category'],
+        ))
+    for subcategory in SubCategory.objects.filter(
+        is_active=True, category__is_active=True
+    ).select_related('category').only('name', 'slug', 'category__slug'):
+        suggestions.append(Suggestion(
+            f'{subcategory.name} {subcategory.category.name}', 'subcategory',
+            subcategory.get_absolute_url(), KIND_WEIGHTS['subcategory'],
+        ))
+
+    search_url = reverse('shop:search')
+    popular = SearchQuery.objects.filter(
+        search_count__gte=getattr(settings, 'SUGGESTION_MIN_QUERY_COUNT', 2)
+    ).values_list('query', 'search_count')[:getattr(settings, 'SUGGESTION_POPULAR_QUERIES', 500)]
+    for query, count in popular:
+        suggestions.append(Suggestion(
+            query, 'query', f'{search_url}?{urlencode({"q": query})}', KIND_WEIGHTS['query'] + count,
+        ))
+
+    # Reversed once; slugs are URL safe so they can be substituted directly
+    product_url = reverse('shop:product_detail', kwargs={'product_slug': 'slug'})
+    product_url_prefix, product_url_suffix = product_url.rsplit('slug', 1)
+    products = Product.objects.filter(is_active=True).values_list(
+        'name', 'slug', 'rating_count', 'is_bestseller', 'is_featured'
+    )
+    for name, slug, rating_count, is_bestseller, is_featured in products.iterator(chunk_size=2000):
+        weight = rating_count + (100 if is_bestseller else 0) + (50 if is_featured else 0)
+        suggestions.append(Suggestion(
+            name, 'product', f'{product_url_prefix}{slug}{product_url_suffix}', weight,
+        ))
+    return suggestions
+
+
+class SuggestionIndex:
+    """Immutable prefix index over a list of suggestions"""
+
+    def __init__(self, suggestions):
+        # Stored best first, so the top suggestions for a prefix are the smallest positions in its range
+        self.suggestions = sorted(suggestions, key=lambda suggestion: (-suggestion.weight, suggestion.label))
+        self.top = {}
+        pairs = []
+        for position, suggestion in enumerate(self.suggestions):
+            for key in word_keys(suggestion.label):
+                pairs.append((key, position))
+                for length in range(1, min(PRECOMPUTED_PREFIX_LENGTH, len(key)) + 1):
+                    best = self.top.setdefault(key[:length], [])
+                    if len(best) < DEFAULT_LIMIT and (not best or best[-1] is not suggestion):
+                        best.append(suggestion)
+        pairs.sort()
+        self.keys = [key for key, position in pairs]
+        self.positions = [position for key, position in pairs]
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def lookup(self, prefix, limit=DEFAULT_LIMIT):
+        prefix = normalize(prefix)[:MAX_PREFIX_LENGTH]
+        if not prefix:
+            return ()
+        if limit <= DEFAULT_LIMIT and len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return tuple(self.top.get(prefix, ())[:limit])
+
+        memo_key = (prefix, limit)
+        with self._memo_lock:
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                return self._memo[memo_key]
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+        best = heapq.nsmallest(limit, set(self.positions[start:end]))
+        result = tuple(self.suggestions[position] for position in best)
+
+        with self._memo_lock:
+            self._memo[memo_key] = result
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return result
+
+
+_index = None
+_index_version = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def build_index():
+    return SuggestionIndex(_collect_suggestions())
+
+
+def get_index():
+    """The current suggestion index, rebuilt on catalog changes and to refresh popular queries"""
+    global _index, _index_version, _index_built_at
+    version = get_version(CATALOG_VERSION)
+    max_age = getattr(settings, 'SUGGESTION_REFRESH_SECONDS', 600)
+    if _index is None or _index_version != version or time.monotonic() - _index_built_at > max_age:
+        with _index_lock:
+            if _index is None or _index_version != version or time.monotonic() - _index_built_at > max_age:
+                _index = build_index()
+                _index_version = version
+                _index_built_at = time.monotonic()
+    return _index
+
+
+def suggest(prefix, limit=DEFAULT_LIMIT):
+    return get_index().lookup(prefix, limit)
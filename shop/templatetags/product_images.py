@@ -0,0 +1,26 @@
+from django import template
+
+from shop.images import picture_html
+from shop.models import Product
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_image(image, size='card', alt='', sizes=None, fallback='', loading='lazy', **attrs):
+    """Responsive <picture> for a Product (its primary image) or a ProductImage.
+
+    Resolved from the stored derivative manifest, so listings need neither an
+    images query nor any storage lookups.
+
+    Usage: {% product_image product 'card' alt=product.name class="card-img-top" fallback=placeholder_url %}
+    """
+    if isinstance(image, Product):
+        manifest, original = image.primary_image_derivatives, image.primary_image
+    elif image is not None:
+        manifest, original = image.derivatives, image.image
+    else:
+        manifest, original = None, None
+    return picture_html(manifest, original.url if original else fallback, size=size, alt=alt,
+                        sizes=sizes, loading=loading, **attrs)
@@ -1,3 +1,453 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from billing import rollups
+from billing.benchmarks import build_synthetic_billing
+from cart.models import Cart, CartItem
+from cart.summary import CART_PRICES_VERSION
+from . import facets, images, search_counts, search_engine, versioning
+from .benchmarks import (
+    build_synthetic_catalog, build_synthetic_orders, build_synthetic_reviews, build_synthetic_users,
+    rebuild_rating_stats,
+)
+from .instrumentation import QUERY_BUDGETS, QueryBudgetExceeded
+from .models import Product, ProductImage, Review, SearchQuery, SiteStats
+
+
+def create_users(count):
+    User = get_user_model()
+    return [
+        User.objects.create_user(username=f'reviewer{number}', email=f'reviewer{number}@example.com', password='x')
+        for number in range(count)
+    ]
+
+
+def copy_product(product, slug):
+    """A new product saved through the ORM, so its signals fire"""
+    product.pk = None
+    product.slug = slug
+    product.save()
+    return product
+
+
+class VersioningTests(TestCase):
+    """A process keeps a copy it changed itself only if no other process bumped the version meanwhile"""
+
+    name = versioning.CATALOG_VERSION
+
+    def test_bump_from_the_stored_version_is_kept(self):
+        held = versioning.bump_version(self.name)
+        version = versioning.bump_held_version(self.name, held)
+        self.assertGreater(version, held)
+        self.assertEqual(versioning.bump_held_version(self.name, version), versioning.get_version(self.name))
+
+    def test_bump_after_another_process_is_not_kept(self):
+        held = versioning.bump_version(self.name)
+        # Another worker's bump, which this process has not read yet
+        versioning._version_cache().set(f'{versioning.VERSION_KEY_PREFIX}{self.name}', held + 5, timeout=None)
+        self.assertIsNone(versioning.bump_held_version(self.name, held))
+        self.assertIsNone(versioning.bump_held_version(self.name, None))
+
+
+class FacetIndexTests(TestCase):
+    """The process that changed a product updates its facet index in place rather than rebuilding it"""
+
+    def setUp(self):
+        build_synthetic_catalog(5)
+        self.index = facets.get_index()
+        self.index.rebuild()
+        self.product = Product.objects.order_by('pk').first()
+
+    def test_writer_keeps_its_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.selling_price = Decimal('123.00')
+            self.product.save()
+        self.assertIsNotNone(self.index._version)
+        self.assertEqual(self.index._version, versioning.get_version(facets.FACET_INDEX_VERSION))
+        self.assertEqual(self.index.entries[self.index.slots[self.product.pk]].price, 123.0)
+
+        self.index.refresh_products([])
+        self.assertEqual(self.index._version, versioning.get_version(facets.FACET_INDEX_VERSION))
+
+    def test_index_changed_elsewhere_is_dropped(self):
+        versioning._version_cache().set(f'{versioning.VERSION_KEY_PREFIX}{facets.FACET_INDEX_VERSION}',
+                                        self.index._version + 5, timeout=None)
+        self.index.refresh_products([self.product.pk])
+        self.assertIsNone(self.index._version)
+
+
+class InMemorySearchIndexTests(TestCase):
+    """The process that changed a product updates its Python search index in place rather than rebuilding it"""
+
+    def setUp(self):
+        build_synthetic_catalog(5)
+        self.backend = search_engine.InMemoryBackend()
+        self.backend.rebuild()
+        self.product = Product.objects.select_related('category', 'subcategory').order_by('pk').first()
+
+    def test_writer_keeps_its_index(self):
+        self.product.name = 'Zardozi heirloom lehenga'
+        self.backend.index_products([self.product])
+        self.assertIsNotNone(self.backend._version)
+        self.assertEqual(self.backend._version, versioning.get_version(search_engine.SEARCH_INDEX_VERSION))
+        self.assertEqual(self.backend.search(['zardozi']), [self.product.pk])
+
+        self.backend.remove_products([self.product.pk])
+        self.assertEqual(self.backend._version, versioning.get_version(search_engine.SEARCH_INDEX_VERSION))
+        self.assertEqual(self.backend.search(['zardozi']), [])
+
+
+class SiteStatsTests(TestCase):
+    """SiteStats.apply_delta keeps the stored counters equal to a fresh count"""
+
+    def setUp(self):
+        build_synthetic_catalog(6)
+        self.users = create_users(3)
+        self.products = list(Product.objects.order_by('pk'))
+        SiteStats.rebuild()
+
+    def assertStatsFresh(self):
+        stats = SiteStats.objects.get(pk=SiteStats.SINGLETON_ID)
+        approved = Review.objects.filter(is_approved=True).aggregate(count=Count('id'), total=Sum('rating'))
+        self.assertEqual(stats.total_products, Product.objects.filter(is_active=True).count())
+        self.assertEqual(stats.total_reviews, approved['count'])
+        self.assertEqual(stats.rating_total, approved['total'] or 0)
+
+    def test_product_changes(self):
+        product = self.products[0]
+        product.is_active = False
+        product.save()
+        self.assertStatsFresh()
+        product.name = 'Renamed while inactive'
+        product.save()
+        self.assertStatsFresh()
+        product.is_active = True
+        product.save(update_fields=['is_active'])
+        self.assertStatsFresh()
+
+        copy_product(Product.objects.get(pk=self.products[1].pk), 'copied-product')
+        self.assertStatsFresh()
+        self.products[2].delete()
+        self.assertStatsFresh()
+        inactive = self.products[3]
+        inactive.is_active = False
+        inactive.save()
+        inactive.delete()
+        self.assertStatsFresh()
+
+    def test_review_changes(self):
+        first, second = self.products[:2]
+        review = Review.objects.create(product=first, user=self.users[0], rating=4, title='Nice', comment='Soft')
+        self.assertStatsFresh()
+        review.is_approved = True
+        review.save()
+        self.assertStatsFresh()
+        Review.objects.create(product=first, user=self.users[1], rating=2, title='Thin', comment='Thin',
+                              is_approved=True)
+        self.assertStatsFresh()
+
+        review.rating = 5
+        review.save()
+        self.assertStatsFresh()
+        review.product = second
+        review.save()
+        self.assertStatsFresh()
+        review.is_approved = False
+        review.save()
+        self.assertStatsFresh()
+        review.delete()
+        self.assertStatsFresh()
+        Review.objects.get(user=self.users[1]).delete()
+        self.assertStatsFresh()
+
+        # Deleting a product deletes its reviews too
+        Review.objects.create(product=second, user=self.users[2], rating=3, title='Fine', comment='Fine',
+                              is_approved=True)
+        second.delete()
+        self.assertStatsFresh()
+
+
+class RatingStatsTests(TestCase):
+    """Product.update_rating_stats keeps each product's rating aggregates equal to its approved reviews"""
+
+    def setUp(self):
+        build_synthetic_catalog(3)
+        self.users = create_users(4)
+        self.first, self.second = Product.objects.order_by('pk')[:2]
+
+    def review(self, user, rating, product=None, is_approved=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Review.objects.create(product=product or self.first, user=user, rating=rating, title='Review',
+                                         comment='Review', is_approved=is_approved)
+
+    def change(self, review, **values):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in values.items():
+                setattr(review, name, value)
+            review.save()
+
+    def assertRatingsFresh(self):
+        for product in Product.objects.all():
+            ratings = list(product.reviews.filter(is_approved=True).values_list('rating', flat=True))
+            histogram = [ratings.count(stars) for stars in range(1, 6)]
+            average = Decimal(sum(ratings)) / len(ratings) if ratings else Decimal('0')
+            self.assertEqual(product.rating_histogram or [0] * 5, histogram, product)
+            self.assertEqual(product.rating_count, len(ratings), product)
+            self.assertEqual(product.rating_avg, average.quantize(Decimal('0.01')), product)
+
+    def test_review_changes(self):
+        first = self.review(self.users[0], 5)
+        self.assertRatingsFresh()
+        pending = self.review(self.users[1], 1, is_approved=False)
+        self.assertRatingsFresh()
+        self.review(self.users[2], 4)
+        self.review(self.users[3], 4, product=self.second)
+        self.assertRatingsFresh()
+
+        self.change(pending, is_approved=True)
+        self.assertRatingsFresh()
+        self.change(first, rating=2)
+        self.assertRatingsFresh()
+        self.change(first, product=self.second)
+        self.assertRatingsFresh()
+        self.change(pending, is_approved=False)
+        self.assertRatingsFresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertRatingsFresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(product=self.second).delete()
+        self.assertRatingsFresh()
+
+    def test_rolled_back_review_changes_nothing(self):
+        self.review(self.users[0], 5)
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            Review.objects.create(product=self.first, user=self.users[1], rating=1, title='Review',
+                                  comment='Review', is_approved=True)
+            1 / 0
+        self.assertRatingsFresh()
+
+
+class PrimaryImageTests(TestCase):
+    """Product.update_primary_images keeps each product's primary image equal to its gallery's first"""
+
+    def setUp(self):
+        build_synthetic_catalog(2)
+        self.first, self.second = Product.objects.order_by('pk')
+
+    def image(self, name, product=None, **values):
+        return ProductImage.objects.create(product=product or self.first, image=f'products/{name}.jpg',
+                                           alt_text=name, **values)
+
+    def assertPrimaryFresh(self):
+        for product in Product.objects.all():
+            image = product.images.order_by('-is_primary', 'sort_order', 'pk').first()
+            expected = image.image.name if image else ''
+            manifest = image.derivatives if image and image.derivatives.get('source') == expected else {}
+            self.assertEqual(product.primary_image.name, expected, product)
+            self.assertEqual(product.primary_image_derivatives, manifest, product)
+
+    def test_gallery_changes(self):
+        self.assertPrimaryFresh()
+        later = self.image('later', sort_order=2)
+        self.assertPrimaryFresh()
+        earlier = self.image('earlier', sort_order=1)
+        self.assertPrimaryFresh()
+        flagged = self.image('flagged', sort_order=5, is_primary=True)
+        self.assertPrimaryFresh()
+
+        flagged.derivatives = {'source': 'products/flagged.jpg', 'card': {'webp': 'derivatives/ab/abc.webp'}}
+        flagged.save()
+        self.assertPrimaryFresh()
+        # A manifest of a replaced file is not copied
+        flagged.image = 'products/replaced.jpg'
+        flagged.save()
+        self.assertPrimaryFresh()
+
+        flagged.product = self.second
+        flagged.save()
+        self.assertPrimaryFresh()
+        earlier.sort_order = 3
+        earlier.save()
+        self.assertPrimaryFresh()
+        later.delete()
+        self.assertPrimaryFresh()
+        earlier.delete()
+        self.assertPrimaryFresh()
+        ProductImage.objects.filter(product=self.second).delete()
+        self.assertPrimaryFresh()
+
+
+def image_upload(name, color, size=(640, 480)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageDerivativeTests(TestCase):
+    """Saving an image only marks it pending; generate_image_derivatives renders it through the storage"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        build_synthetic_catalog(1)
+        self.product = Product.objects.get()
+
+    def upload(self, color):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProductImage.objects.create(product=self.product, image=image_upload('photo.png', color))
+
+    def assertRendered(self, product_image):
+        product_image.refresh_from_db()
+        with product_image.image.open('rb') as handle:
+            digest = images.content_hash(handle.read())
+        self.assertEqual(product_image.content_hash, digest)
+        self.assertEqual(product_image.derivatives['source'], product_image.image.name)
+        self.assertTrue(default_storage.exists(f'derivatives/{digest[:2]}/{digest}/manifest.json'))
+        for entry in product_image.derivatives['sizes'].values():
+            self.assertTrue(default_storage.exists(entry['jpeg']))
+        self.assertEqual(product_image.derivatives['sizes']['zoom']['width'], 640)
+
+    def test_saved_images_are_pending_until_generated(self):
+        product_image = self.upload('red')
+        self.assertEqual(list(images.pending_images()), [product_image])
+        call_command('generate_image_derivatives', workers=1, stdout=io.StringIO())
+        self.assertRendered(product_image)
+        self.assertFalse(images.pending_images().exists())
+
+        product_image.image = image_upload('replaced.png', 'blue')
+        product_image.save(update_fields=['image'])
+        self.assertEqual(list(images.pending_images()), [product_image])
+        call_command('generate_image_derivatives', workers=1, stdout=io.StringIO())
+        self.assertRendered(product_image)
+
+    def test_unreadable_originals_are_reported(self):
+        product_image = self.upload('red')
+        default_storage.delete(product_image.image.name)
+        output = io.StringIO()
+        call_command('generate_image_derivatives', workers=1, stdout=output)
+        self.assertIn(f'Image {product_image.pk}', output.getvalue())
+        self.assertTrue(images.pending_images().exists())
+
+    @override_settings(IMAGE_DERIVATIVES_MODE='sync')
+    def test_sync_mode_renders_after_commit(self):
+        self.assertRendered(self.upload('green'))
+
+
+@override_settings(SEARCH_COUNT_BATCH=3, SEARCH_COUNT_INTERVAL=3600)
+class SearchCountTests(TestCase):
+    """Searches are counted in batches, leaving out crawlers and very short queries"""
+
+    browser = 'Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36'
+
+    def setUp(self):
+        build_synthetic_catalog(20)
+        search_engine.rebuild_index()
+        search_counts.flush()
+        self.query = Product.objects.first().name.split()[0]
+
+    def search(self, query, user_agent=browser):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('shop:search'), {'q': query}, HTTP_USER_AGENT=user_agent)
+        self.assertEqual(response.status_code, 200)
+
+    def test_searches_are_written_in_batches(self):
+        self.search(self.query)
+        self.search(self.query.upper())
+        self.assertFalse(SearchQuery.objects.exists())
+        self.search(f'  {self.query} ')
+        self.assertEqual(SearchQuery.objects.get().search_count, 3)
+        self.assertEqual(SearchQuery.objects.get().query, self.query.lower())
+
+    def test_crawlers_and_short_queries_are_not_counted(self):
+        for user_agent in ('Googlebot/2.1 (+http://www.google.com/bot.html)', 'curl/8.5.0', ''):
+            self.search(self.query, user_agent)
+        self.search(self.query[:2])
+        self.assertEqual(search_counts.flush(), 0)
+        self.assertFalse(SearchQuery.objects.exists())
+
+
+BUDGET_VERSIONS = (
+    versioning.CATALOG_VERSION, versioning.NAVIGATION_VERSION, facets.FACET_INDEX_VERSION,
+    search_engine.SEARCH_INDEX_VERSION, CART_PRICES_VERSION,
+)
+
+
+@override_settings(REQUEST_QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTests(TestCase):
+    """The hot views stay within instrumentation.QUERY_BUDGETS; a request over budget raises"""
+
+    @classmethod
+    def setUpTestData(cls):
+        build_synthetic_catalog(200, variants_per_product=3)
+        user_ids = build_synthetic_users(50)
+        build_synthetic_reviews(1000, user_ids)
+        build_synthetic_orders(300, user_ids)
+        build_synthetic_billing(500, customers=40)
+        rebuild_rating_stats()
+        SiteStats.rebuild()
+        search_engine.rebuild_index()
+        rollups.rebuild()
+
+        User = get_user_model()
+        cls.shopper = User.objects.create_user(username='shopper', email='shopper@example.com', password='x')
+        cart = Cart.objects.create(user=cls.shopper)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1)
+            for product in Product.objects.filter(is_active=True).order_by('pk')[:5]
+        ])
+        cls.staff = User.objects.create_superuser(username='staff', email='staff@example.com', password='x')
+        cls.most_reviewed = Product.objects.order_by('-rating_count', 'pk').first()
+
+    def setUp(self):
+        # Every test starts as a new worker process of a deployed site would: the cache versions
+        # are stored, the process has none of them and its caches are cold
+        for name in BUDGET_VERSIONS:
+            versioning.bump_version(name)
+        versioning._local_versions.clear()
+
+    def assertWithinBudget(self, view_name, url, user=None):
+        if user:
+            self.client.force_login(user)
+        # The first request may find the per-process caches cold
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+        self.assertIn(view_name, QUERY_BUDGETS)
+
+    def test_homepage(self):
+        self.assertWithinBudget('shop:homepage', reverse('shop:homepage'))
+
+    def test_shop(self):
+        url = reverse('shop:shop')
+        self.assertWithinBudget('shop:shop', url)
+        self.assertWithinBudget('shop:shop', f'{url}?fabric=cotton&size=M&sort=price_low&page=2')
+
+    def test_product_detail(self):
+        self.assertWithinBudget('shop:product_detail', reverse('shop:product_detail', args=[self.most_reviewed.slug]))
+
+    def test_cart_detail(self):
+        self.assertWithinBudget('cart:cart_detail', reverse('cart:cart_detail'), self.shopper)
+
+    def test_billing_dashboard(self):
+        self.assertWithinBudget('billing:advanced_dashboard', reverse('billing:advanced_dashboard'), self.staff)
+
+    @override_settings(REQUEST_QUERY_BUDGETS={'shop:homepage': 1})
+    def test_request_over_budget_fails(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('shop:homepage'))
@@ -17,6 +17,7 @@ urlpatterns = [
     
     # Search
     path('search/', views.search, name='search'),
+    path('ajax/search-suggestions/', views.search_suggestions, name='search_suggestions'),
     
     # About and Contact
     path('about/', views.about, name='about'),
@@ -29,4 +30,7 @@ urlpatterns = [
     
     path('ajax/product-quick-view/', views.product_quick_view, name='product_quick_view'),
     path('ajax/whatsapp-subscribe/', views.whatsapp_subscribe, name='whatsapp_subscribe'),
+    
+    # Instrumentation (staff only)
+    path('metrics/requests.json', views.request_metrics, name='request_metrics'),
 ]
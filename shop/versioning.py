@@ -0,0 +1,109 @@
+"""
+Version numbers of the process-local catalog caches.
+
+Every worker process keeps its own copy of the navigation, facet index,
+search index and listing caches, keyed by a version number. Bumping the
+version invalidates all copies, so the version itself has to live somewhere
+every worker reads: the 'versions' cache (settings.CACHES), a database table
+or Redis, rather than process memory. Each process remembers a version for
+CACHE_VERSION_TTL seconds (default 1) and then re-reads all versions (see
+register()) in one round trip, so versions cost a cache query per second
+rather than several per request; another worker's bump is seen within that
+time, a bump in this process at once.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+VERSION_KEY_PREFIX = 'shop:version:'
+
+VERSION_CACHE = 'versions'
+
+# Names of the versions declared with register()
+_names = set()
+
+# name -> (version, monotonic time it expires)
+_local_versions = {}
+
+
+def register(name):
+    """Declare a version name; a process reads all declared versions in one round trip"""
+    _names.add(name)
+    return name
+
+
+# Version keys for the process-local catalog caches
+NAVIGATION_VERSION = register('navigation')
+CATALOG_VERSION = register('catalog')
+
+
+def _version_cache():
+    return caches[VERSION_CACHE if VERSION_CACHE in settings.CACHES else 'default']
+
+
+def _initial_version():
+    # Time based so a counter re-seeded after eviction never repeats an old value
+    return int(time.time() * 1000)
+
+
+def _remember(name, version):
+    _local_versions[name] = (version, time.monotonic() + getattr(settings, 'CACHE_VERSION_TTL', 1.0))
+    return version
+
+
+def get_version(name):
+    """Return the current version number for a cached structure"""
+    remembered = _local_versions.get(name)
+    if remembered and remembered[1] > time.monotonic():
+        return remembered[0]
+    cache = _version_cache()
+    # Every version is re-read in the same round trip
+    names = _names | set(_local_versions) | {name}
+    stored = cache.get_many([f'{VERSION_KEY_PREFIX}{each}' for each in names])
+    for each in names:
+        version = stored.get(f'{VERSION_KEY_PREFIX}{each}')
+        if version is not None:
+            _remember(each, version)
+    if f'{VERSION_KEY_PREFIX}{name}' in stored:
+        return _local_versions[name][0]
+
+    key = f'{VERSION_KEY_PREFIX}{name}'
+    # add() keeps the value of a concurrent seed or bump intact
+    version = _initial_version()
+    if not cache.add(key, version, timeout=None):
+        version = cache.get(key)
+        if version is None:
+            # Non-persistent cache backend: treat every read as a new version
+            version = _initial_version()
+    return _remember(name, version)
+
+
+def _bump(name):
+    """Store a new version; returns (new version, the version it replaced)"""
+    cache = _version_cache()
+    key = f'{VERSION_KEY_PREFIX}{name}'
+    # Not incr(): the database backend's is a read and a write, so two concurrent bumps could
+    # both write the same number. A millisecond timestamp differs unless they share the millisecond.
+    previous = cache.get(key)
+    version = max(_initial_version(), (previous or 0) + 1)
+    cache.set(key, version, timeout=None)
+    return _remember(name, version), previous
+
+
+def bump_version(name):
+    """Invalidate every cached copy of a structure by bumping its version"""
+    return _bump(name)[0]
+
+
+def bump_held_version(name, held):
+    """Bump a version after applying the change to this process's copy, which was at version `held`.
+
+    Returns the new version if the stored version was still `held`, so the copy
+    is up to date and can be kept; None if another process had bumped it since,
+    so the copy is missing that change. Bumps racing between the read and the
+    write of _bump() are not told apart, as in bump_version.
+    """
+    version, previous = _bump(name)
+    return version if held is not None and previous == held else None
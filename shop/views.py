@@ -1,8 +1,8 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Avg, Count
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
@@ -14,6 +14,12 @@ from .models import (
     Review, Wishlist, RecentlyViewed, WhatsAppSubscription
 )
 from .forms import ContactForm, ReviewForm, WhatsAppSubscriptionForm
+from .search_engine import search_products
+from .facets import PRICE_BUCKETS
+from .listing import ProductListing
+from .pagination import paginate
+from .suggestions import suggest, DEFAULT_LIMIT as SUGGESTION_LIMIT
+from . import instrumentation, search_counts
 
 
 def homepage(request):
@@ -71,100 +77,25 @@ def homepage(request):
 
 def shop(request):
     """All products view with filters"""
-    products = Product.objects.filter(is_active=True).select_related(
-        'category', 'subcategory'
-    ).prefetch_related('images')
-    
-    # Filter by category
-    category_slug = request.GET.get('category')
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
-    
-    # Filter by subcategory
-    subcategory_slug = request.GET.get('subcategory')
-    if subcategory_slug:
-        products = products.filter(subcategory__slug=subcategory_slug)
-    
-    # Filter by price range
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(selling_price__gte=min_price)
-    if max_price:
-        products = products.filter(selling_price__lte=max_price)
-    
-    # Filter by fabric (multiple selection)
-    fabric_filters = request.GET.getlist('fabric')
-    if fabric_filters:
-        products = products.filter(fabric__in=fabric_filters)
-    
-    # Filter by occasion (multiple selection)
-    occasion_filters = request.GET.getlist('occasion')
-    if occasion_filters:
-        products = products.filter(occasion__in=occasion_filters)
-    
-    # Filter by size
-    size = request.GET.get('size')
-    if size:
-        products = products.filter(variants__size=size, variants__is_active=True)
-    
-    # Filter by color
-    color = request.GET.get('color')
-    if color:
-        products = products.filter(variants__color__icontains=color, variants__is_active=True)
-    
-    # Special filters
-    if request.GET.get('sale') == 'true':
-        products = products.filter(discount_percentage__gt=0)
-    
-    if request.GET.get('new') == 'true':
-        from datetime import datetime, timedelta
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        products = products.filter(created_at__gte=thirty_days_ago)
-    
-    if request.GET.get('bestseller') == 'true':
-        products = products.filter(is_bestseller=True)
-    
-    if request.GET.get('trending') == 'true':
-        products = products.filter(is_featured=True)
-    
-    # Search
-    search_query = request.GET.get('q')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(short_description__icontains=search_query)
-        )
-    
-    # Sorting
-    sort_by = request.GET.get('sort', 'featured')
-    if sort_by == 'price_low':
-        products = products.order_by('selling_price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-selling_price')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    elif sort_by == 'rating':
-        products = products.annotate(
-            avg_rating=Avg('reviews__rating')
-        ).order_by('-avg_rating')
-    elif sort_by == 'popularity':
-        products = products.order_by('-is_bestseller', '-is_featured', '-created_at')
-    else:  # featured
-        products = products.order_by('-is_featured', '-created_at')
+    listing = ProductListing.from_request(request)
     
     # Pagination
     from django.conf import settings
     products_per_page = getattr(settings, 'PRODUCTS_PER_PAGE', 12)
-    paginator = Paginator(products, products_per_page)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = listing.page(request, products_per_page)
     
-    # Get filter options
-    categories = Category.objects.filter(is_active=True)
-    fabric_choices = Product.FABRIC_CHOICES
-    occasion_choices = Product.OCCASION_CHOICES
+    # Get filter options with live counts (None when the listing comes from the database)
+    counts = listing.counts
+    def count(facet, value):
+        return counts[facet].get(value, 0) if counts is not None else None
+    
+    categories = list(Category.objects.filter(is_active=True))
+    for category in categories:
+        category.facet_count = count('category', category.slug)
+    fabric_choices = [(value, label, count('fabric', value)) for value, label in Product.FABRIC_CHOICES]
+    occasion_choices = [(value, label, count('occasion', value)) for value, label in Product.OCCASION_CHOICES]
+    size_choices = [(value, count('size', value)) for value, label in ProductVariant.SIZE_CHOICES]
+    price_choices = [(key, label, count('price', key)) for key, label, low, high in PRICE_BUCKETS]
     
     context = {
         'page_obj': page_obj,
@@ -172,6 +103,9 @@ def shop(request):
         'categories': categories,
         'fabric_choices': fabric_choices,
         'occasion_choices': occasion_choices,
+        'size_choices': size_choices,
+        'price_choices': price_choices,
+        'facet_counts': counts,
         'current_filters': request.GET,
         'page_title': 'Shop Women\'s Wear Online - Premium Dupattas, Leggings & Pants in Lucknow | King Dupatta House',
         'meta_description': 'Shop premium women\'s wear online at King Dupatta House. Complete collection of dupattas, leggings, and pants in Lucknow. Free shipping above ₹999. Best dupatta house near me.',
@@ -185,18 +119,9 @@ def category_view(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug, is_active=True)
     subcategories = category.subcategories.filter(is_active=True)
     
-    products = Product.objects.filter(
-        category=category, 
-        is_active=True
-    ).select_related('subcategory').prefetch_related('images')
-    
-    # Apply filters (similar to shop view)
-    # ... (filter logic same as shop view)
-    
-    # Pagination
-    paginator = Paginator(products, settings.PRODUCTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Filters, sorting and pagination shared with the shop view
+    listing = ProductListing.from_request(request, category=category).plan(select_related=('subcategory',))
+    page_obj = listing.page(request, settings.PRODUCTS_PER_PAGE)
     
     context = {
         'category': category,
@@ -220,15 +145,9 @@ def subcategory_view(request, category_slug, subcategory_slug):
         is_active=True
     )
     
-    products = Product.objects.filter(
-        subcategory=subcategory, 
-        is_active=True
-    ).prefetch_related('images')
-    
-    # Apply filters and pagination (similar to category view)
-    paginator = Paginator(products, settings.PRODUCTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Filters, sorting and pagination shared with the shop view
+    listing = ProductListing.from_request(request, category=category, subcategory=subcategory).plan()
+    page_obj = listing.page(request, settings.PRODUCTS_PER_PAGE)
     
     context = {
         'category': category,
@@ -268,7 +187,7 @@ def product_detail(request, product_slug):
     related_products = Product.objects.filter(
         subcategory=product.subcategory,
         is_active=True
-    ).exclude(id=product.id).prefetch_related('images')[:4]
+    ).exclude(id=product.id)[:4]
     
     # Check if in wishlist
     in_wishlist = False
@@ -294,21 +213,19 @@ def product_detail(request, product_slug):
 def search(request):
     """Search view"""
     query = request.GET.get('q', '')
-    products = Product.objects.none()
-    
-    if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(short_description__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(subcategory__name__icontains=query),
-            is_active=True
-        ).select_related('category', 'subcategory').prefetch_related('images')
     
-    paginator = Paginator(products, settings.PRODUCTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Rank with the search index, then load only the current page's products
+    product_ids = search_products(query) if query else []
+    page_obj = paginate(request, product_ids, settings.PRODUCTS_PER_PAGE)
+    
+    products_by_id = Product.objects.filter(
+        id__in=page_obj.object_list, is_active=True
+    ).select_related('category', 'subcategory').in_bulk()
+    page_obj.object_list = [products_by_id[pk] for pk in page_obj.object_list if pk in products_by_id]
+    
+    # Count first-page searches that found something; popular ones feed the suggestions
+    if product_ids and not page_obj.has_previous():
+        search_counts.count_search(request, query)
     
     context = {
         'query': query,
@@ -462,6 +379,25 @@ def product_quick_view(request):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+def search_suggestions(request):
+    """Search-as-you-type suggestions via AJAX"""
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', SUGGESTION_LIMIT)), 20))
+    except ValueError:
+        limit = SUGGESTION_LIMIT
+    
+    suggestions = suggest(query, limit) if query.strip() else ()
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'suggestions': [
+            {'label': suggestion.label, 'type': suggestion.kind, 'url': suggestion.url}
+            for suggestion in suggestions
+        ]
+    })
+
+
 @require_POST
 def whatsapp_subscribe(request):
     """Handle WhatsApp subscription for Indian customers"""
@@ -504,3 +440,11 @@ def whatsapp_subscribe(request):
         })
 
 
+@staff_member_required
+def request_metrics(request):
+    """Per-view latency and query percentiles of the requests this process served (JSON)"""
+    data = instrumentation.summary(view=request.GET.get('view') or None)
+    recent = request.GET.get('recent')
+    if recent and recent.isdigit():
+        data['recent'] = instrumentation.records(limit=min(int(recent), 500))
+    return JsonResponse(data)
@@ -22,6 +22,7 @@ function initializeApp() {
     initializeWishlistFeatures();
     initializeScrollToTop();
     initializeNotifications();
+    initializeSearchSuggestions();
     console.log('🛍️ Beautiful design loaded!');
 }
 
@@ -408,6 +409,37 @@ if (!window.whatsappHandlerAdded) {
     });
 }
 
+// Search-as-you-type suggestions
+function initializeSearchSuggestions() {
+    const input = document.querySelector('input[data-suggest-url]');
+    const datalist = input ? document.getElementById(input.getAttribute('list')) : null;
+    if (!input || !datalist) return;
+    
+    let timer = null;
+    let lastQuery = '';
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (query.length < 2 || query === lastQuery) return;
+        
+        timer = setTimeout(() => {
+            lastQuery = query;
+            fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success || input.value.trim() !== query) return;
+                    datalist.innerHTML = '';
+                    data.suggestions.forEach(suggestion => {
+                        const option = document.createElement('option');
+                        option.value = suggestion.label;
+                        datalist.appendChild(option);
+                    });
+                })
+                .catch(() => {});
+        }, 150);
+    });
+}
+
 // Smooth scrolling for anchor links - with duplicate prevention
 if (!window.smoothScrollHandlerAdded) {
     window.smoothScrollHandlerAdded = true;
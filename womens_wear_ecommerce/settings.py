@@ -65,6 +65,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
+    'shop.instrumentation.RequestMetricsMiddleware',  # Query count and latency per view
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,7 +78,7 @@ ROOT_URLCONF = 'womens_wear_ecommerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'shop.instrumentation.InstrumentedTemplates',  # DjangoTemplates with render timings
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -105,10 +106,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Writers wait for the write lock instead of failing with "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # A file rather than shared-cache memory, so the concurrency tests' threads can wait for each other
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# 'default' holds the bulky per-process catalog caches. 'versions' holds their version
+# counters (shop/versioning.py), which every gunicorn worker must share so that an
+# invalidation reaches all of them: a database table (created by migrate), or Redis
+# when REDIS_URL is set (pip install redis).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'king-dupatta-house',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'shop_cache_versions',
+    },
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['versions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Seconds a worker keeps using a version before reading it again
+CACHE_VERSION_TTL = 1.0
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 